@@ -0,0 +1,20 @@
+# by Richi Rod AKA @richionline / falken20
+#
+# Build the fingerprinted static assets into static/dist (see src/assets.py).
+# Needs Pillow (pip install -r requirements-build.txt). Run it from the
+# repository root before deploying:
+#
+#   python -m scripts.build_assets
+
+import os
+
+from src.assets import build_assets
+from src.logger import Log, pipeline
+
+STATIC_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "static")
+
+
+if __name__ == "__main__":
+    manifest = build_assets(STATIC_FOLDER)
+    Log.info(f"{len(manifest['files'])} files and {len(manifest['images'])} images written to static/dist")
+    pipeline.flush()
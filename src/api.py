@@ -1,17 +1,24 @@
 # by Richi Rod AKA @richionline / falken20
 #
 # REST API endpoints. Add new routes here as the API grows.
+# Data endpoints read the poller snapshot (or the cached upstream calls while
+# it warms up) and return a small JSON model; ?fields=a,b selects its keys.
 
 import sys
 import os
 import hmac
-from datetime import datetime
+import re
+from datetime import datetime, timezone
+from functools import wraps
 
 from flask import Blueprint, jsonify, request
 
 from src.logger import Log
-from src.weather import get_api_data
-from src.config import URL_WEATHER_ECOWITT_CURRENT
+from src.clients import ecowitt, wunderground
+from src.poller import poller
+from src.summary import SUMMARY_SPECS
+from src.sun import format_sun_times, get_sun_times
+from src.weather import get_summary_data, local_today
 
 
 api_bp = Blueprint("api", __name__, url_prefix="/api")
@@ -44,16 +51,24 @@ def _is_authorized() -> bool:
     return hmac.compare_digest(provided, API_ACCESS_KEY)
 
 
+def require_api_key(view):
+    """Answer 401 unless the request has a valid X-API-Key (see _is_authorized)"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not _is_authorized():
+            return jsonify({"error": "Unauthorized"}), 401
+        return view(*args, **kwargs)
+    return wrapper
+
+
 @api_bp.route("/rain-today")
+@require_api_key
 def rain_today():
     """Return whether it has rained today based on EcoWitt daily rainfall.
 
     Caches the result for the current day to avoid repeated API calls.
     """
     try:
-        if not _is_authorized():
-            return jsonify({"error": "Unauthorized"}), 401
-
         today = datetime.today().strftime('%Y%m%d')
 
         # Check if we have a cached result for today
@@ -62,7 +77,11 @@ def rain_today():
             return jsonify({"rained_today": _rain_cache["rained_today"]}), 200
 
         Log.info("Getting rain status for today...")
-        weather_data = get_api_data(URL_WEATHER_ECOWITT_CURRENT)
+        snapshot = poller.snapshot
+        if snapshot.has("weather_data"):
+            weather_data = snapshot.data["weather_data"]
+        else:
+            weather_data = ecowitt.real_time()
         rainfall_daily = float(weather_data["data"]["rainfall"]["daily"]["value"])
         rained_today = rainfall_daily > 0
 
@@ -80,3 +99,150 @@ def rain_today():
     except Exception as e:
         Log.error(f"Exception in rain today endpoint: {e}", err=e, sys=sys)
         return jsonify({"error": "Website under maintenance"}), 500
+
+
+# Source name in the poller snapshot -> fetch used while it is not published
+_SOURCES = {
+    "weather_data": ecowitt.real_time,
+    "weather_day": wunderground.daily,
+    "summary": lambda: get_summary_data(ecowitt),
+}
+_SUMMARY_PERIODS = ("month", "year")
+# /api/sun accepts dates from this many years before to this many after today
+_SUN_YEARS_AROUND = 1
+# Rain counters of the EcoWitt real time data: model key -> key in "rainfall"
+_RAIN_PERIODS = {"hour": "1_hour", "daily": "daily", "monthly": "monthly", "yearly": "yearly"}
+
+
+def _source(name: str):
+    """Data of a source and the time it was published (None if it was fetched live)"""
+    snapshot = poller.snapshot
+    if snapshot.has(name):
+        return snapshot.data[name], snapshot.updated[name]
+    return _SOURCES[name](), None
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _reading(data: dict, path: tuple) -> dict:
+    """{"value", "unit"} of a metric of the EcoWitt real time data"""
+    for key in path:
+        data = data.get(key, {}) if isinstance(data, dict) else {}
+    return {"value": _number(data.get("value")), "unit": data.get("unit")}
+
+
+def _iso(epoch: float) -> str:
+    return datetime.fromtimestamp(epoch, timezone.utc).isoformat() if epoch is not None else None
+
+
+def current_model(weather_data: dict, weather_day: dict, updated: float = None) -> dict:
+    """Current conditions: every SUMMARY_SPECS metric from EcoWitt and today's WU min/max.
+
+    Args:
+        weather_data (dict): EcoWitt real time response
+        weather_day (dict): Weather Underground daily response
+        updated (float): Epoch of the EcoWitt data, None if unknown
+    """
+    data = weather_data.get("data", {})
+    model = {name: _reading(data, spec.path) for name, spec in SUMMARY_SPECS.items() if name != "rainfall"}
+    model["rainfall"] = {period: _reading(data, ("rainfall", key)) for period, key in _RAIN_PERIODS.items()}
+
+    observations = (weather_day or {}).get("observations") or [{}]
+    day = observations[0]
+    metric = day.get("metric", {})
+    # Same shape as the month / year summaries
+    model["today"] = {
+        "temperature": {"min": _number(metric.get("tempLow")), "max": _number(metric.get("tempHigh"))},
+        "humidity": {"min": _number(day.get("humidityLow")), "max": _number(day.get("humidityHigh"))},
+        "pressure": {"min": _number(metric.get("pressureMin")), "max": _number(metric.get("pressureMax"))},
+        "wind": {"max": _number(metric.get("windspeedHigh"))},
+        "uvi": {"max": _number(day.get("uvHigh"))},
+    }
+    model["updated"] = _iso(updated)
+    return model
+
+
+def select_fields(model: dict, fields: str) -> dict:
+    """Keep only the comma separated top level keys of fields (all of them if it is empty)
+
+    Raises:
+        ValueError: If a field is not a key of the model.
+    """
+    if not fields:
+        return model
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in names if name not in model]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}. Available: {', '.join(model)}")
+    return {name: model[name] for name in names}
+
+
+def _data_response(build):
+    """Build the model, apply ?fields= and turn errors into JSON responses"""
+    try:
+        model = build()
+        if model is None:
+            return jsonify({"error": "Data not available"}), 503
+        return jsonify(select_fields(model, request.args.get("fields", ""))), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        Log.error(f"Exception in {request.path} endpoint: {e}", err=e, sys=sys)
+        return jsonify({"error": "Website under maintenance"}), 500
+
+
+@api_bp.route("/current")
+@require_api_key
+def current():
+    """Current conditions of the station"""
+    def build():
+        weather_data, updated = _source("weather_data")
+        if not weather_data:
+            return None
+        weather_day, _ = _source("weather_day")
+        return current_model(weather_data, weather_day, updated)
+    return _data_response(build)
+
+
+@api_bp.route("/summary/<period>")
+@require_api_key
+def summary(period: str):
+    """Min/max (and rain) summary of the current month or year"""
+    if period not in _SUMMARY_PERIODS:
+        return jsonify({"error": f"Unknown period, use one of: {', '.join(_SUMMARY_PERIODS)}"}), 404
+
+    def build():
+        summaries, updated = _source("summary")
+        if not summaries:
+            return None
+        return dict(summaries[_SUMMARY_PERIODS.index(period)], updated=_iso(updated))
+    return _data_response(build)
+
+
+@api_bp.route("/sun")
+@require_api_key
+def sun():
+    """Sunrise, sunset and twilights of today or of ?date=YYYYMMDD, computed locally.
+
+    Only dates from last year to next year are accepted, every other year
+    would cost a new year table.
+    """
+    def build():
+        today = local_today()
+        day = request.args.get("date", "") or today
+        try:
+            # strptime also accepts unpadded dates such as 2026111
+            if not re.fullmatch(r"\d{8}", day):
+                raise ValueError
+            datetime.strptime(day, "%Y%m%d")
+        except ValueError:
+            raise ValueError("date must be YYYYMMDD") from None
+        if abs(int(day[:4]) - int(today[:4])) > _SUN_YEARS_AROUND:
+            raise ValueError(f"date must be within {_SUN_YEARS_AROUND} year of today")
+        return format_sun_times(get_sun_times(day))
+    return _data_response(build)
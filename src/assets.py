@@ -0,0 +1,240 @@
+# by Richi Rod AKA @richionline / falken20
+#
+# Fingerprinted static assets. build_assets() (run by scripts/build_assets.py,
+# needs Pillow) writes optimized copies of static/ into static/dist with the
+# content hash in the file name, WebP/AVIF and resized variants of the images
+# and a manifest. At runtime url_for('static') resolves the file names through
+# the manifest, so the files can be cached by browsers forever.
+
+import json
+import os
+import re
+import shutil
+import sys
+from hashlib import sha256
+from io import BytesIO
+
+from flask import request
+
+from src.logger import Log
+
+DIST_DIR = "dist"  # Inside the static folder
+MANIFEST_NAME = "manifest.json"
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+IMAGE_EXTENSIONS = {".jpg": "JPEG", ".jpeg": "JPEG", ".png": "PNG"}
+# Widths of the resized variants (never upscaled) and the one url_for() returns
+IMAGE_WIDTHS = (640, 1280, 1920)
+DEFAULT_WIDTH = 1920
+# Viewports up to max-width CSS pixels get the smaller background: (max-width, image width)
+CSS_BREAKPOINTS = ((800, 1280),)
+# Modern formats first, the browser takes the first one it supports
+IMAGE_FORMATS = ("AVIF", "WEBP")
+MIME_TYPES = {"AVIF": "image/avif", "WEBP": "image/webp", "JPEG": "image/jpeg", "PNG": "image/png"}
+SAVE_OPTIONS = {
+    "AVIF": dict(quality=60),
+    "WEBP": dict(quality=80, method=6),
+    "JPEG": dict(quality=82, optimize=True, progressive=True),
+    "PNG": dict(optimize=True),
+}
+EXTENSIONS = {"AVIF": ".avif", "WEBP": ".webp", "JPEG": ".jpg", "PNG": ".png"}
+
+_CSS_URL = re.compile(r"""url\(\s*(['"]?)/static/([^'")\s]+)\1\s*\)""")
+_CSS_COMMENT = re.compile(r"/\*.*?\*/", re.S)
+_CSS_RULE = re.compile(r"([^{}]+)\{([^{}]*)\}")
+_CSS_BACKGROUND = re.compile(r"""background-image\s*:\s*url\(\s*(['"]?)/static/([^'")\s]+)\1\s*\)\s*;?""")
+
+
+def load_manifest(static_folder: str) -> dict:
+    """Read dist/manifest.json of the static folder. Returns {} if the assets are not built."""
+    path = os.path.join(static_folder, DIST_DIR, MANIFEST_NAME)
+    try:
+        with open(path, encoding="utf-8") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as err:
+        Log.error("Error reading the asset manifest, serving the original files", err, sys)
+        return {}
+
+
+def init_app(app, manifest: dict = None):
+    """Resolve url_for('static') through the manifest and cache the hashed files forever.
+
+    Args:
+        app (Flask): Application
+        manifest (dict): Manifest to use, read from the static folder by default
+    """
+    manifest = load_manifest(app.static_folder) if manifest is None else manifest
+    files = manifest.get("files", {})
+    app.config["ASSET_MANIFEST"] = manifest
+
+    @app.url_defaults
+    def hashed_static_url(endpoint, values):
+        if endpoint == "static":
+            values["filename"] = files.get(values.get("filename"), values.get("filename"))
+
+    @app.after_request
+    def cache_hashed_static(response):
+        filename = (request.view_args or {}).get("filename", "") if request.endpoint == "static" else ""
+        if response.status_code in (200, 304) and filename.startswith(DIST_DIR + "/"):
+            # The name changes with the content, the file never does
+            response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+        return response
+
+    if files:
+        Log.info(f"Serving {len(files)} fingerprinted static files")
+
+
+def _hashed_name(stem: str, data: bytes, extension: str) -> str:
+    """dist/<stem>.<hash of data><extension>"""
+    return f"{DIST_DIR}/{stem}.{sha256(data).hexdigest()[:12]}{extension}"
+
+
+def _write(static_folder: str, name: str, data: bytes):
+    path = os.path.join(static_folder, *name.split("/"))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as file:
+        file.write(data)
+
+
+def _encode(image, image_format: str) -> bytes:
+    """Image as bytes in image_format, None if this Pillow can not write it (e.g. AVIF)"""
+    if image_format == "JPEG" and image.mode != "RGB":
+        image = image.convert("RGB")
+    buffer = BytesIO()
+    try:
+        image.save(buffer, image_format, **SAVE_OPTIONS[image_format])
+    except (KeyError, OSError, ValueError):
+        return None
+    return buffer.getvalue()
+
+
+def _image_variants(static_folder: str, rel_path: str, source: bytes) -> tuple:
+    """Write every width and format of an image.
+
+    Returns:
+        tuple: (name url_for() serves, {width: {format: name}})
+    """
+    from PIL import Image, ImageOps
+
+    image_format = IMAGE_EXTENSIONS[os.path.splitext(rel_path)[1].lower()]
+    with Image.open(BytesIO(source)) as opened:
+        image = ImageOps.exif_transpose(opened)
+        image.load()
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "A" in image.getbands() or "transparency" in image.info else "RGB")
+
+    widths = sorted({min(width, image.width) for width in IMAGE_WIDTHS})
+    variants = {}
+    for width in widths:
+        if width == image.width:
+            resized = image
+        else:
+            resized = image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+        formats = {}
+        for variant_format in IMAGE_FORMATS + (image_format,):
+            data = _encode(resized, variant_format)
+            if data is None:
+                continue
+            if variant_format == image_format and width == image.width and len(data) > len(source):
+                # Already better compressed than Pillow does it
+                data = source
+            # e.g. dist/assets/bg-color.1920.<hash>.webp
+            name = _hashed_name(f"{os.path.splitext(rel_path)[0]}.{width}", data, EXTENSIONS[variant_format])
+            _write(static_folder, name, data)
+            formats[variant_format] = name
+        variants[width] = formats
+
+    default = max(width for width in widths if width <= DEFAULT_WIDTH)
+    return variants[default][image_format], variants
+
+
+def _image_set(formats: dict) -> str:
+    """CSS image-set() of the formats of one width, modern formats first"""
+    order = IMAGE_FORMATS + tuple(name for name in formats if name not in IMAGE_FORMATS)
+    return "image-set(" + ", ".join(
+        f"url('/static/{formats[name]}') type(\"{MIME_TYPES[name]}\")" for name in order if name in formats) + ")"
+
+
+def rewrite_css(css: str, files: dict, images: dict) -> str:
+    """Point the /static/ urls of a stylesheet to the hashed files.
+
+    Background images also get an image-set() with the modern formats and,
+    for small viewports (CSS_BREAKPOINTS), the smaller width. Comments are removed.
+
+    Args:
+        css (str): Stylesheet
+        files (dict): Original name -> hashed name
+        images (dict): Original name -> {width: {format: hashed name}}
+    """
+    css = _CSS_COMMENT.sub("", css)
+    media = {max_width: [] for max_width, _ in CSS_BREAKPOINTS}
+
+    def background(match):
+        original = match.group(2)
+        url = f"background-image: url('/static/{files.get(original, original)}');"
+        widths = images.get(original)
+        if not widths:
+            return url
+        default = max(int(width) for width in widths if int(width) <= DEFAULT_WIDTH)
+        return f"{url}\n    background-image: {_image_set(widths[str(default)])};"
+
+    def rule(match):
+        selector, body = match.group(1), match.group(2)
+        for max_width, width in CSS_BREAKPOINTS:
+            for found in _CSS_BACKGROUND.finditer(body):
+                widths = images.get(found.group(2), {})
+                if str(width) in widths:
+                    media[max_width].append(f"{selector.strip()} {{ background-image: {_image_set(widths[str(width)])}; }}")
+        return selector + "{" + _CSS_BACKGROUND.sub(background, body) + "}"
+
+    css = _CSS_RULE.sub(rule, css)
+    css = _CSS_URL.sub(lambda match: f"url('/static/{files.get(match.group(2), match.group(2))}')", css)
+    for max_width, rules in media.items():
+        if rules:
+            css += f"\n@media (max-width: {max_width}px) {{\n    " + "\n    ".join(rules) + "\n}\n"
+    return css
+
+
+def build_assets(static_folder: str) -> dict:
+    """Write the fingerprinted assets and the manifest into static_folder/dist.
+
+    Returns:
+        dict: Manifest {"files": {name: hashed name}, "images": {name: {width: {format: hashed name}}}}
+    """
+    dist = os.path.join(static_folder, DIST_DIR)
+    shutil.rmtree(dist, ignore_errors=True)
+    files, images, stylesheets = {}, {}, []
+
+    for folder, dirs, names in os.walk(static_folder):
+        if os.path.abspath(folder) == os.path.abspath(static_folder):
+            dirs[:] = [name for name in dirs if name != DIST_DIR]
+        for name in sorted(names):
+            path = os.path.join(folder, name)
+            rel_path = os.path.relpath(path, static_folder).replace(os.sep, "/")
+            extension = os.path.splitext(name)[1].lower()
+            if extension == ".css":
+                # Written last, they point to the hashed images
+                stylesheets.append(rel_path)
+                continue
+            with open(path, "rb") as file:
+                data = file.read()
+            if extension in IMAGE_EXTENSIONS:
+                files[rel_path], variants = _image_variants(static_folder, rel_path, data)
+                images[rel_path] = {str(width): formats for width, formats in variants.items()}
+            else:
+                stem, extension = os.path.splitext(rel_path)
+                files[rel_path] = _hashed_name(stem, data, extension)
+                _write(static_folder, files[rel_path], data)
+
+    for rel_path in stylesheets:
+        with open(os.path.join(static_folder, rel_path), encoding="utf-8") as file:
+            data = rewrite_css(file.read(), files, images).encode("utf-8")
+        files[rel_path] = _hashed_name(os.path.splitext(rel_path)[0], data, ".css")
+        _write(static_folder, files[rel_path], data)
+
+    manifest = dict(files=files, images=images)
+    with open(os.path.join(dist, MANIFEST_NAME), "w", encoding="utf-8") as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+    return manifest
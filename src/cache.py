@@ -0,0 +1,136 @@
+# by Richi Rod AKA @richionline / falken20
+#
+# Stale-while-revalidate cache. Fresh entries are returned as they are, stale
+# entries are returned at once while a background thread reloads them, and
+# expired or missing entries are loaded on the caller's thread. Concurrent
+# loads of the same key are coalesced by SingleFlight.
+
+import sys
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import Lock
+from time import monotonic
+from typing import Callable
+
+from src.logger import Log
+
+
+class SingleFlight():
+    """Run one call per key at a time; concurrent callers share its result."""
+
+    def __init__(self):
+        self._calls = {}  # key -> Future of the call in flight
+        self._lock = Lock()
+        self.shared = 0
+
+    def do(self, key, fn: Callable):
+        """Call fn() unless a call for key is already running, then wait for that one.
+
+        Exceptions raised by fn() are raised to every caller of the flight.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = Future()
+            else:
+                self.shared += 1
+
+        if not leader:
+            return call.result()
+
+        try:
+            result = fn()
+        except BaseException as err:
+            call.set_exception(err)
+            raise
+        else:
+            call.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+
+class SWRCache():
+    """Bounded LRU cache with per-entry freshness and stale windows."""
+
+    def __init__(self, maxsize: int = 64, workers: int = 2):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()  # key -> (value, stored_at)
+        self._refreshing = set()
+        self._flight = SingleFlight()
+        self._lock = Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="cache-refresh")
+        self._hits = 0
+        self._misses = 0
+        self._stale = 0
+
+    def get(self, key, loader: Callable, fresh: float, stale: float = 0):
+        """Return the value for key, calling loader() when it has to be loaded.
+
+        Args:
+            key: Hashable cache key.
+            loader: Function without arguments that returns the value.
+            fresh: Seconds the value is served without reloading.
+            stale: Extra seconds the value is still served while it reloads.
+
+        Returns:
+            The cached or loaded value. Falsy values are returned but not cached.
+        """
+        now = monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, stored_at = entry
+                age = now - stored_at
+                if age < fresh:
+                    self._hits += 1
+                    self._entries.move_to_end(key)
+                    return value
+                if age < fresh + stale:
+                    self._stale += 1
+                    self._entries.move_to_end(key)
+                    if key not in self._refreshing:
+                        self._refreshing.add(key)
+                        self._executor.submit(self._refresh, key, loader)
+                    return value
+            self._misses += 1
+
+        return self._load(key, loader)
+
+    def _load(self, key, loader: Callable):
+        value = self._flight.do(key, loader)
+        if value:
+            self.set(key, value)
+        return value
+
+    def _refresh(self, key, loader: Callable):
+        try:
+            self._load(key, loader)
+        except Exception as err:
+            Log.error("Error refreshing cache entry", err, sys)
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def set(self, key, value):
+        """Store value for key, evicting the least recently used entries."""
+        with self._lock:
+            self._entries[key] = (value, monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drop every entry and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self._hits = self._misses = self._stale = 0
+            self._flight.shared = 0
+
+    def stats(self) -> dict:
+        """Return hit/miss/stale/shared counters and the current size."""
+        with self._lock:
+            return dict(hits=self._hits, misses=self._misses, stale=self._stale,
+                        shared=self._flight.shared, size=len(self._entries), maxsize=self.maxsize)
@@ -0,0 +1,124 @@
+# by Richi Rod AKA @richionline / falken20
+#
+# Typed clients of the upstream APIs (EcoWitt and Weather Underground). Each
+# client builds its URLs on every call from structured params, so dates are
+# always current and properly encoded, and has its own (connect, read)
+# timeouts and a limit of requests in flight, so a slow provider can not take
+# every worker thread.
+
+from threading import BoundedSemaphore
+from urllib.parse import quote, urlencode
+
+from src.config import (API_KEY_ECOWITT, APPLICATION_KEY_ECOWITT, STATION_MAC,
+                        API_KEY_WUNDERGROUND, STATION_ID,
+                        UPSTREAM_TIMEOUTS, UPSTREAM_MAX_CONCURRENCY)
+from src.weather import get_api_data, local_today, _HISTORY_PATH
+
+
+class ConcurrencyLimit():
+    """Context manager that allows at most max_concurrency requests in flight.
+
+    A request that gets no free slot within wait seconds raises TimeoutError
+    instead of queueing forever.
+    """
+
+    def __init__(self, name: str, max_concurrency: int, wait: float):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.wait = wait
+        self._slots = BoundedSemaphore(max_concurrency)
+
+    def __enter__(self):
+        if not self._slots.acquire(timeout=self.wait):
+            raise TimeoutError(f"Too many {self.name} requests in flight ({self.max_concurrency})")
+        return self
+
+    def __exit__(self, *exc_info):
+        self._slots.release()
+        return False
+
+
+class UpstreamClient():
+    """Base client: URL building, timeouts and concurrency limit of one API."""
+
+    name = ""
+    base_url = ""
+
+    def __init__(self, timeout: tuple = None, max_concurrency: int = None):
+        self.timeout = tuple(timeout or UPSTREAM_TIMEOUTS[self.name])
+        # A request waits for a slot at most as long as it could take itself
+        self.limit = ConcurrencyLimit(self.name, max_concurrency or UPSTREAM_MAX_CONCURRENCY[self.name],
+                                      wait=sum(self.timeout))
+
+    def build_url(self, path: str, params: dict) -> str:
+        """Return base_url + path with params encoded as query string"""
+        return f"{self.base_url}{path}?{urlencode(params, safe=',:', quote_via=quote)}"
+
+    def get(self, path: str, params: dict, use_cache: bool = True) -> dict:
+        """Request the API (through the get_api_data cache). Returns {} on error."""
+        return get_api_data(self.build_url(path, params), use_cache=use_cache,
+                            timeout=self.timeout, limit=self.limit)
+
+
+class EcowittClient(UpstreamClient):
+    """EcoWitt API v3 of the station (current data and history)."""
+
+    name = "ecowitt"
+    base_url = "https://api.ecowitt.net"
+    UNITS = dict(temp_unitid=1, pressure_unitid=3, wind_speed_unitid=7, rainfall_unitid=12)
+    # Metrics requested in the history (see summary.SUMMARY_SPECS)
+    HISTORY_METRICS = ("outdoor.temperature", "outdoor.humidity", "wind.wind_speed",
+                       "pressure.relative", "solar_and_uvi.uvi", "rainfall.yearly")
+
+    def __init__(self, application_key: str = APPLICATION_KEY_ECOWITT, api_key: str = API_KEY_ECOWITT,
+                 mac: str = STATION_MAC, **kwargs):
+        super().__init__(**kwargs)
+        self.application_key = application_key
+        self.api_key = api_key
+        self.mac = mac
+
+    @property
+    def station(self) -> str:
+        return self.mac
+
+    def _params(self, **params) -> dict:
+        return dict(application_key=self.application_key, api_key=self.api_key, mac=self.mac,
+                    **self.UNITS, **params)
+
+    def real_time(self, use_cache: bool = True) -> dict:
+        """Current data of every sensor"""
+        return self.get("/api/v3/device/real_time", self._params(call_back="all"), use_cache=use_cache)
+
+    def history(self, date_from: str, date_to: str, cycle_type: str = "1day", use_cache: bool = True) -> dict:
+        """History of HISTORY_METRICS between both days ('YYYYMMDD'), both included"""
+        return self.get(_HISTORY_PATH, self._params(
+            call_back=",".join(self.HISTORY_METRICS), cycle_type=cycle_type,
+            start_date=f"{date_from} 00:00:00", end_date=f"{date_to} 23:59:59"), use_cache=use_cache)
+
+
+class WundergroundClient(UpstreamClient):
+    """Weather Underground PWS API of the station."""
+
+    name = "wunderground"
+    base_url = "https://api.weather.com"
+
+    def __init__(self, station_id: str = STATION_ID, api_key: str = API_KEY_WUNDERGROUND, **kwargs):
+        super().__init__(**kwargs)
+        self.station_id = station_id
+        self.api_key = api_key
+
+    def _params(self, **params) -> dict:
+        return dict(stationId=self.station_id, format="json", units="m", numericPrecision="decimal",
+                    apiKey=self.api_key, **params)
+
+    def current(self, use_cache: bool = True) -> dict:
+        """Current observation"""
+        return self.get("/v2/pws/observations/current", self._params(), use_cache=use_cache)
+
+    def daily(self, day: str = None, use_cache: bool = True) -> dict:
+        """Daily summary of day ('YYYYMMDD', default today in station time)"""
+        return self.get("/v2/pws/history/daily", self._params(date=day or local_today()), use_cache=use_cache)
+
+
+ecowitt = EcowittClient()
+wunderground = WundergroundClient()
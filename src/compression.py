@@ -0,0 +1,106 @@
+# by Richi Rod AKA @richionline / falken20
+#
+# Response compression negotiated with Accept-Encoding. gzip is always
+# available, brotli only if the optional brotli package is installed. The
+# compressed bytes are cached (with the rendered page, or here by content
+# hash) so every version of a page or API response is compressed once.
+
+import gzip
+from collections import OrderedDict
+from hashlib import sha256
+from threading import Lock
+
+try:
+    import brotli
+except ImportError:  # Optional, only gzip without it
+    brotli = None
+
+# Smaller bodies are not worth the CPU and the extra headers
+MIN_SIZE = 500
+COMPRESSIBLE_MIMETYPES = frozenset({"text/html", "application/json"})
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 9
+
+# Preferred first when the client accepts both with the same quality
+ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def negotiate(accept_encodings, size: int) -> str:
+    """Return the encoding for a body of size bytes ('br', 'gzip'), None to send it as it is.
+
+    Args:
+        accept_encodings: Parsed Accept-Encoding header (request.accept_encodings)
+        size (int): Length of the body
+    """
+    if size < MIN_SIZE:
+        return None
+    return accept_encodings.best_match(ENCODINGS)
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    """Compress data. gzip output has no timestamp, so equal input gives equal bytes."""
+    if encoding == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    if encoding == "gzip":
+        return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+    raise ValueError(f"Unsupported encoding: {encoding}")
+
+
+class CompressedCache():
+    """Compressed bodies by (content hash, encoding). Keeps the newest max_entries."""
+
+    def __init__(self, max_entries: int = 64):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, data: bytes, encoding: str) -> bytes:
+        """Return data compressed with encoding, compressing it only the first time"""
+        key = (sha256(data).digest(), encoding)
+        with self._lock:
+            compressed = self._entries.get(key)
+            if compressed is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return compressed
+            self.misses += 1
+
+        compressed = compress(data, encoding)
+        with self._lock:
+            self._entries[key] = compressed
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return compressed
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        return dict(entries=len(self._entries), hits=self.hits, misses=self.misses)
+
+
+# Shared cache of the responses compressed by the after_request hook
+response_cache = CompressedCache()
+
+
+def compress_response(response, accept_encodings):
+    """Compress a finished Flask response in place if it is worth it and the client accepts it"""
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or "Content-Encoding" in response.headers or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+
+    response.vary.add("Accept-Encoding")
+    data = response.get_data()
+    encoding = negotiate(accept_encodings, len(data))
+    if encoding is None:
+        return response
+
+    response.set_data(response_cache.get(data, encoding))
+    response.headers["Content-Encoding"] = encoding
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(f"{etag}-{encoding}", weak=weak)
+    return response
@@ -1,6 +1,8 @@
 # by Richi Rod AKA @richionline / falken20
-from datetime import datetime
 import os
+import tempfile
+
+from dateutil import tz
 
 
 _IS_PRODUCTION = os.environ.get('ENV_PRO', 'N').upper() == 'Y'
@@ -18,31 +20,59 @@ def _read_env(name: str, required: bool = False) -> str:
 # Weather Underground API data
 STATION_ID = _read_env('STATION_ID', required=_IS_PRODUCTION)
 API_KEY_WUNDERGROUND = _read_env('API_KEY_WUNDERGROUND', required=_IS_PRODUCTION)
-URL_WEATHER_WUNDERGROUND_CURRENT = f"https://api.weather.com/v2/pws/observations/current?stationId={STATION_ID}" \
-    f"&format=json&units=m&numericPrecision=decimal" \
-    f"&apiKey={API_KEY_WUNDERGROUND}"
-URL_WEATHER_WUNDERGROUND_DAY = f"https://api.weather.com/v2/pws/history/daily?stationId={STATION_ID}" \
-    f"&format=json&units=m&numericPrecision=decimal" \
-    f"&apiKey={API_KEY_WUNDERGROUND}" \
-    f"&date={datetime.today().strftime('%Y%m%d')}"
 
 # Weather EcoWitt API data
 API_KEY_ECOWITT = _read_env('API_KEY_ECOWITT', required=_IS_PRODUCTION)
 APPLICATION_KEY_ECOWITT = _read_env('APPLICATION_KEY', required=_IS_PRODUCTION)
 STATION_MAC = _read_env('STATION_MAC', required=_IS_PRODUCTION)
-URL_WEATHER_ECOWITT_CURRENT = f"https://api.ecowitt.net/api/v3/device/real_time?application_key={APPLICATION_KEY_ECOWITT}" \
-    f"&api_key={API_KEY_ECOWITT}&mac={STATION_MAC}" \
-    f"&temp_unitid=1&pressure_unitid=3&wind_speed_unitid=7&rainfall_unitid=12" \
-    f"&call_back=all"
-URL_WEATHER_ECOWITT_HISTOY = f"https://api.ecowitt.net/api/v3/device/history?application_key={APPLICATION_KEY_ECOWITT}" \
-    f"&api_key={API_KEY_ECOWITT}&mac={STATION_MAC}" \
-    f"&temp_unitid=1&pressure_unitid=3&wind_speed_unitid=7&rainfall_unitid=12" \
-    f"&call_back=outdoor.temperature,outdoor.humidity,wind.wind_speed,pressure.relative,solar_and_uvi.uvi" \
-    f",rainfall.yearly"
-#   f"&cycle_type=1day&start_date={date_from} 00:00:00&end_date={date_to} 23:59:59" \
-
-# API by https://sunrise-sunset.org/api
-URL_SUNRISE_SUNSET = "https://api.sunrise-sunset.org/json?lat=40.727&lng=-4.074&date=today"
+
+# Station coordinates for the sunrise/sunset times (src/sun.py)
+STATION_LATITUDE = float(os.environ.get('STATION_LATITUDE', '40.727'))
+STATION_LONGITUDE = float(os.environ.get('STATION_LONGITUDE', '-4.074'))
+# Time zone of the station: local days of the history, summaries and sun times
+STATION_TZ = tz.gettz("Europe/Madrid")
+
+# Upstream clients (src/clients.py): (connect, read) timeouts in seconds and
+# maximum requests in flight for each API
+UPSTREAM_TIMEOUTS = {
+    'ecowitt': (float(os.environ.get('ECOWITT_CONNECT_TIMEOUT', '3.05')),
+                float(os.environ.get('ECOWITT_READ_TIMEOUT', '15'))),
+    'wunderground': (float(os.environ.get('WUNDERGROUND_CONNECT_TIMEOUT', '3.05')),
+                     float(os.environ.get('WUNDERGROUND_READ_TIMEOUT', '5'))),
+}
+UPSTREAM_MAX_CONCURRENCY = {
+    'ecowitt': int(os.environ.get('ECOWITT_MAX_CONCURRENCY', '2')),
+    'wunderground': int(os.environ.get('WUNDERGROUND_MAX_CONCURRENCY', '2')),
+}
+
+# Background poller (src/poller.py). Enabled by default in production only.
+POLLER_ENABLED = os.environ.get('POLLER_ENABLED', 'Y' if _IS_PRODUCTION else 'N').upper() == 'Y'
+# Refresh interval in seconds for each polled source
+POLL_INTERVALS = {
+    'weather_current': int(os.environ.get('POLL_SECONDS_WEATHER_CURRENT', '60')),
+    'weather_day': int(os.environ.get('POLL_SECONDS_WEATHER_DAY', '300')),
+    'weather_data': int(os.environ.get('POLL_SECONDS_WEATHER_DATA', '60')),
+    'summary': int(os.environ.get('POLL_SECONDS_SUMMARY', '1800')),
+}
+
+# Latency budget of a home page render in milliseconds. Sources that are not
+# ready in time are shown as '-' placeholders.
+PAGE_BUDGET_MS = int(os.environ.get('PAGE_BUDGET_MS', '800'))
+# Seconds a source that failed or returned no data is not fetched live again,
+# so a failing upstream is not called on every home request
+SOURCE_RETRY_SECONDS = int(os.environ.get('SOURCE_RETRY_SECONDS', '30'))
+
+# SQLite file with the per-day history aggregates (src/daily_store.py).
+# On App Engine only /tmp is writable.
+DAILY_STORE_PATH = os.environ.get('DAILY_STORE_PATH',
+                                  os.path.join(tempfile.gettempdir(), 'parrao_weather_daily.sqlite3'))
+
+# Rate limiter backend (src/rate_limit.py): 'memory' keeps the counters in each
+# process, 'sqlite' shares them through RATE_LIMIT_DB_PATH between every
+# worker process of the host.
+RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND', 'memory').lower()
+RATE_LIMIT_DB_PATH = os.environ.get('RATE_LIMIT_DB_PATH',
+                                    os.path.join(tempfile.gettempdir(), 'parrao_weather_rate_limit.sqlite3'))
 
 # Optional GA tracking ID for template rendering
 GA_MEASUREMENT_ID = _read_env('GA_MEASUREMENT_ID', required=False)
@@ -0,0 +1,141 @@
+# by Richi Rod AKA @richionline / falken20
+#
+# Persisted per-day aggregates of the EcoWitt history. Days that are already
+# complete are kept in a SQLite file, so the month and year summaries only
+# need to download the days that are not stored yet plus today.
+
+import sqlite3
+from datetime import datetime, timedelta
+from threading import Lock
+
+from src.config import DAILY_STORE_PATH, STATION_TZ
+from src.summary import SUMMARY_SPECS, apply_spec, get_series, series_stats
+
+# Per-day statistics kept in the store, in column order
+DAY_STATS = ("min", "max", "sum", "count", "first", "last")
+
+
+def day_range(date_from: str, date_to: str) -> list:
+    """Return every day between both dates (both included) as 'YYYYMMDD' strings"""
+    day = datetime.strptime(date_from, "%Y%m%d")
+    last = datetime.strptime(date_to, "%Y%m%d")
+    days = []
+    while day <= last:
+        days.append(day.strftime("%Y%m%d"))
+        day += timedelta(days=1)
+    return days
+
+
+def daily_aggregates(data: dict, specs: dict = SUMMARY_SPECS) -> dict:
+    """Group an EcoWitt history response into per-day statistics.
+
+    Args:
+        data (dict): EcoWitt history response
+        specs (dict): Metrics to aggregate
+
+    Returns:
+        dict: {(day, metric): stats dict} with days in station local time
+    """
+    aggregates = {}
+    for metric, spec in specs.items():
+        series = get_series(data, spec.path)
+        if series is None:
+            continue
+        values = series.values
+        for day, start, end in series.split_days(STATION_TZ):
+            aggregates[(day, metric)] = series_stats(values[start:end])
+    return aggregates
+
+
+def combine_days(rows) -> dict:
+    """Merge per-day stats rows (sorted by day) into the stats of the whole range"""
+    stats = {}
+    for low, high, total, count, first, last in rows:
+        if not stats:
+            stats = dict(min=low, max=high, sum=total, count=count, first=first, last=last)
+            continue
+        stats["min"] = min(stats["min"], low)
+        stats["max"] = max(stats["max"], high)
+        stats["sum"] += total
+        stats["count"] += count
+        stats["last"] = last
+    if stats:
+        stats["mean"] = stats["sum"] / stats["count"]
+    return stats
+
+
+class DailyStore():
+    """SQLite store of per-day, per-metric statistics."""
+
+    def __init__(self, path: str = DAILY_STORE_PATH):
+        self.path = path
+        self._lock = Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS daily ("
+                "day TEXT NOT NULL, metric TEXT NOT NULL, "
+                "min_value REAL NOT NULL, max_value REAL NOT NULL, sum_value REAL NOT NULL, "
+                "count INTEGER NOT NULL, first_value REAL NOT NULL, last_value REAL NOT NULL, "
+                "PRIMARY KEY (day, metric))")
+            # Days whose data is final and never has to be downloaded again
+            self._conn.execute("CREATE TABLE IF NOT EXISTS complete_days (day TEXT PRIMARY KEY)")
+
+    def store(self, data: dict) -> int:
+        """Save the per-day aggregates of an EcoWitt history response. Returns the rows written."""
+        return self.store_aggregates(daily_aggregates(data))
+
+    def store_aggregates(self, aggregates: dict) -> int:
+        """Save per-day aggregates (see daily_aggregates). Returns the rows written."""
+        rows = [(day, metric) + tuple(stats[name] for name in DAY_STATS)
+                for (day, metric), stats in aggregates.items()]
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO daily VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        return len(rows)
+
+    def mark_complete(self, days: list):
+        """Flag days as final so they are not requested again."""
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR IGNORE INTO complete_days VALUES (?)", [(day,) for day in days])
+
+    def missing_days(self, date_from: str, date_to: str) -> list:
+        """Return the days in the range that are not complete yet"""
+        with self._lock:
+            complete = {row[0] for row in self._conn.execute(
+                "SELECT day FROM complete_days WHERE day BETWEEN ? AND ?", (date_from, date_to))}
+        return [day for day in day_range(date_from, date_to) if day not in complete]
+
+    def summary(self, date_from: str, date_to: str, specs: dict = SUMMARY_SPECS) -> dict:
+        """Summary of every metric over the stored days of the range.
+
+        Each metric is shown as its MetricSpec says (e.g. rainfall is the
+        increase of the yearly counter). Percentiles are not available from
+        the per-day rows. Metrics without data are returned as '-'.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT metric, min_value, max_value, sum_value, count, first_value, last_value "
+                "FROM daily WHERE day BETWEEN ? AND ? ORDER BY day", (date_from, date_to)).fetchall()
+        metric_rows = {}
+        for row in rows:
+            metric_rows.setdefault(row[0], []).append(row[1:])
+
+        return {metric: apply_spec(spec, combine_days(metric_rows.get(metric, ())))
+                for metric, spec in specs.items()}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_daily_store = None
+_daily_store_lock = Lock()
+
+
+def get_daily_store() -> DailyStore:
+    """Return the shared store, opening it on first use."""
+    global _daily_store
+    with _daily_store_lock:
+        if _daily_store is None:
+            _daily_store = DailyStore()
+        return _daily_store
@@ -0,0 +1,153 @@
+# by Richi Rod AKA @richionline / falken20
+#
+# Incremental JSON parser for the EcoWitt history responses. The body is read
+# in chunks and every "list" object ({"epoch": "value", ...}) goes straight
+# into a TimeSeries, so neither the full body text nor the dicts of strings are
+# ever held in memory.
+
+import codecs
+import json
+import re
+
+from src.timeseries import TimeSeries
+
+_TOKEN = re.compile(
+    r'\s*(?:'
+    r'([{}\[\]:,])'                                 # 1: punctuation
+    r'|"((?:[^"\\]|\\.)*)"'                         # 2: string
+    r'|(-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)'          # 3: number
+    r'|(true|false|null)'                           # 4: literal
+    r')', re.S)
+_LITERALS = {"true": True, "false": False, "null": None}
+
+
+class _Frame():
+    __slots__ = ("container", "key", "expect_key")
+
+    def __init__(self, container):
+        self.container = container
+        self.key = None
+        self.expect_key = isinstance(container, (dict, TimeSeries))
+
+
+class StreamParser():
+    """Feed text chunks with feed() and get the parsed document from close().
+
+    Objects stored under series_key are parsed into TimeSeries instead of dicts.
+    """
+
+    def __init__(self, series_key: str = "list"):
+        self.series_key = series_key
+        self._buffer = ""
+        self._stack = []
+        self._done = False
+        self.result = None
+
+    def feed(self, text: str):
+        self._buffer += text
+        self._parse(final=False)
+
+    def close(self):
+        """Parse what is left and return the document.
+
+        Raises:
+            ValueError: If the document is incomplete or invalid.
+        """
+        self._parse(final=True)
+        if not self._done or self._buffer.strip():
+            raise ValueError("Incomplete or invalid JSON document")
+        return self.result
+
+    def _parse(self, final: bool):
+        buffer = self._buffer
+        position = 0
+        size = len(buffer)
+        while True:
+            match = _TOKEN.match(buffer, position)
+            if match is None:
+                break
+            # A number at the end of the buffer (or cut before its fraction or
+            # exponent) may continue in the next chunk
+            if match.group(3) is not None and not final and \
+                    (match.end() == size or buffer[match.end()] in ".eE+-"):
+                break
+            position = match.end()
+            punct, string, number, literal = match.groups()
+            if punct is not None:
+                self._punctuation(punct)
+            elif string is not None:
+                self._scalar(json.loads(f'"{string}"') if "\\" in string else string, is_string=True)
+            elif number is not None:
+                self._scalar(json.loads(number))
+            else:
+                self._scalar(_LITERALS[literal])
+        self._buffer = buffer[position:]
+
+    def _punctuation(self, punct: str):
+        if punct == "{":
+            frame = self._stack[-1] if self._stack else None
+            if frame is not None and isinstance(frame.container, dict) and frame.key == self.series_key:
+                self._stack.append(_Frame(TimeSeries()))
+            else:
+                self._stack.append(_Frame({}))
+        elif punct == "[":
+            self._stack.append(_Frame([]))
+        elif punct in "}]":
+            if not self._stack:
+                raise ValueError("Unexpected closing bracket")
+            container = self._stack.pop().container
+            if isinstance(container, TimeSeries):
+                container.sort()
+            self._value(container)
+        elif punct == ",":
+            if self._stack and not isinstance(self._stack[-1].container, list):
+                self._stack[-1].expect_key = True
+        # ":" needs no action, the key is already stored in the frame
+
+    def _scalar(self, value, is_string: bool = False):
+        if self._stack and self._stack[-1].expect_key:
+            if not is_string:
+                raise ValueError("Object keys must be strings")
+            frame = self._stack[-1]
+            frame.key = value
+            frame.expect_key = False
+            return
+        self._value(value)
+
+    def _value(self, value):
+        if not self._stack:
+            if self._done:
+                raise ValueError("Extra data after the JSON document")
+            self.result = value
+            self._done = True
+            return
+        frame = self._stack[-1]
+        container = frame.container
+        if isinstance(container, list):
+            container.append(value)
+        elif isinstance(container, TimeSeries):
+            try:
+                container.append(int(frame.key), float(value))
+            except (TypeError, ValueError):
+                pass  # Same as TimeSeries.from_dict, skip values like "-"
+        else:
+            container[frame.key] = value
+
+
+def parse_stream(chunks, series_key: str = "list", encoding: str = "utf-8"):
+    """Parse a JSON document from an iterable of byte chunks.
+
+    Args:
+        chunks: Iterable of bytes (e.g. response.iter_content())
+        series_key (str): Key whose objects are parsed as TimeSeries
+        encoding (str): Body encoding
+
+    Returns:
+        The parsed document.
+    """
+    decoder = codecs.getincrementaldecoder(encoding)()
+    parser = StreamParser(series_key)
+    for chunk in chunks:
+        parser.feed(decoder.decode(chunk))
+    parser.feed(decoder.decode(b"", final=True))
+    return parser.close()
@@ -1,10 +1,21 @@
 # by Richi Rod AKA @richionline / falken20
+#
+# Log records are built on the calling thread and handed to a pipeline that
+# writes them to a sink: JSON lines for Cloud Logging in production, rich
+# styled output in development. With LOG_QUEUE_SIZE > 0 the records go
+# through a bounded queue written by a background thread, so a burst of logs
+# never blocks a request; records that do not fit are dropped and counted.
 
+import atexit
+import json
 import sys
 import os
+from queue import Full, Queue
+from threading import Lock, Thread
+from time import monotonic, sleep, time
 from rich.console import Console
 from rich.style import Style
-from datetime import datetime
+from datetime import datetime, timezone
 from dotenv import load_dotenv, find_dotenv
 import pprint
 
@@ -21,84 +32,232 @@ style_ERROR = Style(color="red", bgcolor="white", bold=True)
 
 # Min log level to print
 LEVEL_LOG = os.getenv('LEVEL_LOG', "DEBUG, INFO, WARNING, ERROR")
-console.print(f"LOG LEVEL: {LEVEL_LOG}", style="yellow")
 
+_IS_PRODUCTION = os.getenv('ENV_PRO', 'N').upper() == 'Y'
+# 'json': one JSON object per line (Cloud Logging), 'rich': styled terminal output
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json' if _IS_PRODUCTION else 'rich').lower()
+# Records waiting to be written in the background, 0 writes them on the calling thread
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000' if _IS_PRODUCTION else '0'))
 
-class Log():
+LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR")
 
-    @staticmethod
-    def info_dict(message: str = "", dict_obj: dict = None, level_log: str = "INFO"):
+# Enabled levels resolved from LEVEL_LOG: (LEVEL_LOG value, set of levels).
+# They are resolved again only if LEVEL_LOG is replaced.
+_enabled_levels = (None, frozenset())
+
+
+def _resolve_levels(level_log: str) -> frozenset:
+    level_log = level_log.upper()
+    return frozenset(level for level in LEVELS if level in level_log)
+
+
+def _render(message, args) -> str:
+    """Build a lazy message: call it if it is a callable and apply %-style args"""
+    if callable(message):
+        message = message()
+    return message % args if args else message
+
+
+def _record(level: str, message: str, style=None, **fields) -> dict:
+    return dict(time=time(), severity=level, message=message, style=style, **fields)
+
+
+def _error_fields(err, sys) -> dict:
+    """Exception name, text and the line where it was caught, read once from exc_info"""
+    traceback = sys.exc_info()[2] or getattr(err, "__traceback__", None)
+    fields = dict(error=type(err).__name__, detail=format(err))
+    if traceback is not None:
+        code = traceback.tb_frame.f_code
+        fields["location"] = dict(file=code.co_filename, line=traceback.tb_lineno, function=code.co_name)
+    return fields
+
+
+class JsonSink():
+    """Write each record as a JSON line with the fields Cloud Logging understands."""
+
+    def __init__(self, stream=None):
+        self.stream = stream
+
+    def write(self, record: dict):
+        entry = dict(
+            time=datetime.fromtimestamp(record["time"], timezone.utc).isoformat(),
+            severity=record["severity"],
+            message=str(record["message"]),
+        )
+        if "error" in record:
+            entry["error"] = record["error"]
+            entry["detail"] = record["detail"]
+        if "location" in record:
+            entry["logging.googleapis.com/sourceLocation"] = record["location"]
+        if "data" in record:
+            entry["data"] = record["data"]
+        stream = self.stream or sys.stdout
+        stream.write(json.dumps(entry, default=str) + "\n")
+        stream.flush()
+
+
+class RichSink():
+    """Styled terminal output for development."""
+
+    def write(self, record: dict):
+        time = datetime.fromtimestamp(record["time"]).strftime("%Y/%m/%d %H:%M:%S")
+        level = record["severity"]
+        if "error" in record:
+            location = record.get("location", {})
+            console.rule("ERROR")
+            console.print(time, level, record["message"],
+                          f"\nLine: {location.get('line')} {record['error']} ",
+                          f"\nMethod: {location.get('function')} ",
+                          f"\nFile: {location.get('file')} ",
+                          f"\nError: {record['detail']}",
+                          style=record["style"])
+        else:
+            console.print(time, level, record["message"], style=record["style"])
+        if "data" in record:
+            console.print(pprint.pformat(record["data"]), markup=False, highlight=False)
+
+
+class LogPipeline():
+    """Hand the log records to a sink.
+
+    With queue_size > 0 the records are put on a bounded queue and written by
+    a daemon thread, so emit() never waits on I/O. When the queue is full the
+    record is dropped and counted; the writer reports the count once it
+    catches up.
+    """
+
+    def __init__(self, sink, queue_size: int = 0):
+        self.sink = sink
+        self.dropped = 0
+        self.failed = 0
+        self._reported = 0
+        self._lock = Lock()
+        self._queue = Queue(queue_size) if queue_size > 0 else None
+        self._writer = None
+
+    def _start(self):
+        with self._lock:
+            # is_alive() is also False in a forked worker process
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = Thread(target=self._run, name="log-writer", daemon=True)
+                self._writer.start()
+
+    def emit(self, record: dict):
+        if self._queue is None:
+            self._write(record)
+            return
+        if self._writer is None or not self._writer.is_alive():
+            self._start()
         try:
-            if level_log in LEVEL_LOG.upper():
-                if level_log == "INFO":
-                    Log.info(message)
-                elif level_log == "DEBUG":
-                    Log.debug(message)
-                elif level_log == "WARNING":
-                    Log.warning(message)
+            self._queue.put_nowait(record)
+        except Full:
+            with self._lock:
+                self.dropped += 1
 
-                pprint.pprint(dict_obj)
+    def _write(self, record: dict):
+        try:
+            self.sink.write(record)
+        except Exception:
+            # Logging the failure could fail again, it is only counted
+            self.failed += 1
+
+    def _run(self):
+        while True:
+            record = self._queue.get()
+            self._write(record)
+            dropped = self.dropped
+            if dropped > self._reported and self._queue.empty():
+                self._write(_record("WARNING", f"{dropped - self._reported} log records dropped",
+                                    style_WARNING, dropped=dropped))
+                self._reported = dropped
+            self._queue.task_done()
+
+    def flush(self, timeout: float = 5) -> bool:
+        """Wait until the queued records are written. Returns False on timeout."""
+        if self._queue is None:
+            return True
+        deadline = monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if monotonic() >= deadline or self._writer is None or not self._writer.is_alive():
+                return False
+            sleep(0.005)
+        return True
+
+    def stats(self) -> dict:
+        return dict(queued=self._queue.qsize() if self._queue is not None else 0,
+                    dropped=self.dropped, failed=self.failed)
 
-        except Exception as err:
-            Log.error("Error to print log", err, sys)
+
+pipeline = LogPipeline(JsonSink() if LOG_FORMAT == "json" else RichSink(), LOG_QUEUE_SIZE)
+atexit.register(pipeline.flush, 1)
+pipeline.emit(_record("INFO", f"LOG LEVEL: {LEVEL_LOG}", "yellow"))
+
+
+class Log():
 
     @staticmethod
-    def debug(message, style=style_DEBUG):
-        try:
-            time = datetime.now().strftime("%Y/%m/%d %H:%M:%S")
-            level = Log.debug.__name__.upper()
+    def is_enabled_for(level: str) -> bool:
+        """Return True if level ('DEBUG', 'INFO', ...) is in LEVEL_LOG"""
+        global _enabled_levels
+        source, levels = _enabled_levels
+        if source is not LEVEL_LOG:
+            levels = _resolve_levels(LEVEL_LOG)
+            _enabled_levels = (LEVEL_LOG, levels)
+        return level in levels
 
-            if level in LEVEL_LOG.upper():
-                console.print(time, level, message, style=style)
+    @staticmethod
+    def info_dict(message: str = "", dict_obj: dict = None, level_log: str = "INFO"):
+        """Log message with dict_obj (or its result if it is a callable) attached"""
+        if not Log.is_enabled_for(level_log):
+            return
+        try:
+            data = dict_obj() if callable(dict_obj) else dict_obj
+            style = {"DEBUG": style_DEBUG, "WARNING": style_WARNING}.get(level_log, style_INFO)
+            pipeline.emit(_record(level_log, message, style, data=data))
 
         except Exception as err:
             Log.error("Error to print log", err, sys)
 
     @staticmethod
-    def info(message, style=style_INFO):
+    def _emit(level: str, message, args, style):
         try:
-            time = datetime.now().strftime("%Y/%m/%d %H:%M:%S")
-            level = Log.info.__name__.upper()
-
-            if level in LEVEL_LOG.upper():
-                console.print(time, level, message, style=style)
+            pipeline.emit(_record(level, _render(message, args), style))
 
         except Exception as err:
             Log.error("Error to print log", err, sys)
 
     @staticmethod
-    def warning(message, style=style_WARNING):
-        try:
-            time = datetime.now().strftime("%Y/%m/%d %H:%M:%S")
-            level = Log.warning.__name__.upper()
+    def debug(message, *args, style=style_DEBUG):
+        """
+        Log debug message. It is only built if DEBUG is enabled:
+        Log.debug("Keys: %s", keys) or Log.debug(lambda: f"Keys: {keys}")
+        """
+        if Log.is_enabled_for("DEBUG"):
+            Log._emit("DEBUG", message, args, style)
 
-            if level in LEVEL_LOG.upper():
-                console.print(time, level, message, style=style)
+    @staticmethod
+    def info(message, *args, style=style_INFO):
+        if Log.is_enabled_for("INFO"):
+            Log._emit("INFO", message, args, style)
 
-        except Exception as err:
-            Log.error("Error to print log", err, sys)
+    @staticmethod
+    def warning(message, *args, style=style_WARNING):
+        if Log.is_enabled_for("WARNING"):
+            Log._emit("WARNING", message, args, style)
 
     @staticmethod
     def error(message, err, sys, style=style_ERROR):
         """
-        Print error in terminal
+        Log error with the exception and the line where it was caught
         Args:
             message: Messsage to show
             err(Exception): Exception
             sys(sys): System var
         """
+        if not Log.is_enabled_for("ERROR"):
+            return
         try:
-            time = datetime.now().strftime("%Y/%m/%d %H:%M:%S")
-            level = Log.error.__name__.upper()
-
-            if level in LEVEL_LOG.upper():
-                console.rule("ERROR")
-                console.print(time, level, message,
-                              f"\nLine: {sys.exc_info()[2].tb_lineno} {type(err).__name__} ",
-                              f"\nMethod: {sys.exc_info()[2].tb_frame.f_code.co_name} ",
-                              f"\nFile: {sys.exc_info()[2].tb_frame.f_code.co_filename} ",
-                              f"\nError: {format(err)}",
-                              style=style)
+            pipeline.emit(_record("ERROR", message, style, **_error_fields(err, sys)))
 
-        except Exception as err:
-            Log.error("Error to print log", err, sys)
+        except Exception:
+            pipeline.failed += 1
@@ -0,0 +1,109 @@
+# by Richi Rod AKA @richionline / falken20
+#
+# Cache of rendered pages. A page is rendered once per version of its data
+# (the poller snapshot) and served with a strong ETag and Last-Modified, so
+# browsers revalidate with If-None-Match / If-Modified-Since and get a 304
+# while the data does not change. The compressed bodies are kept with the
+# page, so each version is also compressed once per encoding.
+
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from hashlib import sha256
+from threading import Lock
+from typing import Callable
+
+from flask import Response, request
+
+from src.cache import SingleFlight
+from src.compression import compress, negotiate
+
+
+@dataclass(frozen=True)
+class RenderedPage:
+    """Rendered body with its validators."""
+    body: bytes
+    etag: str
+    last_modified: datetime
+    mimetype: str = "text/html"
+    encoded: dict = field(default_factory=dict, compare=False, repr=False)  # encoding -> bytes
+
+    @classmethod
+    def build(cls, body, last_modified: float, mimetype: str = "text/html") -> "RenderedPage":
+        """Encode body and compute its ETag (hash of the content, the same in every process)"""
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        # HTTP dates have no fraction of a second
+        modified = datetime.fromtimestamp(int(last_modified), timezone.utc)
+        return cls(body=body, etag=sha256(body).hexdigest()[:32], last_modified=modified, mimetype=mimetype)
+
+    def body_for(self, encoding: str) -> bytes:
+        """Body compressed with encoding, compressed on the first call only"""
+        if encoding is None:
+            return self.body
+        body = self.encoded.get(encoding)
+        if body is None:
+            # Two threads may compress it at the same time, both get the same bytes
+            body = self.encoded[encoding] = compress(self.body, encoding)
+        return body
+
+    def response(self, status: int = 200) -> Response:
+        """Response for the current request, compressed as the client accepts.
+
+        304 if the client copy is still valid.
+        """
+        encoding = negotiate(request.accept_encodings, len(self.body))
+        response = Response(self.body_for(encoding), status=status, mimetype=self.mimetype)
+        response.vary.add("Accept-Encoding")
+        if encoding is None:
+            response.set_etag(self.etag)
+        else:
+            # Every representation has its own strong ETag
+            response.headers["Content-Encoding"] = encoding
+            response.set_etag(f"{self.etag}-{encoding}")
+        response.last_modified = self.last_modified
+        # The page may be stored but has to be revalidated on every visit
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
+
+
+class PageCache():
+    """Rendered pages by key, e.g. (snapshot version, day). Keeps the newest max_entries."""
+
+    def __init__(self, max_entries: int = 4):
+        self.max_entries = max_entries
+        self._pages = OrderedDict()
+        self._lock = Lock()
+        self._flight = SingleFlight()
+        self.hits = 0
+        self.renders = 0
+
+    def get(self, key, render: Callable, last_modified: float) -> RenderedPage:
+        """Return the page of key, calling render() only if it is not cached.
+
+        Concurrent requests of a new key wait for a single render.
+        """
+        with self._lock:
+            page = self._pages.get(key)
+            if page is not None:
+                self.hits += 1
+                return page
+
+        def load():
+            page = RenderedPage.build(render(), last_modified)
+            with self._lock:
+                self.renders += 1
+                self._pages[key] = page
+                while len(self._pages) > self.max_entries:
+                    self._pages.popitem(last=False)
+            return page
+
+        return self._flight.do(key, load)
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
+
+    def stats(self) -> dict:
+        return dict(pages=len(self._pages), hits=self.hits, renders=self.renders,
+                    shared=self._flight.shared)
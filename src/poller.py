@@ -0,0 +1,107 @@
+# by Richi Rod AKA @richionline / falken20
+#
+# Background poller. Each upstream source is refreshed on its own interval in
+# a daemon thread and the results are published as one immutable snapshot, so
+# request handlers read data without waiting on the upstream APIs.
+
+import sys
+from dataclasses import dataclass, field
+from threading import Event, Lock, Thread
+from time import time
+from types import MappingProxyType
+from typing import Callable
+
+from src.logger import Log
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    """Immutable view of the latest data published by every source."""
+    version: int = 0
+    data: MappingProxyType = field(default_factory=lambda: MappingProxyType({}))
+    updated: MappingProxyType = field(default_factory=lambda: MappingProxyType({}))
+
+    def has(self, *names: str) -> bool:
+        """Return True when every named source has been published."""
+        return all(name in self.data for name in names)
+
+
+class Poller():
+    """Refresh registered sources in the background and publish snapshots."""
+
+    def __init__(self):
+        self._sources = {}  # name -> (fetch, interval)
+        self._threads = []
+        self._stop = Event()
+        self._publish_lock = Lock()
+        self.snapshot = Snapshot()
+
+    def add_source(self, name: str, fetch: Callable, interval: int):
+        """Register a source. fetch() must return the data, or a falsy value on failure."""
+        self._sources[name] = (fetch, interval)
+
+    @property
+    def sources(self) -> tuple:
+        return tuple(self._sources)
+
+    @property
+    def running(self) -> bool:
+        return any(thread.is_alive() for thread in self._threads)
+
+    def refresh(self, name: str) -> bool:
+        """Fetch one source now and publish it. Returns True if it was published."""
+        fetch, _ = self._sources[name]
+        try:
+            value = fetch()
+        except Exception as err:
+            Log.error(f"Error polling source {name}", err, sys)
+            return False
+
+        if not value:
+            Log.warning(f"Source {name} returned no data, keeping previous value")
+            return False
+
+        self.publish(name, value)
+        return True
+
+    def publish(self, name: str, value):
+        """Replace the current snapshot with a new one that includes value."""
+        with self._publish_lock:
+            current = self.snapshot
+            data = dict(current.data)
+            data[name] = value
+            updated = dict(current.updated)
+            updated[name] = time()
+            # Single attribute assignment, so readers never see a partial update
+            self.snapshot = Snapshot(version=current.version + 1,
+                                     data=MappingProxyType(data),
+                                     updated=MappingProxyType(updated))
+
+    def _run(self, name: str, interval: int):
+        while not self._stop.is_set():
+            self.refresh(name)
+            self._stop.wait(interval)
+
+    def start(self):
+        """Start one daemon thread per registered source."""
+        if self.running:
+            return
+        self._stop.clear()
+        self._threads = [
+            Thread(target=self._run, args=(name, interval), name=f"poller-{name}", daemon=True)
+            for name, (_, interval) in self._sources.items()
+        ]
+        for thread in self._threads:
+            thread.start()
+        Log.info(f"Poller started for sources: {', '.join(self._sources)}")
+
+    def stop(self, timeout: float = None):
+        """Signal every polling thread to finish and wait for them."""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+
+# Shared instance. Sources are registered in src/web.py.
+poller = Poller()
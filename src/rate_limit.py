@@ -0,0 +1,268 @@
+# by Richi Rod AKA @richionline / falken20
+#
+# Sliding window counter rate limiter. Each key keeps the request count of the
+# current and the previous fixed window; the count of the sliding window is
+# estimated by weighting the previous window with the part of it that still
+# overlaps. State and work per request are constant, whatever the limits are.
+# The in-memory backend splits the keys in lock-striped shards so threads
+# seldom contend; the SQLite backend shares the counters between processes.
+
+import sqlite3
+import sys
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from threading import Event, Lock, Thread, local
+from time import time
+
+from src.logger import Log
+
+
+class _Window():
+    """Counters of one key: window length, index of the current window and two counts."""
+
+    __slots__ = ("window", "index", "current", "previous")
+
+    def __init__(self, window: float, index: int):
+        self.window = window
+        self.index = index
+        self.current = 0
+        self.previous = 0
+
+
+class _Shard():
+    """Part of the keys with its own lock and LRU cap."""
+
+    __slots__ = ("windows", "lock", "max_keys")
+
+    def __init__(self, max_keys: int):
+        self.windows = OrderedDict()  # key -> _Window, least recently used first
+        self.lock = Lock()
+        self.max_keys = max_keys
+
+
+class RateLimitBackend(ABC):
+    """Storage of the rate limit counters.
+
+    Backends implement hit(), sweep(), clear(), __len__ and __contains__.
+    The background sweeper is shared by all of them.
+    """
+
+    def __init__(self):
+        self._stop = Event()
+        self._sweeper = None
+
+    @abstractmethod
+    def hit(self, key, limit: int, window: float, now: float) -> bool:
+        """Count a request for key. Returns False (and does not count it) over the limit."""
+
+    @abstractmethod
+    def sweep(self, now: float) -> int:
+        """Drop the expired counters. Returns how many keys were removed."""
+
+    @abstractmethod
+    def clear(self):
+        """Drop every counter."""
+
+    def _sweep_loop(self, interval: float):
+        while not self._stop.wait(interval):
+            try:
+                self.sweep(time())
+            except Exception as err:
+                Log.error("Error sweeping rate limit counters", err, sys)
+
+    def start_sweeper(self, interval: float = 60):
+        """Run sweep() every interval seconds in a daemon thread."""
+        if self._sweeper is not None and self._sweeper.is_alive():
+            return
+        self._stop.clear()
+        self._sweeper = Thread(target=self._sweep_loop, args=(interval,),
+                               name="rate-limit-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def stop_sweeper(self):
+        self._stop.set()
+
+
+def _advance(index: int, current: int, previous: int, new_index: int) -> tuple:
+    """Move the counters to new_index. Returns (current, previous)."""
+    if new_index == index:
+        return current, previous
+    # The current window becomes the previous one only if they are adjacent
+    return 0, current if new_index == index + 1 else 0
+
+
+class RateLimiter(RateLimitBackend):
+    """In-memory backend: per-key sliding window counters in lock-striped shards.
+
+    Keys are spread over the shards by hash, so concurrent requests of
+    different clients rarely wait on the same lock. Each shard evicts its
+    least recently used keys over its share of max_keys, and sweep() (run by
+    start_sweeper() in the background) drops keys whose counters expired.
+    """
+
+    def __init__(self, max_keys: int = 10000, shards: int = 16):
+        super().__init__()
+        self.max_keys = max_keys
+        per_shard = max(1, -(-max_keys // shards))
+        self._shards = tuple(_Shard(per_shard) for _ in range(shards))
+
+    def _shard(self, key) -> _Shard:
+        return self._shards[hash(key) % len(self._shards)]
+
+    def hit(self, key, limit: int, window: float, now: float) -> bool:
+        """Count a request for key. Returns False (and does not count it) over the limit.
+
+        Args:
+            key: Hashable client key, e.g. (ip, path)
+            limit (int): Requests allowed per window
+            window (float): Window length in seconds
+            now (float): Current time in seconds
+        """
+        index, elapsed = divmod(now, window)
+        index = int(index)
+        shard = self._shard(key)
+        with shard.lock:
+            windows = shard.windows
+            state = windows.get(key)
+            if state is None:
+                state = windows[key] = _Window(window, index)
+                while len(windows) > shard.max_keys:
+                    windows.popitem(last=False)
+            else:
+                windows.move_to_end(key)
+
+            if index < state.index:
+                # time() was read before the lock: a late request is counted in the newest window
+                index, elapsed = state.index, 0.0
+            if index != state.index:
+                state.current, state.previous = _advance(state.index, state.current, state.previous, index)
+                state.index = index
+
+            estimate = state.previous * (1 - elapsed / window) + state.current
+            if estimate + 1 > limit:
+                return False
+            state.current += 1
+            return True
+
+    def sweep(self, now: float) -> int:
+        """Drop the keys whose counters no longer count (two windows old). Returns how many."""
+        removed = 0
+        for shard in self._shards:
+            with shard.lock:
+                expired = [key for key, state in shard.windows.items()
+                           if now >= (state.index + 2) * state.window]
+                for key in expired:
+                    del shard.windows[key]
+            removed += len(expired)
+        return removed
+
+    def __len__(self) -> int:
+        return sum(len(shard.windows) for shard in self._shards)
+
+    def __contains__(self, key) -> bool:
+        return key in self._shard(key).windows
+
+    def clear(self):
+        for shard in self._shards:
+            with shard.lock:
+                shard.windows.clear()
+
+
+class SQLiteRateLimiter(RateLimitBackend):
+    """Shared backend: counters in a SQLite file in WAL mode.
+
+    Every process (gunicorn worker, or instance sharing the file) that opens
+    the same path shares the counters, so a client gets the configured limit
+    once and not once per process. Each hit is a BEGIN IMMEDIATE transaction,
+    which makes the read-modify-write atomic across processes. If the file
+    can not be used the request is allowed (fail open) and the error logged.
+    """
+
+    def __init__(self, path: str, max_keys: int = 10000, busy_timeout: float = 1.0):
+        super().__init__()
+        self.path = path
+        self.max_keys = max_keys
+        self.busy_timeout = busy_timeout
+        self._local = local()
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rate_limits ("
+                "key TEXT PRIMARY KEY, window REAL NOT NULL, window_index INTEGER NOT NULL, "
+                "current INTEGER NOT NULL, previous INTEGER NOT NULL, updated REAL NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS rate_limits_updated ON rate_limits (updated)")
+
+    def _connection(self) -> sqlite3.Connection:
+        """Connection of the calling thread (sqlite3 connections are not shared)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _key(key) -> str:
+        return "|".join(map(str, key)) if isinstance(key, tuple) else str(key)
+
+    def hit(self, key, limit: int, window: float, now: float) -> bool:
+        """Count a request for key. Returns False (and does not count it) over the limit."""
+        index, elapsed = divmod(now, window)
+        index = int(index)
+        key = self._key(key)
+        try:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT window_index, current, previous FROM rate_limits WHERE key = ?",
+                                   (key,)).fetchone()
+                if row and row[0] > index:
+                    # now was read before BEGIN IMMEDIATE: a late request is counted in the newest window
+                    index, elapsed = row[0], 0.0
+                current, previous = _advance(*row, index) if row else (0, 0)
+                allowed = previous * (1 - elapsed / window) + current + 1 <= limit
+                if allowed:
+                    current += 1
+                conn.execute("INSERT OR REPLACE INTO rate_limits VALUES (?, ?, ?, ?, ?, ?)",
+                             (key, window, index, current, previous, now))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            return allowed
+        except sqlite3.Error as err:
+            Log.error("Rate limit store not available, request allowed", err, sys)
+            return True
+
+    def sweep(self, now: float) -> int:
+        """Drop expired counters and the least recently used keys over max_keys."""
+        conn = self._connection()
+        removed = conn.execute("DELETE FROM rate_limits WHERE ? >= (window_index + 2) * window", (now,)).rowcount
+        removed += conn.execute(
+            "DELETE FROM rate_limits WHERE key IN (SELECT key FROM rate_limits ORDER BY updated DESC "
+            "LIMIT -1 OFFSET ?)", (self.max_keys,)).rowcount
+        return removed
+
+    def clear(self):
+        self._connection().execute("DELETE FROM rate_limits")
+
+    def __len__(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM rate_limits").fetchone()[0]
+
+    def __contains__(self, key) -> bool:
+        return self._connection().execute(
+            "SELECT 1 FROM rate_limits WHERE key = ?", (self._key(key),)).fetchone() is not None
+
+
+def create_rate_limiter(backend: str = "memory", max_keys: int = 10000, shards: int = 16,
+                        path: str = None) -> RateLimitBackend:
+    """Build the rate limit backend by name: 'memory' (per process) or 'sqlite' (shared file)
+
+    Raises:
+        ValueError: For an unknown backend name.
+    """
+    if backend == "memory":
+        return RateLimiter(max_keys=max_keys, shards=shards)
+    if backend == "sqlite":
+        return SQLiteRateLimiter(path, max_keys=max_keys)
+    raise ValueError(f"Unknown rate limit backend: {backend}")
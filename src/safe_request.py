@@ -3,11 +3,159 @@
 # Módulo reutilizable de protección DNS/SSRF para peticiones HTTP salientes.
 # Úsalo en cualquier proyecto importando validate_safe_url y safe_get.
 
+import os
 import socket
 import ipaddress
+from collections import OrderedDict, deque
+from http.cookiejar import DefaultCookiePolicy
+from threading import Lock, local
+from time import monotonic
 from urllib.parse import urlparse
 
 import requests
+from requests.adapters import HTTPAdapter
+
+
+# Keep-alive pool settings. One session per host; each session keeps up to
+# POOL_MAXSIZE open connections and is closed after POOL_IDLE_SECONDS unused.
+POOL_CONNECTIONS = int(os.environ.get("HTTP_POOL_CONNECTIONS", "2"))
+POOL_MAXSIZE = int(os.environ.get("HTTP_POOL_MAXSIZE", "4"))
+POOL_IDLE_SECONDS = int(os.environ.get("HTTP_POOL_IDLE_SECONDS", "300"))
+
+_sessions = {}  # host -> (session, last_used)
+_sessions_lock = Lock()
+
+# Bounded TTL cache of validated (public-only) DNS answers. getaddrinfo does
+# not expose record TTLs, so a fixed lifetime is used.
+DNS_CACHE_TTL = int(os.environ.get("DNS_CACHE_TTL", "300"))
+DNS_CACHE_MAX_HOSTS = int(os.environ.get("DNS_CACHE_MAX_HOSTS", "64"))
+
+_dns_cache = OrderedDict()  # host -> (ips, expires_at)
+_dns_cache_lock = Lock()
+
+# An IP that failed to connect is tried after the other IPs of its host for
+# this many seconds.
+FAILED_IP_SECONDS = int(os.environ.get("HTTP_FAILED_IP_SECONDS", "60"))
+
+# Per-host circuit breakers. A host whose last BREAKER_WINDOW calls failed at
+# BREAKER_FAILURE_RATE or more (with at least BREAKER_MIN_CALLS calls) is not
+# called for BREAKER_RESET_SECONDS, then a single probe decides if it is back.
+BREAKER_WINDOW = int(os.environ.get("BREAKER_WINDOW", "10"))
+BREAKER_MIN_CALLS = int(os.environ.get("BREAKER_MIN_CALLS", "5"))
+BREAKER_FAILURE_RATE = float(os.environ.get("BREAKER_FAILURE_RATE", "0.5"))
+BREAKER_RESET_SECONDS = float(os.environ.get("BREAKER_RESET_SECONDS", "30"))
+
+_breakers = {}  # host -> CircuitBreaker
+_breakers_lock = Lock()
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """Raised by safe_get, without any network call, while a host circuit is open."""
+
+
+class CircuitBreaker():
+    """Failure-rate circuit breaker of one host.
+
+    closed: calls go through and their outcomes are tracked.
+    open: calls fail at once until reset_seconds have passed.
+    half_open: one probe call goes through; success closes the circuit,
+    failure opens it again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, host: str, window: int = BREAKER_WINDOW, min_calls: int = BREAKER_MIN_CALLS,
+                 failure_rate: float = BREAKER_FAILURE_RATE, reset_seconds: float = BREAKER_RESET_SECONDS):
+        self.host = host
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.reset_seconds = reset_seconds
+        self._outcomes = deque(maxlen=window)  # True for each failed call
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._probing = False
+        self._rejected = 0
+        self._lock = Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._check_reset(monotonic())
+            return self._state
+
+    def _check_reset(self, now: float):
+        if self._state == self.OPEN and now - self._opened_at >= self.reset_seconds:
+            self._state = self.HALF_OPEN
+            self._probing = False
+
+    def allow(self) -> bool:
+        """Return True if a call may go to the host now."""
+        with self._lock:
+            self._check_reset(monotonic())
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            self._rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self._state != self.CLOSED:
+                self._state = self.CLOSED
+                self._outcomes.clear()
+                self._probing = False
+            self._outcomes.append(False)
+
+    def record_failure(self):
+        with self._lock:
+            self._outcomes.append(True)
+            failures = sum(self._outcomes)
+            if self._state == self.HALF_OPEN or (
+                    len(self._outcomes) >= self.min_calls
+                    and failures / len(self._outcomes) >= self.failure_rate):
+                self._state = self.OPEN
+                self._opened_at = monotonic()
+                self._probing = False
+
+    def abort(self):
+        """Give back a probe that never reached the host (e.g. invalid URL)."""
+        with self._lock:
+            self._probing = False
+
+    def stats(self) -> dict:
+        """Return the state, recent calls/failures and fast-failed calls."""
+        with self._lock:
+            now = monotonic()
+            self._check_reset(now)
+            retry_in = max(0.0, self._opened_at + self.reset_seconds - now) if self._state == self.OPEN else 0.0
+            return dict(state=self._state, calls=len(self._outcomes), failures=sum(self._outcomes),
+                        rejected=self._rejected, retry_in=round(retry_in, 1))
+
+
+def get_breaker(host: str) -> CircuitBreaker:
+    """Return the circuit breaker of a host, creating it if needed."""
+    with _breakers_lock:
+        breaker = _breakers.get(host)
+        if breaker is None:
+            breaker = _breakers[host] = CircuitBreaker(host)
+        return breaker
+
+
+def breaker_states() -> dict:
+    """Return {host: breaker stats} for every host called so far."""
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {breaker.host: breaker.stats() for breaker in breakers}
+
+
+def reset_breakers():
+    """Forget every circuit breaker (e.g. between tests)."""
+    with _breakers_lock:
+        _breakers.clear()
 
 
 def is_public_ip(ip_str: str) -> bool:
@@ -30,6 +178,7 @@ def validate_safe_url(url: str, allowed_hosts: set):
       - Scheme is HTTPS.
       - Host is in the allowed_hosts set.
       - All DNS-resolved IPs are public (not private/loopback/link-local).
+        Answers come from the DNS cache when still fresh.
 
     Args:
         url: The full URL to validate.
@@ -50,6 +199,25 @@ def validate_safe_url(url: str, allowed_hosts: set):
     if host not in allowed_hosts:
         raise ValueError(f"Host not allowed: {host}")
 
+    resolve_public_ips(host)
+
+
+def resolve_public_ips(host: str) -> tuple:
+    """Resolve a host and return its IPs, all of them checked to be public.
+
+    Answers are kept in a bounded TTL cache, so a warm host needs no lookup.
+    Only fully validated answers are cached.
+
+    Raises:
+        ValueError: If there are no records or any of them is not public.
+    """
+    now = monotonic()
+    with _dns_cache_lock:
+        entry = _dns_cache.pop(host, None)
+        if entry and entry[1] > now:
+            _dns_cache[host] = entry
+            return entry[0]
+
     # Check all DNS answers to reduce DNS rebinding/poisoning impact.
     resolved_ips = {
         addr_info[4][0]
@@ -62,14 +230,139 @@ def validate_safe_url(url: str, allowed_hosts: set):
         if not is_public_ip(ip):
             raise ValueError(f"Host resolves to non-public IP: {ip}")
 
+    ips = tuple(sorted(resolved_ips))
+    with _dns_cache_lock:
+        _dns_cache[host] = (ips, now + DNS_CACHE_TTL)
+        _dns_cache.move_to_end(host)
+        while len(_dns_cache) > DNS_CACHE_MAX_HOSTS:
+            _dns_cache.popitem(last=False)
+    return ips
+
+
+def clear_dns_cache():
+    """Drop every cached DNS answer."""
+    with _dns_cache_lock:
+        _dns_cache.clear()
+
+
+class PinnedIPAdapter(HTTPAdapter):
+    """HTTPS adapter that connects to the validated IPs of the host.
+
+    The connection goes to an IP returned by resolve_public_ips, while TLS
+    SNI, certificate checks and the Host header still use the hostname. This
+    way the IP that passed the SSRF check is the one actually used. Like
+    urllib3 does with the getaddrinfo answers, a connection error moves on to
+    the next IP; IPs that failed recently are tried last.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._pinned = local()  # IP of the attempt in progress in this thread
+        self._failed = {}  # ip -> monotonic time until it is tried last
+        self._failed_lock = Lock()
+
+    def ordered_ips(self, host: str) -> list:
+        """Validated IPs of host, the ones that failed recently at the end"""
+        now = monotonic()
+        with self._failed_lock:
+            failed = {ip for ip, until in self._failed.items() if until > now}
+        ips = resolve_public_ips(host)
+        return [ip for ip in ips if ip not in failed] + [ip for ip in ips if ip in failed]
+
+    def _pinned_pool(self, host: str, port: int, pool_kwargs: dict = None):
+        """Connection pool to the IP of the attempt in progress (the first validated IP otherwise)"""
+        ip = getattr(self._pinned, "ip", None) or resolve_public_ips(host)[0]
+        return self.poolmanager.connection_from_host(
+            ip, port=port or 443, scheme="https",
+            pool_kwargs=dict(pool_kwargs or {}, server_hostname=host, assert_hostname=host))
+
+    def get_connection(self, url, proxies=None):
+        if proxies and any(proxies.values()):
+            return super().get_connection(url, proxies)
+        parsed_url = urlparse(url)
+        return self._pinned_pool(parsed_url.hostname, parsed_url.port)
 
-def safe_get(url: str, allowed_hosts: set, timeout: int = 10) -> requests.Response:
+    def get_connection_with_tls_context(self, request, verify, proxies=None, cert=None):
+        """Used by send() instead of get_connection() since requests 2.32"""
+        if proxies and any(proxies.values()):
+            return super().get_connection_with_tls_context(request, verify, proxies=proxies, cert=cert)
+        host_params, pool_kwargs = self.build_connection_pool_key_attributes(request, verify, cert)
+        return self._pinned_pool(host_params["host"], host_params["port"], pool_kwargs)
+
+    def send(self, request, **kwargs):
+        proxies = kwargs.get("proxies")
+        if proxies and any(proxies.values()):
+            return super().send(request, **kwargs)
+        ips = self.ordered_ips(urlparse(request.url).hostname)
+        try:
+            for attempt, ip in enumerate(ips, start=1):
+                self._pinned.ip = ip
+                try:
+                    return super().send(request, **kwargs)
+                except requests.ConnectionError:
+                    now = monotonic()
+                    with self._failed_lock:
+                        self._failed = {key: until for key, until in self._failed.items() if until > now}
+                        self._failed[ip] = now + FAILED_IP_SECONDS
+                    if attempt == len(ips):
+                        raise
+        finally:
+            self._pinned.ip = None
+
+    def add_headers(self, request, **kwargs):
+        request.headers["Host"] = urlparse(request.url).netloc
+
+
+def _new_session() -> requests.Session:
+    """Build a pooled session that behaves like a bare requests.get call."""
+    session = requests.Session()
+    adapter = PinnedIPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE)
+    # Only HTTPS is ever requested (validate_safe_url), so only mount that.
+    session.mount("https://", adapter)
+    # Do not carry cookies from one call to the next.
+    session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+    return session
+
+
+def _evict_idle_sessions(now: float):
+    """Close sessions that have not been used for POOL_IDLE_SECONDS. Caller holds the lock."""
+    for host, (session, last_used) in list(_sessions.items()):
+        if now - last_used > POOL_IDLE_SECONDS:
+            del _sessions[host]
+            session.close()
+
+
+def get_session(host: str) -> requests.Session:
+    """Return the keep-alive session for a host, creating it if needed."""
+    now = monotonic()
+    with _sessions_lock:
+        _evict_idle_sessions(now)
+        entry = _sessions.get(host)
+        session = entry[0] if entry else _new_session()
+        _sessions[host] = (session, now)
+        return session
+
+
+def close_sessions():
+    """Close every pooled session (e.g. on shutdown or between tests)."""
+    with _sessions_lock:
+        for session, _ in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+
+def safe_get(url: str, allowed_hosts: set, timeout=10, stream: bool = False) -> requests.Response:
     """Perform a validated GET request with DNS/SSRF protections.
 
+    The request goes through a pooled keep-alive session for the host, so
+    repeated calls reuse the TCP/TLS connection. Redirects are never followed.
+
     Args:
         url: The full URL to fetch.
         allowed_hosts: Set of permitted hostnames.
-        timeout: Request timeout in seconds (default 10).
+        timeout: Request timeout in seconds, or a (connect, read) tuple (default 10).
+        stream: Do not download the body until it is read (default False).
+            The caller must then read or close the response.
 
     Returns:
         requests.Response object.
@@ -77,6 +370,33 @@ def safe_get(url: str, allowed_hosts: set, timeout: int = 10) -> requests.Respon
     Raises:
         ValueError: If the URL fails safety validation.
         requests.RequestException: On network/HTTP errors.
+        CircuitOpenError: If the host circuit is open (see CircuitBreaker).
     """
-    validate_safe_url(url, allowed_hosts)
-    return requests.get(url, timeout=timeout, allow_redirects=False)
+    host = urlparse(url).hostname
+    breaker = get_breaker(host)
+    if not breaker.allow():
+        raise CircuitOpenError(f"Circuit open for host: {host}")
+
+    try:
+        validate_safe_url(url, allowed_hosts)
+        session = get_session(host)
+        response = session.get(url, timeout=timeout, allow_redirects=False, stream=stream)
+    except ValueError:
+        # Rejected before reaching the host, it says nothing about its health
+        breaker.abort()
+        raise
+    except OSError:
+        # DNS, connection and timeout errors (requests errors are OSErrors too)
+        breaker.record_failure()
+        raise
+    except Exception:
+        # Any other error must still give back the half-open probe,
+        # otherwise the host would be rejected forever
+        breaker.abort()
+        raise
+
+    if response.status_code >= 500:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+    return response
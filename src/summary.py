@@ -0,0 +1,110 @@
+# by Richi Rod AKA @richionline / falken20
+#
+# Summary engine for the EcoWitt history. Every metric is reduced once over its
+# shared TimeSeries buffer to a dict of statistics, and each metric spec picks
+# the statistics it shows (or derives its own value, e.g. rainfall).
+
+from dataclasses import dataclass
+from typing import Callable
+
+from src.timeseries import as_time_series
+
+# Statistics available in a stats dict
+STATS = ("min", "max", "mean", "sum", "count", "first", "last")
+
+
+@dataclass(frozen=True)
+class MetricSpec:
+    """How to summarize one metric of the EcoWitt history.
+
+    path: keys of the metric inside the response "data" object
+    stats: statistics returned for the metric
+    percentiles: percentiles (0-100) returned as "p<n>"
+    reduce: optional function that turns the stats dict into the final value
+    """
+    path: tuple
+    stats: tuple = ("min", "max", "mean")
+    percentiles: tuple = ()
+    reduce: Callable = None
+
+
+# Metrics shown in the month/year summaries
+SUMMARY_SPECS = {
+    "temperature": MetricSpec(("outdoor", "temperature")),
+    "wind": MetricSpec(("wind", "wind_speed")),
+    "humidity": MetricSpec(("outdoor", "humidity")),
+    "pressure": MetricSpec(("pressure", "relative")),
+    "uvi": MetricSpec(("solar_and_uvi", "uvi")),
+    # The yearly rain counter only grows, the rain of the range is max - min
+    "rainfall": MetricSpec(("rainfall", "yearly"), stats=("min", "max"),
+                           reduce=lambda stats: stats["max"] - stats["min"]),
+}
+
+
+def percentile(sorted_values, rank: float) -> float:
+    """Linear interpolation percentile of already sorted values (rank 0-100)"""
+    position = (len(sorted_values) - 1) * rank / 100
+    low = int(position)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (position - low)
+
+
+def series_stats(values, percentiles: tuple = ()) -> dict:
+    """Compute every statistic of a value buffer.
+
+    The reductions run as C loops of the builtins over the array buffer,
+    without copying it. Only percentiles need a sorted copy.
+
+    Returns:
+        dict: Statistics in STATS plus "p<n>" for each percentile, {} if empty
+    """
+    count = len(values)
+    if not count:
+        return {}
+    total = sum(values)
+    stats = dict(min=min(values), max=max(values), mean=total / count, sum=total,
+                 count=count, first=values[0], last=values[-1])
+    if percentiles:
+        sorted_values = sorted(values)
+        for rank in percentiles:
+            stats[f"p{rank:g}"] = percentile(sorted_values, rank)
+    return stats
+
+
+def apply_spec(spec: MetricSpec, stats: dict):
+    """Turn a stats dict into the value shown for a metric, '-' without data"""
+    if not stats:
+        return "-"
+    if spec.reduce is not None:
+        return spec.reduce(stats)
+    keys = spec.stats + tuple(f"p{rank:g}" for rank in spec.percentiles)
+    return {key: stats[key] for key in keys if key in stats}
+
+
+def get_series(data: dict, path: tuple):
+    """Return the series of a metric in an EcoWitt response, None if it is missing"""
+    try:
+        node = data["data"]
+        for key in path:
+            node = node[key]
+        return as_time_series(node["list"])
+    except (KeyError, TypeError):
+        return None
+
+
+def summarize(data: dict, specs: dict = SUMMARY_SPECS) -> dict:
+    """Summarize every metric of an EcoWitt history response.
+
+    Args:
+        data (dict): EcoWitt history response
+        specs (dict): Metric name -> MetricSpec
+
+    Returns:
+        dict: Metric name -> summary value, '-' for metrics without data
+    """
+    summary = {}
+    for name, spec in specs.items():
+        series = get_series(data, spec.path)
+        stats = series_stats(series.values, spec.percentiles) if series is not None else {}
+        summary[name] = apply_spec(spec, stats)
+    return summary
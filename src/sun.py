@@ -0,0 +1,179 @@
+# by Richi Rod AKA @richionline / falken20
+#
+# Local sunrise/sunset engine with the NOAA solar calculator equations
+# (https://gml.noaa.gov/grad/solcalc/calcdetails.html). It replaces the
+# sunrise-sunset.org API: the times of a whole year are computed at once and
+# kept in memory, so no page build waits on the network for them.
+
+import calendar
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+from functools import lru_cache
+from math import acos, asin, cos, degrees, radians, sin, tan
+
+from src.config import STATION_LATITUDE, STATION_LONGITUDE, STATION_TZ
+
+# Sun zenith angle (degrees) of each event. Sunrise/sunset include the
+# atmospheric refraction and the radius of the solar disc.
+ZENITH_SUNRISE = 90.833
+ZENITH_CIVIL = 96.0
+ZENITH_NAUTICAL = 102.0
+ZENITH_ASTRONOMICAL = 108.0
+
+_J2000 = 2451545.0
+
+
+@dataclass(frozen=True)
+class SunTimes:
+    """Sun events of one day in local time. None when the event does not happen
+    (polar day or night)."""
+    day: date
+    sunrise: datetime
+    sunset: datetime
+    solar_noon: datetime
+    civil_twilight_begin: datetime
+    civil_twilight_end: datetime
+    nautical_twilight_begin: datetime
+    nautical_twilight_end: datetime
+    astronomical_twilight_begin: datetime
+    astronomical_twilight_end: datetime
+
+    @property
+    def day_length(self) -> timedelta:
+        """Time between sunrise and sunset, None without both events"""
+        if self.sunrise is None or self.sunset is None:
+            return None
+        return self.sunset - self.sunrise
+
+
+def _solar_position(julian_day: float) -> tuple:
+    """Return (declination in radians, equation of time in minutes) at a Julian day"""
+    jc = (julian_day - _J2000) / 36525
+    mean_long = (280.46646 + jc * (36000.76983 + jc * 0.0003032)) % 360
+    mean_anomaly = radians(357.52911 + jc * (35999.05029 - 0.0001537 * jc))
+    eccentricity = 0.016708634 - jc * (0.000042037 + 0.0000001267 * jc)
+    center = (sin(mean_anomaly) * (1.914602 - jc * (0.004817 + 0.000014 * jc))
+              + sin(2 * mean_anomaly) * (0.019993 - 0.000101 * jc)
+              + sin(3 * mean_anomaly) * 0.000289)
+    omega = radians(125.04 - 1934.136 * jc)
+    apparent_long = radians(mean_long + center - 0.00569 - 0.00478 * sin(omega))
+    mean_obliquity = 23 + (26 + (21.448 - jc * (46.815 + jc * (0.00059 - jc * 0.001813))) / 60) / 60
+    obliquity = radians(mean_obliquity + 0.00256 * cos(omega))
+
+    declination = asin(sin(obliquity) * sin(apparent_long))
+    y = tan(obliquity / 2) ** 2
+    long_rad = radians(mean_long)
+    eq_time = 4 * degrees(
+        y * sin(2 * long_rad) - 2 * eccentricity * sin(mean_anomaly)
+        + 4 * eccentricity * y * sin(mean_anomaly) * cos(2 * long_rad)
+        - 0.5 * y * y * sin(4 * long_rad) - 1.25 * eccentricity * eccentricity * sin(2 * mean_anomaly))
+    return declination, eq_time
+
+
+def _julian_day(day: date, minutes: float) -> float:
+    """Julian day of a UTC date plus minutes after midnight"""
+    return day.toordinal() + 1721424.5 + minutes / 1440
+
+
+def _event_minutes(day: date, latitude: float, longitude: float, zenith: float, rising: bool):
+    """Minutes after UTC midnight of a sun event, None if the sun never gets there.
+
+    The solar position is computed at solar noon first and then again at the
+    estimated event time, which keeps the error below a minute.
+    """
+    minutes = 720 - 4 * longitude
+    for _ in range(2):
+        declination, eq_time = _solar_position(_julian_day(day, minutes))
+        lat = radians(latitude)
+        cos_hour_angle = cos(radians(zenith)) / (cos(lat) * cos(declination)) - tan(lat) * tan(declination)
+        if not -1 <= cos_hour_angle <= 1:
+            return None
+        hour_angle = degrees(acos(cos_hour_angle))
+        noon = 720 - 4 * longitude - eq_time
+        minutes = noon - 4 * hour_angle if rising else noon + 4 * hour_angle
+    return minutes
+
+
+def _solar_noon_minutes(day: date, longitude: float) -> float:
+    minutes = 720 - 4 * longitude
+    for _ in range(2):
+        _, eq_time = _solar_position(_julian_day(day, minutes))
+        minutes = 720 - 4 * longitude - eq_time
+    return minutes
+
+
+def _to_local(day: date, minutes, tzinfo):
+    if minutes is None:
+        return None
+    utc = datetime(day.year, day.month, day.day, tzinfo=timezone.utc) + timedelta(minutes=minutes)
+    return utc.astimezone(tzinfo)
+
+
+def sun_times(day: date, latitude: float = STATION_LATITUDE, longitude: float = STATION_LONGITUDE,
+              tzinfo=STATION_TZ) -> SunTimes:
+    """Compute the sun events of a day.
+
+    Args:
+        day (date): Day
+        latitude (float): Degrees, north positive
+        longitude (float): Degrees, east positive
+        tzinfo: Time zone of the returned times
+
+    Returns:
+        SunTimes: Events in local time
+    """
+    def event(zenith, rising):
+        return _to_local(day, _event_minutes(day, latitude, longitude, zenith, rising), tzinfo)
+
+    return SunTimes(
+        day=day,
+        sunrise=event(ZENITH_SUNRISE, True),
+        sunset=event(ZENITH_SUNRISE, False),
+        solar_noon=_to_local(day, _solar_noon_minutes(day, longitude), tzinfo),
+        civil_twilight_begin=event(ZENITH_CIVIL, True),
+        civil_twilight_end=event(ZENITH_CIVIL, False),
+        nautical_twilight_begin=event(ZENITH_NAUTICAL, True),
+        nautical_twilight_end=event(ZENITH_NAUTICAL, False),
+        astronomical_twilight_begin=event(ZENITH_ASTRONOMICAL, True),
+        astronomical_twilight_end=event(ZENITH_ASTRONOMICAL, False),
+    )
+
+
+@lru_cache(maxsize=4)
+def year_table(year: int, latitude: float = STATION_LATITUDE, longitude: float = STATION_LONGITUDE,
+               tzinfo=STATION_TZ) -> dict:
+    """Sun times of every day of a year, {'YYYYMMDD': SunTimes}. Cached per year and place."""
+    first = date(year, 1, 1)
+    days = 366 if calendar.isleap(year) else 365
+    table = {}
+    for offset in range(days):
+        day = first + timedelta(days=offset)
+        # isoformat() zero pads the year, strftime("%Y") does not below 1000
+        table[day.isoformat().replace("-", "")] = sun_times(day, latitude, longitude, tzinfo)
+    return table
+
+
+def get_sun_times(day: str) -> SunTimes:
+    """Sun times of the station for a day 'YYYYMMDD', read from the year table"""
+    return year_table(int(day[:4]))[day]
+
+
+def format_sun_times(times: SunTimes) -> dict:
+    """Sun times as 'HH:MM:SS' strings with the sunrise-sunset.org result keys, '-' if missing"""
+    def clock(value):
+        return value.strftime("%H:%M:%S") if value is not None else "-"
+
+    day_length = times.day_length
+    return dict(
+        date=times.day.isoformat(),
+        sunrise=clock(times.sunrise),
+        sunset=clock(times.sunset),
+        solar_noon=clock(times.solar_noon),
+        day_length=str(day_length).split(".")[0] if day_length is not None else "-",
+        civil_twilight_begin=clock(times.civil_twilight_begin),
+        civil_twilight_end=clock(times.civil_twilight_end),
+        nautical_twilight_begin=clock(times.nautical_twilight_begin),
+        nautical_twilight_end=clock(times.nautical_twilight_end),
+        astronomical_twilight_begin=clock(times.astronomical_twilight_begin),
+        astronomical_twilight_end=clock(times.astronomical_twilight_end),
+    )
@@ -0,0 +1,91 @@
+# by Richi Rod AKA @richionline / falken20
+#
+# Compact time series for the EcoWitt history. The API returns every metric as
+# a dict of {"epoch": "value"} strings; here they are converted once into two
+# typed arrays (int64 timestamps, float64 values).
+
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timedelta
+
+
+class TimeSeries():
+    """Sorted timestamps and values stored in array buffers."""
+
+    __slots__ = ("timestamps", "values")
+
+    def __init__(self, timestamps=(), values=()):
+        self.timestamps = array('q', timestamps)
+        self.values = array('d', values)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "TimeSeries":
+        """Build a series from an EcoWitt {"epoch": "value"} dict.
+
+        Values that are not numbers (e.g. "-") are skipped.
+        """
+        points = []
+        for timestamp, value in data.items():
+            try:
+                points.append((int(timestamp), float(value)))
+            except (TypeError, ValueError):
+                continue
+        points.sort()
+        return cls((point[0] for point in points), (point[1] for point in points))
+
+    def append(self, timestamp: int, value: float):
+        """Add one point at the end. Call sort() afterwards if they may be unordered."""
+        self.timestamps.append(timestamp)
+        self.values.append(value)
+
+    def sort(self):
+        """Order the points by timestamp (no-op when already sorted)"""
+        timestamps = self.timestamps
+        if all(timestamps[i] <= timestamps[i + 1] for i in range(len(timestamps) - 1)):
+            return
+        points = sorted(zip(timestamps, self.values))
+        self.timestamps = array('q', (point[0] for point in points))
+        self.values = array('d', (point[1] for point in points))
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def __repr__(self) -> str:
+        return f"TimeSeries({len(self)} points)"
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, TimeSeries) and \
+            self.timestamps == other.timestamps and self.values == other.values
+
+    def slice(self, start: int, end: int) -> "TimeSeries":
+        """Return the points between both indexes, sharing no memory with this series"""
+        series = TimeSeries()
+        series.timestamps = self.timestamps[start:end]
+        series.values = self.values[start:end]
+        return series
+
+    def min(self) -> float:
+        return min(self.values)
+
+    def max(self) -> float:
+        return max(self.values)
+
+    def split_days(self, tzinfo):
+        """Yield (day 'YYYYMMDD', start, end) index ranges for each local day.
+
+        Day boundaries are found with a binary search on the timestamps, so
+        only one datetime is built per day instead of one per point.
+        """
+        start = 0
+        count = len(self.timestamps)
+        while start < count:
+            local = datetime.fromtimestamp(self.timestamps[start], tzinfo)
+            next_day = (local + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+            end = bisect_left(self.timestamps, int(next_day.timestamp()), start, count)
+            yield local.strftime("%Y%m%d"), start, end
+            start = end
+
+
+def as_time_series(data) -> TimeSeries:
+    """Return data as a TimeSeries, converting it if it is still an EcoWitt dict"""
+    return data if isinstance(data, TimeSeries) else TimeSeries.from_dict(data)
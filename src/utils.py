@@ -4,10 +4,16 @@ from dateutil import tz
 from functools import lru_cache, wraps
 from datetime import datetime, timedelta, timezone
 
-from src.logger import Log
-from .weather import get_summary_data
+from src.logger import Log, pipeline
+from src.timeseries import TimeSeries
+from .weather import api_cache, summary_cache
+from .safe_request import breaker_states
 
-previous_cache = datetime.now()
+
+@lru_cache(maxsize=32)
+def get_zone(name: str):
+    """Return the tzinfo of a zone name, looked up only once per name"""
+    return tz.gettz(name)
 
 
 def convert_date(date: str, from_zone: str = "UTC", to_zone: str = "Europe/Madrid",
@@ -23,20 +29,22 @@ def convert_date(date: str, from_zone: str = "UTC", to_zone: str = "Europe/Madri
     Returns:
         str: Date transformed
     """
-    Log.info(
-        f"Method to transform the date {date} from {from_zone} to {to_zone}.")
+    # strptime keeps the compiled format, the zones come from get_zone()
+    date = datetime.strptime(date, format_date)
+    # Set date to the origin time zone and convert it
+    return date.replace(tzinfo=get_zone(from_zone)).astimezone(get_zone(to_zone))
 
-    from_zone = tz.gettz(from_zone)
-    to_zone = tz.gettz(to_zone)
 
-    date = datetime.strptime(date, format_date)
-    # Set date to UTC
-    date = date.replace(tzinfo=from_zone)
-    # Convert to time zone
-    date = date.astimezone(to_zone)
-    Log.info(f"Date tranformed: {date}")
+def local_days(timestamps, to_zone: str = "Europe/Madrid") -> list:
+    """Return the local day 'YYYYMMDD' of every epoch timestamp (sorted ascending).
 
-    return date
+    Built on TimeSeries.split_days, so only one datetime is built per day
+    and not one per timestamp.
+    """
+    days = []
+    for day, start, end in TimeSeries(timestamps).split_days(get_zone(to_zone)):
+        days.extend([day] * (end - start))
+    return days
 
 
 # New decorator that extends @lru_cache. If the caller tries to access an item that’s past its lifetime,
@@ -60,22 +68,16 @@ def timed_lru_cache(seconds: int, maxsize: int = 128):
     return wrapper_cache
 
 
-def check_cache(minutes: int = 60):
+def check_cache():
     # Cache info:
-    # hits is the number of calls that @lru_cache returned directly from memory because they existed in the cache.
+    # hits is the number of calls returned directly from memory because they existed in the cache.
     # misses is the number of calls that didn’t come from memory and were computed.
-    # maxsize is the size of the cache as you defined it with the maxsize attribute of the decorator.
-    # currsize  is the current size of the cache.
-    global previous_cache
-    Log.info(f"CACHE: {get_summary_data.cache_info()}", style="yelloW")
-    Log.info(
-        f"Checking expiration time for cache({minutes=})...", style="yellow")
-    Log.debug(f"Previous cache: {previous_cache}", style="yellow")
-    Log.debug(f"Current time: {datetime.now()}", style="yellow")
-    difference = (datetime.now() - previous_cache).seconds / 60
-    Log.info(f"Cache span: {int(difference)} minutes", style="yellow")
-    if difference > minutes:
-        Log.info("Cleaning cache by expiration...", style="yellow")
-        get_summary_data.cache_clear()
-        previous_cache = datetime.now()
-        Log.info(f"CACHE: {get_summary_data.cache_info()}", style="yellow")
+    # stale is the number of calls served with an old value while it was reloaded.
+    # shared is the number of calls that waited for the same load of another call.
+    # Entries expire by themselves (see API_CACHE_POLICIES and get_range_summary).
+    Log.info(f"API CACHE: {api_cache.stats()}", style="yellow")
+    Log.info(f"SUMMARY CACHE: {summary_cache.stats()}", style="yellow")
+    # Circuit breaker of every upstream host (closed, open or half_open)
+    Log.info(f"CIRCUIT BREAKERS: {breaker_states()}", style="yellow")
+    # Log records waiting to be written, dropped because the queue was full or failed to write
+    Log.info(f"LOG PIPELINE: {pipeline.stats()}", style="yellow")
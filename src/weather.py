@@ -3,12 +3,18 @@
 import sys
 import json
 import re
-from datetime import datetime, date
-from functools import lru_cache
+from datetime import datetime, date, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
 
 from src.logger import Log
-from src.safe_request import safe_get
-# from .utils import timed_lru_cache
+from src.safe_request import safe_get, CircuitOpenError
+from src.cache import SWRCache
+from src.config import STATION_TZ
+from src.daily_store import daily_aggregates, get_daily_store
+from src.json_stream import parse_stream
+from src.summary import summarize
 
 
 _SENSITIVE_PARAMS = re.compile(
@@ -25,78 +31,139 @@ def _mask_url_secrets(url: str) -> str:
 ALLOWED_API_HOSTS = {
     "api.weather.com",
     "api.ecowitt.net",
-    "api.sunrise-sunset.org",
-    "sunrise-sunset.org",
 }
 
+_HISTORY_PATH = "/api/v3/device/history"
+# History bodies are parsed while they download, in chunks of this size
+_STREAM_CHUNK_SIZE = 16 * 1024
+
+# (fresh, stale) seconds for get_api_data responses, by URL path. Current
+# conditions change every minute, the history much more slowly.
+API_CACHE_POLICIES = {
+    "/api/v3/device/real_time": (60, 300),
+    _HISTORY_PATH: (3 * 3600, 12 * 3600),
+    "/v2/pws/observations/current": (60, 300),
+    "/v2/pws/history/daily": (300, 1800),
+}
+_DEFAULT_CACHE_POLICY = (60, 300)
 
-def get_api_data(url: str, cycle_type: str = "1day", date1=None, date2=None):
-    """ Process to get current weather data  """
-    Log.info(f'Getting weather data ({date1} - {date2})...')
+# Timeout of safe_get for URLs requested without a client
+DEFAULT_TIMEOUT = 10
 
-    # Check if date params have data
-    date_from = date1 if date1 else None
-    date_to = date2 if date2 else None
-    if date_from and date_to:  # Calling to API EcoWitt history
-        url += f"&cycle_type={cycle_type}&start_date={date_from} 00:00:00&end_date={date_to} 23:59:59"
-    Log.debug(f"URL: {_mask_url_secrets(url)}")
+api_cache = SWRCache(maxsize=32)
+
+# Summaries by date range (see get_range_summary). Ranges that include today
+# are refreshed with this period, past ranges never expire.
+SUMMARY_REFRESH_SECONDS = 3 * 3600
+summary_cache = SWRCache(maxsize=32)
+
+# Month and year history requests are independent, so fetch them side by side
+_summary_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="summary-fetch")
+
+
+def _normalize_url(url: str) -> str:
+    """Return the URL with its query params sorted, to be used as cache key."""
+    parts = urlsplit(url)
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path, query, ""))
 
-    try:
-        # Getting a dataframe with the all data weather
-        response = safe_get(url, ALLOWED_API_HOSTS)
-        dict_weather = json.loads(response.text)
 
-        Log.debug(f'API data JSON keys: {list(dict_weather.keys())}')
+def _fetch_api_data(url: str, timeout=DEFAULT_TIMEOUT, limit=None) -> dict:
+    """Request url and decode the JSON body. Returns {} on any error.
+
+    Args:
+        url (str): API URL
+        timeout: Seconds, or (connect, read) seconds, for safe_get
+        limit: Optional context manager held during the request (see
+            clients.ConcurrencyLimit), it raises when no slot is free
+    """
+    try:
+        with limit or nullcontext():
+            # Getting a dataframe with the all data weather
+            if urlsplit(url).path == _HISTORY_PATH:
+                # Stream the body so series go straight into TimeSeries buffers,
+                # without holding the whole text or a dict of strings
+                with safe_get(url, ALLOWED_API_HOSTS, timeout=timeout, stream=True) as response:
+                    dict_weather = parse_stream(response.iter_content(_STREAM_CHUNK_SIZE),
+                                                encoding=response.encoding or "utf-8")
+            else:
+                response = safe_get(url, ALLOWED_API_HOSTS, timeout=timeout)
+                dict_weather = json.loads(response.text)
+
+        Log.debug(lambda: f'API data JSON keys: {list(dict_weather.keys())}')
 
         return dict_weather
 
+    except CircuitOpenError as err:
+        # Expected while a provider is down, no traceback needed
+        Log.warning(f"Skipping API call: {err}")
+        return {}
     except Exception as err:
         Log.error("Error getting data from API", err, sys)
         return {}
 
 
+def get_api_data(url: str, use_cache: bool = True, timeout=DEFAULT_TIMEOUT, limit=None):
+    """ Process to get weather data from an API URL
+
+    Responses are kept in api_cache with the freshness/stale windows of
+    API_CACHE_POLICIES. Pass use_cache=False to always call the API. The URLs
+    are built by the clients in src/clients.py, which also pass their own
+    timeout and concurrency limit.
+    """
+    Log.info('Getting weather data...')
+    Log.debug(lambda: f"URL: {_mask_url_secrets(url)}")
+
+    if not use_cache:
+        return _fetch_api_data(url, timeout, limit)
+
+    fresh, stale = API_CACHE_POLICIES.get(urlsplit(url).path, _DEFAULT_CACHE_POLICY)
+    return api_cache.get(_normalize_url(url), lambda: _fetch_api_data(url, timeout, limit), fresh, stale)
+
+
+def local_today() -> str:
+    """Current date of the station (Europe/Madrid) as 'YYYYMMDD'"""
+    return datetime.now(STATION_TZ).strftime('%Y%m%d')
+
+
 def get_month_dates():
-    """Get the first date and the current date for the current month"""
-    current_date = datetime.today()
+    """Get the first date and the current date for the current month (station local time)"""
+    current_date = datetime.now(STATION_TZ)
     first_month = date(current_date.year, current_date.month, 1)
 
     return first_month.strftime('%Y%m%d'), current_date.strftime('%Y%m%d')
 
 
 def get_year_dates():
-    """Get the first date and the current date for the current year"""
-    current_date = datetime.today()
+    """Get the first date and the current date for the current year (station local time)"""
+    current_date = datetime.now(STATION_TZ)
     first_year = date(current_date.year, 1, 1)
 
     return first_year.strftime('%Y%m%d'), current_date.strftime('%Y%m%d')
 
 
-@lru_cache(maxsize=5)
-# @timed_lru_cache(seconds=5, maxsize=4) # Personal decorator in utils.py it extends from @lru_cache
-def get_summary_data(url: str) -> dict:
+def get_summary_data(client, use_cache: bool = True) -> dict:
     """Method to generate a dict object with all summary data weather for a current month
     and current year.
 
     Args:
-        url (str): URL for getting weather data
+        client (EcowittClient): Client for the EcoWitt history of the station
+        use_cache (bool): False to download the history again (the poller does)
 
     Returns:
-        dict: Object with al summary data
+        dict: Object with al summary data, {} if the history could not be downloaded
     """
     try:
         Log.info("Getting summary data for current month and current year...")
+        month_from, today = get_month_dates()
+        year_from, _ = get_year_dates()
+        Log.debug("Dates for summary data: month %s - %s, year %s - %s", month_from, today, year_from, today)
 
-        date_from, date_to = get_month_dates()
-        Log.debug(f"Dates for summary month data: {date_from} - {date_to}")
-        month_summary = get_api_data(
-            url, cycle_type="4hour", date1=date_from, date2=date_to)
-        month_summary = get_summary(month_summary)
-
-        date_from, date_to = get_year_dates()
-        Log.debug(f"Dates for summary year data: {date_from} - {date_to}")
-        year_summary = get_api_data(
-            url, cycle_type="1day", date1=date_from, date2=date_to)
-        year_summary = get_summary(year_summary)
+        # The year first: it stores every missing day, the month then only reads the store
+        year_summary = get_range_summary(client, year_from, today, cycle_type="1day", use_cache=use_cache)
+        month_summary = get_range_summary(client, month_from, today, cycle_type="4hour", use_cache=use_cache)
+        if not year_summary or not month_summary:
+            return {}
 
         return month_summary, year_summary
 
@@ -105,72 +172,103 @@ def get_summary_data(url: str) -> dict:
         return {}
 
 
-def get_summary(data: dict) -> dict:
-    """Method to get the min and max data for the information in data
+def get_range_summary(client, date_from: str, date_to: str, cycle_type: str = "1day",
+                      use_cache: bool = True) -> dict:
+    """Summary for a date range, cached by (station, range, cycle_type).
+
+    A range that ends today or later is refreshed every SUMMARY_REFRESH_SECONDS
+    and, as the dates are part of the key, a new day or month is always a new
+    entry. A range that ended before today can not change, so it never expires.
 
     Args:
-        data (dict): Weather data
+        client (EcowittClient): Client for the EcoWitt history of the station
+        date_from (str): First day 'YYYYMMDD'
+        date_to (str): Last day 'YYYYMMDD'
+        cycle_type (str): History resolution for the days before the current month
+        use_cache (bool): False to download the missing days again and replace the cached summary
 
     Returns:
-        dict: Weather data calculated
+        dict: Summary of every metric (see DailyStore.summary), {} if a download failed
     """
-    try:
-        Log.info("Getting summary for data...")
-        Log.info_dict("Data dict:", data, "DEBUG")
-        data_summary = dict()
-        if not data["data"]:
-            Log.debug("Data is empty, returning '-' values in the dict...", style="red")
-            data_summary["temperature"] = "-"
-            data_summary["wind"] = "-"
-            data_summary["humidity"] = "-"
-            data_summary["pressure"] = "-"
-            data_summary["uvi"] = "-"
-            data_summary["rainfall"] = "-"
-            return data_summary
-
-        data_summary["temperature"] = get_min_max(
-            data["data"]["outdoor"]["temperature"]["list"])
-        data_summary["wind"] = get_min_max(
-            data["data"]["wind"]["wind_speed"]["list"])
-        data_summary["humidity"] = get_min_max(
-            data["data"]["outdoor"]["humidity"]["list"])
-        data_summary["pressure"] = get_min_max(
-            data["data"]["pressure"]["relative"]["list"])
-        data_summary["uvi"] = get_min_max(
-            data["data"]["solar_and_uvi"]["uvi"]["list"])
-        # For raining year rate we have to subtract min for max value
-        data_summary["rainfall"] = get_min_max(
-            data["data"]["rainfall"]["yearly"]["list"])
-        data_summary["rainfall"] = data_summary["rainfall"]["max"] - data_summary["rainfall"]["min"]
-
-        return data_summary
-
-    except Exception as err:
-        Log.error("Error getting summary data", err, sys)
+    complete = date_to < local_today()
+    key = (client.station, date_from, date_to, cycle_type, complete)
+    if not use_cache:
+        summary = _load_range_summary(client, date_from, date_to, cycle_type, use_cache=False)
+        if summary:
+            summary_cache.set(key, summary)
+        return summary
+    fresh = float("inf") if complete else SUMMARY_REFRESH_SECONDS
+    return summary_cache.get(key, lambda: _load_range_summary(client, date_from, date_to, cycle_type), fresh)
+
+
+def _load_range_summary(client, date_from: str, date_to: str, cycle_type: str,
+                        use_cache: bool = True) -> dict:
+    """Download the days of the range missing in the daily store and summarize it
+
+    Days of the current month come from the 4hour history, older days from
+    cycle_type. Only days that are not complete in the store are downloaded,
+    plus today, so the download size does not grow with the range.
+
+    Returns {} if a download failed, so the summary of the days that could
+    not be read is not cached.
+    """
+    store = get_daily_store()
+    today = local_today()
+    month_start = today[:6] + "01"
+
+    missing = store.missing_days(date_from, date_to)
+    downloads = []
+    past_days = [day for day in missing if day < month_start]
+    if past_days:
+        downloads.append((cycle_type, past_days))
+    month_days = [day for day in missing if day >= month_start]
+    if month_days:
+        downloads.append(("4hour", month_days))
+
+    futures = []
+    for cycle, days in downloads:
+        Log.debug("Downloading %s history for %s - %s", cycle, days[0], days[-1])
+        futures.append((days, _summary_executor.submit(
+            client.history, days[0], days[-1], cycle_type=cycle, use_cache=use_cache)))
+
+    # Today and yesterday may still change (the last 4hour bucket of yesterday
+    # can be published after midnight), older days are final
+    final_before = (datetime.strptime(today, "%Y%m%d") - timedelta(days=1)).strftime("%Y%m%d")
+    failed = False
+    for days, future in futures:
+        data = future.result()
+        if "data" not in data:
+            # get_api_data answers {} on any error (timeout, open circuit...)
+            Log.warning(f"History download failed for {days[0]} - {days[-1]}")
+            failed = True
+        elif isinstance(data["data"], dict) and data["data"]:
+            aggregates = daily_aggregates(data)
+            store.store_aggregates(aggregates)
+            # Days without rows in the response are requested again next time
+            received = {day for day, _ in aggregates}
+            store.mark_complete([day for day in days if day < final_before and day in received])
+
+    if failed:
         return {}
+    return store.summary(date_from, date_to)
 
 
-def get_min_max(data: dict) -> dict:
-    """Method to get the min and max for a certain param like temperature, wind, etc
+def get_summary(data: dict) -> dict:
+    """Method to get the summary (min, max, mean...) for the information in data
 
     Args:
-        data (dict): Dict of data
+        data (dict): Weather data
 
     Returns:
-        dict: Max and min for the data
+        dict: Weather data calculated, '-' for the metrics without data
     """
     try:
-        Log.info(f"Calculating Min/Max for data with {len(data)} elements...")
-        # Log.debug(f"Data: {data}")
-
-        values = [float(x) for x in list(data.values())]
-        result = dict(min=min(values), max=max(values))
-        # result = dict(min=min(data.values()), max=max(data.values()))
-        # result = dict(min='{0:.2f}'.format(min(data.values())), max='{0:.2f}'.format(max(data.values())))
-
-        Log.debug(f"The min and max are: {result}")
-        return result
+        Log.info("Getting summary for data...")
+        Log.info_dict("Data dict:", data, "DEBUG")
+        if not data["data"]:
+            Log.debug("Data is empty, returning '-' values in the dict...", style="red")
+        return summarize(data)
 
     except Exception as err:
-        Log.error("Error calculating max and min", err, sys)
+        Log.error("Error getting summary data", err, sys)
         return {}
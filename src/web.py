@@ -2,20 +2,26 @@
 
 from flask import Flask, render_template, url_for, request, jsonify
 from dotenv import load_dotenv, find_dotenv
-from datetime import datetime
-from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, wait
 from threading import Lock
-from time import time
+from datetime import datetime
+from time import time, monotonic
 import os
 import sys
 
-from src.logger import Log, console
-from src.weather import get_api_data, get_summary_data
-from src.utils import convert_date, check_cache
+from src.logger import Log, console, LOG_FORMAT
+from src.weather import get_summary_data, local_today
+from src.clients import ecowitt, wunderground
+from src.sun import format_sun_times, get_sun_times
+from src.utils import check_cache
 from src.api import api_bp
-from src.config import (URL_SUNRISE_SUNSET, URL_WEATHER_ECOWITT_CURRENT,
-                        URL_WEATHER_WUNDERGROUND_CURRENT, URL_WEATHER_WUNDERGROUND_DAY, URL_WEATHER_ECOWITT_HISTOY,
-                        GA_MEASUREMENT_ID)
+from src.poller import poller
+from src.rate_limit import create_rate_limiter
+from src.page_cache import PageCache, RenderedPage
+from src.compression import compress_response
+from src import assets
+from src.config import (GA_MEASUREMENT_ID, POLLER_ENABLED, POLL_INTERVALS, PAGE_BUDGET_MS,
+                        SOURCE_RETRY_SECONDS, RATE_LIMIT_BACKEND, RATE_LIMIT_DB_PATH, STATION_TZ)
 
 # Looking for .env file for environment vars
 load_dotenv(find_dotenv())
@@ -27,6 +33,8 @@ if _is_production and os.environ.get('FLASK_DEBUG', '0') == '1':
 
 app = Flask(__name__, template_folder="../templates",
             static_folder="../static")
+# url_for('static') serves the fingerprinted files of static/dist when they are built
+assets.init_app(app)
 
 # Require a secret key for signed cookies / sessions
 app.secret_key = os.environ.get('FLASK_SECRET_KEY')
@@ -39,11 +47,15 @@ if not app.secret_key:
 # Only auto-reload templates outside production
 app.config['TEMPLATES_AUTO_RELOAD'] = not _is_production
 
-# Simple in-memory rate limiter (per-IP + path)
+# Rate limiter (per-IP + path): (requests, window seconds)
 _RATE_LIMITS = {
     "/": (60, 60),
     "/home": (60, 60),
     "/api/rain-today": (30, 60),
+    "/api/current": (30, 60),
+    "/api/summary/month": (30, 60),
+    "/api/summary/year": (30, 60),
+    "/api/sun": (30, 60),
 }
 # Hard cap on tracked (ip, path) keys to prevent unbounded memory growth from
 # spoofed clients or large numbers of distinct IPs. Oldest entries are evicted.
@@ -60,8 +72,26 @@ _TRUSTED_PROXIES = {
     for ip in os.environ.get("TRUSTED_PROXIES", "").split(",")
     if ip.strip()
 }
-_request_history = OrderedDict()
-_rate_limit_lock = Lock()
+_RATE_LIMIT_SHARDS = int(os.environ.get("RATE_LIMIT_SHARDS", "16"))
+# Keys with expired counters are dropped in the background with this period
+_RATE_LIMIT_SWEEP_SECONDS = int(os.environ.get("RATE_LIMIT_SWEEP_SECONDS", "60"))
+rate_limiter = create_rate_limiter(RATE_LIMIT_BACKEND, max_keys=_RATE_LIMIT_MAX_KEYS,
+                                   shards=_RATE_LIMIT_SHARDS, path=RATE_LIMIT_DB_PATH)
+rate_limiter.start_sweeper(_RATE_LIMIT_SWEEP_SECONDS)
+
+# home() HTML rendered once per snapshot version (see src/page_cache.py)
+page_cache = PageCache()
+
+# Bounded pool used by home() to fetch every upstream source at the same time,
+# so a cold render waits for the slowest API instead of the sum of all of them.
+_FETCH_WORKERS = int(os.environ.get("FETCH_WORKERS", "5"))
+_fetch_executor = ThreadPoolExecutor(max_workers=_FETCH_WORKERS,
+                                     thread_name_prefix="home-fetch")
+# Live fetches still running, by source, so slow sources are not queued again
+_inflight = {}
+_inflight_lock = Lock()
+# Sources whose last live fetch failed: name -> monotonic time they can be fetched again
+_retry_after = {}
 
 
 def _client_ip():
@@ -92,30 +122,10 @@ def enforce_request_policy():
     key = (_client_ip(), request.path)
     now = time()
 
-    with _rate_limit_lock:
-        timestamps = _request_history.get(key)
-        if timestamps is None:
-            timestamps = deque()
-            _request_history[key] = timestamps
-        else:
-            # Mark this key as most-recently-used for LRU eviction.
-            _request_history.move_to_end(key)
-
-        while timestamps and timestamps[0] <= now - window_seconds:
-            timestamps.popleft()
-
-        if len(timestamps) >= max_requests:
-            if not timestamps:
-                _request_history.pop(key, None)
-            return jsonify({"error": "Too many requests"}), 429
-
-        timestamps.append(now)
-
-        # Defensive cleanup: drop empty deques and enforce a hard cap on the
-        # number of tracked keys (LRU eviction) so spoofed IPs cannot exhaust
-        # memory.
-        while len(_request_history) > _RATE_LIMIT_MAX_KEYS:
-            _request_history.popitem(last=False)
+    # Constant state per key and the LRU cap on keys (see RateLimiter) keep
+    # spoofed IPs from exhausting memory.
+    if not rate_limiter.hit(key, max_requests, window_seconds, now):
+        return jsonify({"error": "Too many requests"}), 429
 
     return None
 
@@ -124,6 +134,12 @@ def enforce_request_policy():
 app.register_blueprint(api_bp)
 
 
+@app.after_request
+def compress_body(response):
+    # HTML and JSON bodies, compressed once per content (see src/compression.py)
+    return compress_response(response, request.accept_encodings)
+
+
 @app.after_request
 def set_security_headers(response):
     response.headers['Content-Security-Policy'] = (
@@ -145,95 +161,212 @@ def set_security_headers(response):
 
 
 # Cache info
-get_summary_data.cache_clear()
-console.print(f"CACHE: {get_summary_data.cache_info()}", style="yelloW")
+check_cache()
 
-console.rule("Cercedilla Weather Web")
+if LOG_FORMAT == "rich":
+    console.rule("Cercedilla Weather Web")
 
 
-def transform_sun_time(data: dict, today: str) -> dict:
-    """Transform sunrise/sunset time in UTC format to CEST.
-
-    Args:
-        data (dict): Struct from API data
-        today (str): Today date
+def get_sun_data(today: str) -> dict:
+    """Sunrise/sunset of today, computed locally (see src/sun.py).
 
     Returns:
-        dict: Struct with dates in CEST format
+        dict: {"results": today's times as 'HH:MM:SS' in station local time}
     """
-    results = data.get("results")
-    if not isinstance(results, dict):
-        raise KeyError("results")
-
-    sunrise = results.get("sunrise")
-    sunset = results.get("sunset")
-    if sunrise is None or sunset is None:
-        raise KeyError("sunrise/sunset")
-
-    Log.info(f"Dictionary dates: {data}")
-    # Set "%Y%m%d %I:%M:%S %p" format
-    sunrise_date_str = f"{today} {sunrise}"
-    sunset_date_str = f"{today} {sunset}"
-    Log.info(f"Dates to transform: {sunrise_date_str} - {sunset_date_str}")
-
-    date_format = "%Y%m%d %I:%M:%S %p"
-    sunrise_date = convert_date(
-        sunrise_date_str, "UTC", "Europe/Madrid", date_format)
-    sunset_date = convert_date(
-        sunset_date_str, "UTC", "Europe/Madrid", date_format)
-
-    # Update time fields with the CEST time
-    results["sunrise"] = datetime.strftime(sunrise_date, "%H:%M:%S")
-    results["sunset"] = datetime.strftime(sunset_date, "%H:%M:%S")
+    return {"results": format_sun_times(get_sun_times(today))}
 
-    return data
 
+# Sources needed to render the home page, with the call that fetches each one
+_PAGE_SOURCES = {
+    "weather_current": wunderground.current,
+    "weather_day": wunderground.daily,
+    "weather_data": ecowitt.real_time,
+    "summary": lambda: get_summary_data(ecowitt),
+}
 
-@app.route("/")
-@app.route("/home")
-def home():
-    try:
-        Log.info("Access to home page")
-        url_for('static', filename='main.css')
+# The poller always calls the APIs: its interval already is the freshness of
+# the data and a cached answer would be one interval old. The live fetches
+# above keep going through the API cache.
+_POLL_SOURCES = {
+    "weather_current": lambda: wunderground.current(use_cache=False),
+    "weather_day": lambda: wunderground.daily(use_cache=False),
+    "weather_data": lambda: ecowitt.real_time(use_cache=False),
+    "summary": lambda: get_summary_data(ecowitt, use_cache=False),
+}
+
+for _name, _fetch in _POLL_SOURCES.items():
+    poller.add_source(_name, _fetch, POLL_INTERVALS[_name])
 
-        today = datetime.today().strftime('%Y%m%d')
+if POLLER_ENABLED:
+    poller.start()
 
-        # For Weather Underground API data
-        Log.info("Getting weather Wunderground current...")
-        weather_current = get_api_data(URL_WEATHER_WUNDERGROUND_CURRENT)
-        Log.info("Getting weather Wunderground day...")
-        weather_day = get_api_data(URL_WEATHER_WUNDERGROUND_DAY)
 
-        # For EcoWitt API data
-        Log.info("Getting weather Ecowitt current...")
-        weather_data = get_api_data(URL_WEATHER_ECOWITT_CURRENT)
+class Placeholder():
+    """Stands for a section without data in the templates.
+
+    Any attribute or key of a placeholder is the placeholder itself and it is
+    rendered as '-', the same as the summary metrics without data.
+    """
 
-        # For SunSet-Sunrise API data
-        Log.info("Getting sunrise-sunset...")
-        sunrise_sunset = get_api_data(URL_SUNRISE_SUNSET)
-        # Convert UTC time to CEST time
-        sunrise_sunset = transform_sun_time(sunrise_sunset, today)
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return self
 
-        # Get summary weather data for month and year
-        Log.info("Getting weather Ecowitt history...")
-        month_summary, year_summary = get_summary_data(URL_WEATHER_ECOWITT_HISTOY)
+    def __getitem__(self, key):
+        return self
 
-        check_cache(minutes=180)
+    def __str__(self) -> str:
+        return "-"
 
-        # Format year summary rain to 2 decimals
-        if isinstance(year_summary["rainfall"], float):
+    def __bool__(self) -> bool:
+        return False
+
+
+PLACEHOLDER = Placeholder()
+
+
+def _section(data, *path):
+    """Return data[path[0]][path[1]]..., PLACEHOLDER if any step is missing"""
+    try:
+        for key in path:
+            data = data[key]
+    except (KeyError, IndexError, TypeError):
+        return PLACEHOLDER
+    return data
+
+
+def _fetch_source(name: str):
+    """Fetch a source. One that fails or returns no data is not fetched live again for a while."""
+    value = None
+    try:
+        value = _PAGE_SOURCES[name]()
+        return value
+    finally:
+        # Before the future is done, so the next request already sees it
+        with _inflight_lock:
+            if value:
+                _retry_after.pop(name, None)
+            else:
+                _retry_after[name] = monotonic() + SOURCE_RETRY_SECONDS
+
+
+def _submit_fetch(name: str):
+    """Start a live fetch of a source, or return the one still running for it.
+
+    Returns None if the last fetch of the source failed less than
+    SOURCE_RETRY_SECONDS ago.
+    """
+    with _inflight_lock:
+        future = _inflight.get(name)
+        if future is not None and not future.done():
+            return future
+        if monotonic() < _retry_after.get(name, 0):
+            return None
+        future = _inflight[name] = _fetch_executor.submit(_fetch_source, name)
+        return future
+
+
+def reset_failed_sources():
+    """Forget the failed sources, they are fetched again on the next request"""
+    with _inflight_lock:
+        _retry_after.clear()
+
+
+def get_page_data(budget: float = PAGE_BUDGET_MS / 1000) -> dict:
+    """Return the data for the home page, waiting at most budget seconds.
+
+    Reads the poller snapshot when it has every source. Otherwise (poller
+    disabled or still warming up) the missing sources are fetched live and in
+    parallel. Sources that fail, return no data or are not ready when the
+    budget runs out are left out of the result; the late ones keep running
+    and fill the API cache for the next request. Sources that failed are not
+    fetched again for SOURCE_RETRY_SECONDS.
+    """
+    deadline = monotonic() + budget
+    snapshot = poller.snapshot
+    if snapshot.has(*_PAGE_SOURCES):
+        Log.info(f"Using poller snapshot v{snapshot.version}")
+        return snapshot.data
+
+    # Launch every missing upstream call at once and join them before the deadline
+    Log.info("Getting weather Wunderground current/day and Ecowitt current/history...")
+    page_data = {name: snapshot.data[name] for name in _PAGE_SOURCES if name in snapshot.data}
+    futures = {name: _submit_fetch(name) for name in _PAGE_SOURCES if name not in page_data}
+    futures = {name: future for name, future in futures.items() if future is not None}
+    wait(futures.values(), timeout=max(0, deadline - monotonic()))
+
+    for name, future in futures.items():
+        if not future.done():
+            Log.warning(f"Source {name} not ready within the {budget:.3f}s page budget")
+            continue
+        try:
+            value = future.result()
+        except Exception as err:
+            Log.error(f"Error getting source {name}", err, sys)
+            continue
+        if value:
+            page_data[name] = value
+    return page_data
+
+
+def _render_home(page_data, today: str) -> str:
+    """Render main.html from the page data. Missing sections are rendered with '-' placeholders."""
+    weather_current = _section(page_data, "weather_current", "observations", 0)
+    weather_day = _section(page_data, "weather_day", "observations", 0)
+    weather_data = _section(page_data, "weather_data")
+    sunrise_sunset = get_sun_data(today)
+    month_summary = _section(page_data, "summary", 0)
+    year_summary = _section(page_data, "summary", 1)
+
+    check_cache()
+
+    # Format year summary rain to 2 decimals (on a copy, the snapshot is shared)
+    if isinstance(year_summary, dict):
+        year_summary = dict(year_summary)
+        if isinstance(year_summary.get("rainfall"), float):
             year_summary['rainfall'] = "{:.2f}".format(float(year_summary['rainfall']))
 
-        Log.info_dict("Weather data", weather_data, "DEBUG")
+    Log.info_dict("Weather data", weather_data, "DEBUG")
 
-        return render_template("main.html",
-                               weather_data=weather_data,
-                               sunrise_sunset=sunrise_sunset,
-                               weather_current=weather_current["observations"][0],
-                               weather_day=weather_day["observations"][0],
-                               month_summary=month_summary,
-                               year_summary=year_summary,
-                               ga_measurement_id=GA_MEASUREMENT_ID)
+    return render_template("main.html",
+                           weather_data=weather_data,
+                           sunrise_sunset=sunrise_sunset,
+                           weather_current=weather_current,
+                           weather_day=weather_day,
+                           month_summary=month_summary,
+                           year_summary=year_summary,
+                           ga_measurement_id=GA_MEASUREMENT_ID)
+
+
+def _day_start(day: str) -> float:
+    """Epoch of the local midnight that starts day 'YYYYMMDD'"""
+    return datetime.strptime(day, "%Y%m%d").replace(tzinfo=STATION_TZ).timestamp()
+
+
+@app.route("/")
+@app.route("/home")
+def home():
+    try:
+        Log.info("Access to home page")
+        url_for('static', filename='main.css')
+        today = local_today()
+
+        snapshot = poller.snapshot
+        if snapshot.has(*_PAGE_SOURCES):
+            # Rendered once per snapshot version and day (the sun times change every day)
+            last_modified = max(max(snapshot.updated.values()), _day_start(today))
+            page = page_cache.get((snapshot.version, today), lambda: _render_home(snapshot.data, today),
+                                  last_modified)
+            return page.response()
+
+        page_data = get_page_data()
+        if not page_data:
+            Log.warning("No source available for the home page")
+            return render_template("error.html", message="Website under maintenance"), 500
+
+        # Partial or live data is not cached, but the ETag still saves the transfer
+        return RenderedPage.build(_render_home(page_data, today), time()).response()
     except KeyError as e:
         Log.error(f"KeyError in home page: {e}", err=e, sys=sys)
         return render_template("error.html", message="Data processing error occurred"), 500
@@ -9,12 +9,12 @@ class TestApi(unittest.TestCase):
 
     def setUp(self):
         self.app = web.app.test_client()
-        web._request_history.clear()
+        web.rate_limiter.clear()
         # Reset cache before each test
         api._rain_cache["date"] = None
         api._rain_cache["rained_today"] = None
 
-    @patch("src.api.get_api_data")
+    @patch("src.clients.get_api_data")
     def test_rain_today_true(self, mock_get_api_data):
         """Test rain endpoint returns true when daily rainfall is above zero"""
         mock_get_api_data.return_value = {
@@ -32,7 +32,7 @@ class TestApi(unittest.TestCase):
         # Verify only rained_today field is in response
         self.assertEqual(1, len(payload))
 
-    @patch("src.api.get_api_data")
+    @patch("src.clients.get_api_data")
     def test_rain_today_false(self, mock_get_api_data):
         """Test rain endpoint returns false when daily rainfall is zero"""
         mock_get_api_data.return_value = {
@@ -49,7 +49,7 @@ class TestApi(unittest.TestCase):
         self.assertEqual(False, payload["rained_today"])
         self.assertEqual(1, len(payload))
 
-    @patch("src.api.get_api_data")
+    @patch("src.clients.get_api_data")
     def test_rain_today_cache(self, mock_get_api_data):
         """Test that rain status is cached for the same day and API not called again"""
         mock_get_api_data.return_value = {
@@ -72,7 +72,21 @@ class TestApi(unittest.TestCase):
         self.assertEqual(True, response2.get_json()["rained_today"])
         self.assertEqual(call_count_after_first, mock_get_api_data.call_count)
 
-    @patch("src.api.get_api_data")
+    @patch("src.clients.get_api_data")
+    def test_rain_today_uses_poller_snapshot(self, mock_get_api_data):
+        """Rain status is read from the poller snapshot when available"""
+        snapshot = api.poller.snapshot
+        try:
+            api.poller.publish("weather_data", {'data': {'rainfall': {'daily': {'value': '0.3'}}}})
+            response = self.app.get("/api/rain-today")
+        finally:
+            api.poller.snapshot = snapshot
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(True, response.get_json()["rained_today"])
+        mock_get_api_data.assert_not_called()
+
+    @patch("src.clients.get_api_data")
     def test_rain_today_key_error(self, mock_get_api_data):
         """Test rain endpoint handles missing data gracefully"""
         mock_get_api_data.return_value = {'data': {}}
@@ -82,7 +96,7 @@ class TestApi(unittest.TestCase):
         payload = response.get_json()
         self.assertEqual("Data processing error occurred", payload["error"])
 
-    @patch("src.api.get_api_data")
+    @patch("src.clients.get_api_data")
     @patch("src.api.API_ACCESS_KEY", "secret-token")
     def test_rain_today_requires_api_key_when_enabled(self, mock_get_api_data):
         mock_get_api_data.return_value = {
@@ -99,7 +113,7 @@ class TestApi(unittest.TestCase):
         authorized = self.app.get("/api/rain-today", headers={"X-API-Key": "secret-token"})
         self.assertEqual(200, authorized.status_code)
 
-    @patch("src.api.get_api_data")
+    @patch("src.clients.get_api_data")
     def test_rain_today_value_error(self, mock_get_api_data):
         """Test rain endpoint handles ValueError branch."""
         mock_get_api_data.side_effect = ValueError("invalid payload")
@@ -109,7 +123,7 @@ class TestApi(unittest.TestCase):
         payload = response.get_json()
         self.assertEqual("Data processing error occurred", payload["error"])
 
-    @patch("src.api.get_api_data")
+    @patch("src.clients.get_api_data")
     def test_rain_today_generic_exception(self, mock_get_api_data):
         """Test rain endpoint handles unexpected exception branch."""
         mock_get_api_data.side_effect = RuntimeError("unexpected failure")
@@ -119,6 +133,92 @@ class TestApi(unittest.TestCase):
         payload = response.get_json()
         self.assertEqual("Website under maintenance", payload["error"])
 
+    def _publish(self, **sources):
+        snapshot = web.poller.snapshot
+        self.addCleanup(setattr, web.poller, "snapshot", snapshot)
+        for name, value in sources.items():
+            web.poller.publish(name, value)
+
+    @patch("src.clients.get_api_data")
+    def test_current_from_snapshot_with_fields(self, mock_get_api_data):
+        self._publish(
+            weather_data={'data': {
+                'outdoor': {'temperature': {'value': '12.5', 'unit': '°C'}, 'humidity': {'value': '80', 'unit': '%'}},
+                'rainfall': {'daily': {'value': '1.5', 'unit': 'mm'}},
+                'wind': {'wind_speed': {'value': '-', 'unit': 'km/h'}},
+            }},
+            weather_day={'observations': [{'humidityHigh': 95, 'metric': {'tempLow': 4.1, 'tempHigh': 13.0}}]})
+
+        payload = self.app.get("/api/current").get_json()
+        self.assertEqual({"value": 12.5, "unit": "°C"}, payload["temperature"])
+        self.assertEqual({"value": None, "unit": "km/h"}, payload["wind"])
+        self.assertEqual({"value": 1.5, "unit": "mm"}, payload["rainfall"]["daily"])
+        self.assertEqual({"min": 4.1, "max": 13.0}, payload["today"]["temperature"])
+        self.assertEqual(95, payload["today"]["humidity"]["max"])
+        self.assertIsNotNone(payload["updated"])
+
+        response = self.app.get("/api/current?fields=temperature,rainfall")
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(["rainfall", "temperature"], sorted(response.get_json()))
+        mock_get_api_data.assert_not_called()
+
+        response = self.app.get("/api/current?fields=temperature,snow")
+        self.assertEqual(400, response.status_code)
+        self.assertIn("snow", response.get_json()["error"])
+
+    @patch("src.clients.get_api_data")
+    def test_current_fetches_live_without_snapshot(self, mock_get_api_data):
+        def side_effect_get_api_data(url, **kwargs):
+            if 'ecowitt' in url:
+                return {'data': {'outdoor': {'temperature': {'value': '7', 'unit': '°C'}}}}
+            return {'observations': [{'metric': {'tempLow': 1, 'tempHigh': 9}}]}
+        mock_get_api_data.side_effect = side_effect_get_api_data
+
+        payload = self.app.get("/api/current?fields=temperature,today,updated").get_json()
+        self.assertEqual(7.0, payload["temperature"]["value"])
+        self.assertEqual({"min": 1.0, "max": 9.0}, payload["today"]["temperature"])
+        self.assertIsNone(payload["updated"])
+
+        mock_get_api_data.side_effect = None
+        mock_get_api_data.return_value = {}
+        self.assertEqual(503, self.app.get("/api/current").status_code)
+
+    def test_summary(self):
+        month = {'temperature': {'min': 5, 'max': 15}, 'rainfall': 20.0}
+        year = {'temperature': {'min': -3, 'max': 35}, 'rainfall': 400.0}
+        self._publish(summary=(month, year))
+
+        payload = self.app.get("/api/summary/month").get_json()
+        self.assertEqual(month["temperature"], payload["temperature"])
+        self.assertEqual(20.0, payload["rainfall"])
+        self.assertEqual({"rainfall": 400.0}, self.app.get("/api/summary/year?fields=rainfall").get_json())
+        self.assertEqual(404, self.app.get("/api/summary/week").status_code)
+
+    @patch("src.api.get_summary_data", return_value=None)
+    def test_summary_not_available(self, mock_get_summary_data):
+        self.assertEqual(503, self.app.get("/api/summary/year").status_code)
+
+    @patch("src.api.local_today", return_value="20240610")
+    def test_sun(self, _mock_today):
+        payload = self.app.get("/api/sun?date=20240621&fields=sunrise,sunset").get_json()
+        self.assertEqual(["sunrise", "sunset"], sorted(payload))
+        self.assertTrue(payload["sunrise"].startswith("06:45"))
+        self.assertTrue(payload["sunset"].startswith("21:51"))
+
+        self.assertEqual(200, self.app.get("/api/sun").status_code)
+        self.assertEqual(400, self.app.get("/api/sun?date=2024-06-21").status_code)
+        self.assertEqual(400, self.app.get("/api/sun?date=2024621").status_code)
+        # Years far from today are rejected before building their table
+        self.assertEqual(200, self.app.get("/api/sun?date=20251231").status_code)
+        for day in ("00010101", "99991231", "20260101", "20221231"):
+            self.assertEqual(400, self.app.get(f"/api/sun?date={day}").status_code)
+
+    @patch("src.api.API_ACCESS_KEY", "secret-token")
+    def test_data_endpoints_require_api_key(self):
+        for path in ("/api/current", "/api/summary/month", "/api/sun"):
+            self.assertEqual(401, self.app.get(path).status_code)
+        self.assertEqual(200, self.app.get("/api/sun", headers={"X-API-Key": "secret-token"}).status_code)
+
 
 if __name__ == "__main__":
     unittest.main()
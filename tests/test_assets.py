@@ -0,0 +1,104 @@
+import json
+import os
+
+import pytest
+from flask import Flask, render_template_string
+
+from src import assets
+from src.assets import IMMUTABLE_CACHE_CONTROL, build_assets, load_manifest, rewrite_css
+
+
+def _static_app(static_folder, manifest=None):
+    app = Flask(__name__, static_folder=str(static_folder), static_url_path="/static")
+    assets.init_app(app, manifest)
+
+    @app.route("/")
+    def index():
+        return render_template_string("{{ url_for('static', filename='main.css') }} "
+                                      "{{ url_for('static', filename='other.css') }}")
+    return app
+
+
+def test_rewrite_css_points_to_hashed_files():
+    css = """/* Background */
+body {
+    background-image: url('/static/assets/bg.jpg');
+}
+.logo { content: url("/static/assets/logo.ico"); }
+"""
+    files = {"assets/bg.jpg": "dist/assets/bg.1920.aaa.jpg", "assets/logo.ico": "dist/assets/logo.bbb.ico"}
+    images = {"assets/bg.jpg": {
+        "1280": {"WEBP": "dist/assets/bg.1280.ccc.webp", "JPEG": "dist/assets/bg.1280.ddd.jpg"},
+        "1920": {"WEBP": "dist/assets/bg.1920.eee.webp", "JPEG": "dist/assets/bg.1920.aaa.jpg"},
+    }}
+
+    result = rewrite_css(css, files, images)
+
+    assert "Background" not in result
+    assert "url('/static/dist/assets/bg.1920.aaa.jpg');" in result
+    assert "image-set(url('/static/dist/assets/bg.1920.eee.webp') type(\"image/webp\"), " \
+           "url('/static/dist/assets/bg.1920.aaa.jpg') type(\"image/jpeg\"))" in result
+    assert "url('/static/dist/assets/logo.bbb.ico')" in result
+    assert "@media (max-width: 800px) {\n    body { background-image: image-set(" \
+           "url('/static/dist/assets/bg.1280.ccc.webp')" in result
+
+
+def test_url_for_uses_the_manifest(tmp_path):
+    (tmp_path / "dist").mkdir()
+    (tmp_path / "dist" / "main.abc.css").write_text("body {}")
+    (tmp_path / "main.css").write_text("body {}")
+    app = _static_app(tmp_path, {"files": {"main.css": "dist/main.abc.css"}})
+    client = app.test_client()
+
+    assert client.get("/").data == b"/static/dist/main.abc.css /static/other.css"
+
+    hashed = client.get("/static/dist/main.abc.css")
+    assert hashed.headers["Cache-Control"] == IMMUTABLE_CACHE_CONTROL
+    original = client.get("/static/main.css")
+    assert original.headers.get("Cache-Control") != IMMUTABLE_CACHE_CONTROL
+    hashed.close()
+    original.close()
+
+
+def test_load_manifest(tmp_path):
+    assert load_manifest(str(tmp_path)) == {}
+    (tmp_path / "dist").mkdir()
+    (tmp_path / "dist" / "manifest.json").write_text("{not json")
+    assert load_manifest(str(tmp_path)) == {}
+    (tmp_path / "dist" / "manifest.json").write_text('{"files": {"a.css": "dist/a.1.css"}}')
+    assert load_manifest(str(tmp_path)) == {"files": {"a.css": "dist/a.1.css"}}
+
+
+def test_build_assets(tmp_path):
+    image_module = pytest.importorskip("PIL.Image")
+    (tmp_path / "assets").mkdir()
+    image_module.new("RGB", (1400, 700), (30, 60, 90)).save(tmp_path / "assets" / "bg.jpg", quality=95)
+    image_module.new("RGBA", (50, 50), (255, 0, 0, 128)).save(tmp_path / "assets" / "icon.png")
+    (tmp_path / "assets" / "logo.ico").write_bytes(b"ico")
+    (tmp_path / "main.css").write_text("body { background-image: url('/static/assets/bg.jpg'); }")
+    # A previous build is replaced
+    (tmp_path / "dist").mkdir()
+    (tmp_path / "dist" / "old.css").write_text("")
+
+    manifest = build_assets(str(tmp_path))
+
+    files = manifest["files"]
+    assert set(files) == {"assets/bg.jpg", "assets/icon.png", "assets/logo.ico", "main.css"}
+    assert not (tmp_path / "dist" / "old.css").exists()
+    assert json.loads((tmp_path / "dist" / "manifest.json").read_text()) == manifest
+    for name in files.values():
+        assert name.startswith("dist/") and (tmp_path / name).is_file()
+
+    # Resized (never upscaled) with WebP variants, url_for() gets the largest width
+    bg = manifest["images"]["assets/bg.jpg"]
+    assert set(bg) == {"640", "1280", "1400"}
+    assert "WEBP" in bg["640"] and files["assets/bg.jpg"] == bg["1400"]["JPEG"]
+    with image_module.open(tmp_path / bg["640"]["WEBP"]) as image:
+        assert image.size == (640, 320)
+    assert set(manifest["images"]["assets/icon.png"]) == {"50"}
+
+    # Same content, same names
+    assert build_assets(str(tmp_path)) == manifest
+    css = (tmp_path / files["main.css"]).read_text()
+    assert files["assets/bg.jpg"] in css and "image-set(" in css
+    assert os.path.basename(files["assets/logo.ico"]).startswith("logo.")
@@ -0,0 +1,148 @@
+import threading
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from src.cache import SWRCache, SingleFlight
+
+
+@patch("src.cache.monotonic")
+def test_fresh_entry_is_a_hit(mock_monotonic):
+    cache = SWRCache()
+    loader = MagicMock(return_value="v1")
+    mock_monotonic.return_value = 100.0
+
+    assert cache.get("k", loader, fresh=60, stale=60) == "v1"
+    mock_monotonic.return_value = 159.0
+    assert cache.get("k", loader, fresh=60, stale=60) == "v1"
+
+    loader.assert_called_once()
+    assert cache.stats() == dict(hits=1, misses=1, stale=0, shared=0, size=1, maxsize=64)
+
+
+@patch("src.cache.monotonic")
+def test_stale_entry_is_served_and_refreshed_in_background(mock_monotonic):
+    cache = SWRCache()
+    refreshed = threading.Event()
+    values = iter(["v1", "v2"])
+
+    def loader():
+        value = next(values)
+        if value == "v2":
+            refreshed.set()
+        return value
+
+    mock_monotonic.return_value = 100.0
+    cache.get("k", loader, fresh=60, stale=60)
+
+    mock_monotonic.return_value = 170.0
+    # Stale value comes back at once while v2 loads in the background
+    assert cache.get("k", loader, fresh=60, stale=60) == "v1"
+    assert refreshed.wait(5)
+    cache._executor.shutdown(wait=True)
+
+    assert cache.get("k", loader, fresh=60, stale=60) == "v2"
+    assert cache.stats()["stale"] == 1
+
+
+@patch("src.cache.monotonic")
+def test_expired_entry_is_a_miss(mock_monotonic):
+    cache = SWRCache()
+    loader = MagicMock(side_effect=["v1", "v2"])
+    mock_monotonic.return_value = 100.0
+    cache.get("k", loader, fresh=60, stale=60)
+
+    mock_monotonic.return_value = 221.0
+    assert cache.get("k", loader, fresh=60, stale=60) == "v2"
+    assert cache.stats()["misses"] == 2
+
+
+def test_falsy_values_are_not_cached():
+    cache = SWRCache()
+    loader = MagicMock(return_value={})
+
+    cache.get("k", loader, fresh=60)
+    cache.get("k", loader, fresh=60)
+
+    assert loader.call_count == 2
+    assert cache.stats()["size"] == 0
+
+
+def test_refresh_error_keeps_previous_value():
+    cache = SWRCache()
+    cache.set("k", "v1")
+
+    cache._refreshing.add("k")
+    cache._refresh("k", MagicMock(side_effect=RuntimeError("boom")))
+
+    assert "k" not in cache._refreshing
+    assert cache.get("k", MagicMock(), fresh=60) == "v1"
+
+
+def test_lru_eviction_and_clear():
+    cache = SWRCache(maxsize=2)
+    for key in ("a", "b", "c"):
+        cache.set(key, key)
+
+    assert list(cache._entries) == ["b", "c"]
+    cache.clear()
+    assert cache.stats() == dict(hits=0, misses=0, stale=0, shared=0, size=0, maxsize=2)
+
+
+def _run_concurrently(count, target):
+    threads = [threading.Thread(target=target) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads
+
+
+def test_single_flight_coalesces_concurrent_calls():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+    results = []
+
+    def slow():
+        calls.append(1)
+        release.wait(5)
+        return "value"
+
+    threads = _run_concurrently(5, lambda: results.append(flight.do("k", slow)))
+    # Wait until the four followers are parked on the leader's call
+    for _ in range(500):
+        if flight.shared == 4:
+            break
+        threading.Event().wait(0.01)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert results == ["value"] * 5
+    assert flight.shared == 4
+    assert flight._calls == {}
+
+
+def test_single_flight_shares_exceptions_and_recovers():
+    flight = SingleFlight()
+    with pytest.raises(RuntimeError):
+        flight.do("k", MagicMock(side_effect=RuntimeError("boom")))
+    assert flight.do("k", lambda: "ok") == "ok"
+
+
+def test_cache_misses_share_one_load():
+    cache = SWRCache()
+    release = threading.Event()
+    loader = MagicMock(side_effect=lambda: release.wait(5) and "v1")
+
+    threads = _run_concurrently(3, lambda: cache.get("k", loader, fresh=60))
+    for _ in range(500):
+        if cache.stats()["shared"] == 2:
+            break
+        threading.Event().wait(0.01)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    loader.assert_called_once()
+    assert cache.stats()["misses"] == 3
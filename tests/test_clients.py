@@ -0,0 +1,86 @@
+import threading
+import pytest
+from unittest.mock import patch
+
+from src import clients, weather
+from src.clients import ConcurrencyLimit, EcowittClient, WundergroundClient
+
+
+@pytest.fixture(autouse=True)
+def clear_api_cache():
+    weather.api_cache.clear()
+    yield
+    weather.api_cache.clear()
+
+
+@patch("src.clients.get_api_data", return_value={"ok": True})
+def test_ecowitt_history_url_is_encoded(mock_get_api_data):
+    client = EcowittClient("app", "key", "AA:BB", timeout=(1, 2), max_concurrency=1)
+
+    assert client.history("20230101", "20230131", cycle_type="4hour") == {"ok": True}
+
+    url = mock_get_api_data.call_args.args[0]
+    assert url.startswith("https://api.ecowitt.net/api/v3/device/history?application_key=app&api_key=key")
+    assert " " not in url
+    assert "cycle_type=4hour&start_date=20230101%2000:00:00&end_date=20230131%2023:59:59" in url
+    assert "call_back=outdoor.temperature,outdoor.humidity," in url
+    assert mock_get_api_data.call_args.kwargs == dict(use_cache=True, timeout=(1, 2), limit=client.limit)
+
+
+@patch("src.clients.get_api_data", return_value={})
+@patch("src.clients.local_today")
+def test_wunderground_daily_date_is_built_per_call(mock_today, mock_get_api_data):
+    client = WundergroundClient("ICERCE9", "secret")
+
+    mock_today.return_value = "20230310"
+    client.daily()
+    mock_today.return_value = "20230311"
+    client.daily()
+
+    urls = [call.args[0] for call in mock_get_api_data.call_args_list]
+    assert urls[0].endswith("&date=20230310") and urls[1].endswith("&date=20230311")
+    assert "stationId=ICERCE9" in urls[0]
+    assert mock_get_api_data.call_args.kwargs["timeout"] == clients.UPSTREAM_TIMEOUTS["wunderground"]
+
+
+def test_concurrency_limit_rejects_when_full():
+    limit = ConcurrencyLimit("test", 1, wait=0.01)
+    with limit:
+        with pytest.raises(TimeoutError):
+            with limit:
+                pass
+    # The slot is released on exit
+    with limit:
+        pass
+
+
+@patch("src.weather.safe_get")
+def test_slow_source_does_not_block_other_sources(mock_safe_get):
+    """A provider with every slot busy fails fast, other providers keep working."""
+    release = threading.Event()
+
+    def slow_get(url, allowed_hosts, timeout, stream=False):
+        if "ecowitt" in url:
+            release.wait(5)
+        response = mock_safe_get.return_value
+        response.text = '{"ok": true}'
+        return response
+
+    mock_safe_get.side_effect = slow_get
+    ecowitt = EcowittClient("app", "key", "mac", timeout=(0.01, 0.01), max_concurrency=1)
+    wunderground = WundergroundClient("ICERCE9", "secret", timeout=(1, 1))
+
+    worker = threading.Thread(target=lambda: ecowitt.get("/api/v3/device/real_time", {"a": 1}, use_cache=False))
+    worker.start()
+    try:
+        for _ in range(500):
+            if mock_safe_get.call_count:
+                break
+            release.wait(0.01)
+        # No free slot: the error is returned at once as {}
+        assert ecowitt.get("/api/v3/device/real_time", {"a": 2}, use_cache=False) == {}
+        assert wunderground.current() == {"ok": True}
+    finally:
+        release.set()
+        worker.join(5)
+    assert mock_safe_get.call_args.kwargs["timeout"] == (1, 1)
@@ -0,0 +1,63 @@
+import gzip
+import json
+
+import pytest
+from flask import Flask, jsonify
+from werkzeug.http import parse_accept_header
+
+from src import compression
+from src.compression import CompressedCache, compress, compress_response, negotiate
+
+
+@pytest.fixture(autouse=True)
+def clear_response_cache():
+    compression.response_cache.clear()
+    yield
+    compression.response_cache.clear()
+
+
+def test_negotiate():
+    assert negotiate(parse_accept_header("gzip, deflate"), 1000) == "gzip"
+    assert negotiate(parse_accept_header("gzip;q=0, identity"), 1000) is None
+    assert negotiate(parse_accept_header(""), 1000) is None
+    # Small bodies are sent as they are
+    assert negotiate(parse_accept_header("gzip"), 100) is None
+
+
+def test_negotiate_prefers_brotli_when_installed():
+    expected = "br" if compression.brotli is not None else "gzip"
+    assert negotiate(parse_accept_header("gzip, deflate, br"), 1000) == expected
+
+
+def test_gzip_is_deterministic():
+    data = b"rain " * 500
+    assert compress(data, "gzip") == compress(data, "gzip")
+    assert gzip.decompress(compress(data, "gzip")) == data
+    with pytest.raises(ValueError):
+        compress(data, "deflate")
+
+
+def test_compressed_cache_compresses_once():
+    cache = CompressedCache(max_entries=1)
+    data = b"sun " * 500
+    assert cache.get(data, "gzip") is cache.get(data, "gzip")
+    cache.get(b"other" * 200, "gzip")
+    assert cache.stats() == dict(entries=1, hits=1, misses=2)
+
+
+def test_compress_response_json():
+    app = Flask(__name__)
+    payload = {"values": list(range(300))}
+
+    with app.test_request_context(headers={"Accept-Encoding": "gzip"}):
+        response = compress_response(jsonify(payload), parse_accept_header("gzip"))
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert "Accept-Encoding" in response.headers["Vary"]
+        assert json.loads(gzip.decompress(response.get_data())) == payload
+
+        # Not accepted or too small: left as it is
+        plain = compress_response(jsonify(payload), parse_accept_header("identity"))
+        assert "Content-Encoding" not in plain.headers
+        small = compress_response(jsonify({"ok": True}), parse_accept_header("gzip"))
+        assert "Content-Encoding" not in small.headers
+    assert compression.response_cache.stats()["misses"] == 1
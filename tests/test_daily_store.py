@@ -0,0 +1,89 @@
+import os
+import tempfile
+
+from src import daily_store
+from src.daily_store import DailyStore, combine_days, daily_aggregates, day_range
+
+# 2023-01-09 23:30 UTC (2023-01-10 00:30 in Madrid) and 2023-01-10 12:00 UTC
+T1 = "1673307000"
+T2 = "1673352000"
+
+HISTORY = {
+    "data": {
+        "outdoor": {"temperature": {"list": {T1: "2.5", T2: "11"}},
+                    "humidity": {"list": {T1: "90", T2: "-"}}},
+        "rainfall": {"yearly": {"list": {T1: "10.0", T2: "12.5"}}},
+    }
+}
+
+
+def test_day_range():
+    assert day_range("20230227", "20230302") == ["20230227", "20230228", "20230301", "20230302"]
+    assert day_range("20230302", "20230301") == []
+
+
+def test_daily_aggregates_groups_by_local_day_and_skips_invalid_values():
+    aggregates = daily_aggregates(HISTORY)
+    assert aggregates[("20230110", "temperature")] == dict(
+        min=2.5, max=11.0, mean=6.75, sum=13.5, count=2, first=2.5, last=11.0)
+    assert aggregates[("20230110", "humidity")]["count"] == 1
+    assert ("20230110", "wind") not in aggregates
+
+
+def test_daily_aggregates_handles_empty_data():
+    assert daily_aggregates({"data": []}) == {}
+    assert daily_aggregates({}) == {}
+
+
+def test_store_and_summary():
+    store = DailyStore(":memory:")
+    assert store.store(HISTORY) == 3
+    store.store({"data": {"outdoor": {"temperature": {"list": {"1673438400": "-1"}}}}})
+
+    summary = store.summary("20230101", "20230131")
+    assert summary["temperature"] == {"min": -1.0, "max": 11.0, "mean": 12.5 / 3}
+    assert summary["rainfall"] == 2.5
+    assert summary["wind"] == "-"
+
+    summary = store.summary("20230111", "20230111")
+    assert summary["temperature"] == {"min": -1.0, "max": -1.0, "mean": -1.0}
+    assert summary["rainfall"] == "-"
+
+
+def test_store_replaces_rows_of_same_day():
+    store = DailyStore(":memory:")
+    store.store(HISTORY)
+    store.store({"data": {"outdoor": {"temperature": {"list": {T2: "15"}}}}})
+    assert store.summary("20230110", "20230110")["temperature"] == {"min": 15.0, "max": 15.0, "mean": 15.0}
+
+
+def test_combine_days_keeps_first_and_last_of_the_range():
+    stats = combine_days([(1, 5, 6, 2, 1, 5), (0, 9, 9, 3, 2, 4)])
+    assert stats == dict(min=0, max=9, sum=15, count=5, first=1, last=4, mean=3.0)
+    assert combine_days([]) == {}
+
+
+def test_missing_days():
+    store = DailyStore(":memory:")
+    store.mark_complete(["20230101", "20230102"])
+    store.mark_complete(["20230102"])
+    assert store.missing_days("20230101", "20230104") == ["20230103", "20230104"]
+
+
+def test_store_is_persisted():
+    path = os.path.join(tempfile.mkdtemp(), "daily.sqlite3")
+    store = DailyStore(path)
+    store.store(HISTORY)
+    store.mark_complete(["20230110"])
+    store.close()
+
+    store = DailyStore(path)
+    assert store.missing_days("20230110", "20230110") == []
+    assert store.summary("20230110", "20230110")["temperature"] == {"min": 2.5, "max": 11.0, "mean": 6.75}
+    store.close()
+
+
+def test_get_daily_store_is_shared(monkeypatch):
+    monkeypatch.setattr(daily_store, "_daily_store", None)
+    monkeypatch.setattr(daily_store, "DailyStore", lambda: object())
+    assert daily_store.get_daily_store() is daily_store.get_daily_store()
@@ -0,0 +1,59 @@
+import json
+
+import pytest
+
+from src.json_stream import StreamParser, parse_stream
+from src.timeseries import TimeSeries
+
+DOCUMENT = {
+    "code": 0,
+    "msg": "ok \"quoted\" é",
+    "data": {
+        "outdoor": {"temperature": {"unit": "ºC", "list": {"20": "1.5", "10": "-3e1", "30": "-"}}},
+        "values": [1, 2.5, -1.5e-3, True, False, None, {"a": []}],
+    },
+}
+BODY = json.dumps(DOCUMENT, ensure_ascii=False).encode("utf-8")
+
+
+def _chunks(body: bytes, size: int):
+    return [body[i:i + size] for i in range(0, len(body), size)]
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 5, 8, 64, 4096])
+def test_parse_stream_any_chunk_size(size):
+    result = parse_stream(_chunks(BODY, size))
+
+    assert result["msg"] == DOCUMENT["msg"]
+    assert result["data"]["values"] == DOCUMENT["data"]["values"]
+    temperature = result["data"]["outdoor"]["temperature"]
+    assert temperature["unit"] == "ºC"
+    # "list" objects become sorted TimeSeries, invalid values are skipped
+    assert temperature["list"] == TimeSeries([10, 20], [-30.0, 1.5])
+
+
+def test_parse_stream_other_series_key():
+    result = parse_stream([b'{"list": {"1": "2"}, "points": {"1": "2"}}'], series_key="points")
+    assert result == {"list": {"1": "2"}, "points": TimeSeries([1], [2.0])}
+
+
+def test_parse_stream_scalar_document():
+    assert parse_stream([b" 4", b"2 "]) == 42
+
+
+def test_series_ignores_nested_values():
+    assert parse_stream([b'{"list": {"1": {"x": 1}, "2": [3], "3": "4"}}']) == {"list": TimeSeries([3], [4.0])}
+
+
+@pytest.mark.parametrize("body", [b'{"a": 1', b'{"a": 1}}', b'{"a": 1} 2', b'{1: 2}', b'{"a": tru}'])
+def test_parse_stream_invalid_documents(body):
+    with pytest.raises(ValueError):
+        parse_stream([body])
+
+
+def test_parser_keeps_only_the_unparsed_tail():
+    parser = StreamParser()
+    parser.feed('{"list": {"1": "2.5"}, "n": 12')
+    assert parser._buffer == " 12"
+    parser.feed("3}")
+    assert parser.close() == {"list": TimeSeries([1], [2.5]), "n": 123}
@@ -1,7 +1,10 @@
 from io import StringIO
+import json
 import sys
+import threading
+import time
 import unittest
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
 
 from src import logger
 
@@ -151,3 +154,91 @@ def test_error_no_trace():
         redirect_reset()
 
         assert trace not in captured_output.getvalue()
+
+
+def test_lazy_message_is_not_built_when_disabled():
+    logger.LEVEL_LOG = "INFO, WARNING, ERROR"
+    build = MagicMock(return_value="Never")
+
+    with patch('src.logger.console.print') as mock_print:
+        logger.Log.debug(build)
+        logger.Log.info_dict("Data", build, "DEBUG")
+
+    build.assert_not_called()
+    mock_print.assert_not_called()
+
+
+def test_lazy_message_and_args():
+    logger.LEVEL_LOG = "DEBUG"
+
+    captured_output = redirect_stdout()
+    logger.Log.debug(lambda: "Lazy trace")
+    logger.Log.debug("Keys: %s of %d", "abc", 3)
+    redirect_reset()
+
+    assert "Lazy trace" in captured_output.getvalue()
+    assert "Keys: abc of 3" in captured_output.getvalue()
+
+
+def test_levels_are_resolved_once():
+    logger.LEVEL_LOG = "INFO, ERROR"
+    assert logger.Log.is_enabled_for("INFO")
+    assert not logger.Log.is_enabled_for("DEBUG")
+
+    with patch('src.logger._resolve_levels') as mock_resolve:
+        logger.Log.is_enabled_for("INFO")
+        logger.Log.debug("Test")
+        mock_resolve.assert_not_called()
+
+    # A new LEVEL_LOG value is resolved again
+    logger.LEVEL_LOG = "DEBUG"
+    assert logger.Log.is_enabled_for("DEBUG")
+    assert not logger.Log.is_enabled_for("INFO")
+
+
+def test_json_sink_writes_cloud_logging_fields():
+    stream = StringIO()
+    sink = logger.JsonSink(stream)
+    try:
+        raise ValueError("Bad value")
+    except ValueError as err:
+        sink.write(logger._record("ERROR", "Test Json", None, **logger._error_fields(err, sys)))
+    sink.write(logger._record("INFO", "Test data", None, data={"rain": 1.5}))
+
+    lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert lines[0]["severity"] == "ERROR" and lines[0]["message"] == "Test Json"
+    assert lines[0]["error"] == "ValueError" and lines[0]["detail"] == "Bad value"
+    assert lines[0]["logging.googleapis.com/sourceLocation"]["function"] == \
+        "test_json_sink_writes_cloud_logging_fields"
+    assert lines[1]["data"] == {"rain": 1.5}
+
+
+def test_queued_pipeline_drops_and_counts_records():
+    release = threading.Event()
+    written = []
+
+    class SlowSink():
+        def write(self, record):
+            release.wait(5)
+            written.append(record)
+
+    pipeline = logger.LogPipeline(SlowSink(), queue_size=2)
+    start = time.monotonic()
+    for number in range(10):
+        pipeline.emit(logger._record("INFO", f"Record {number}"))
+    # emit() never waits for the sink
+    assert time.monotonic() - start < 1
+    assert pipeline.dropped >= 7
+
+    release.set()
+    assert pipeline.flush()
+    assert written[-1]["severity"] == "WARNING"
+    assert written[-1]["dropped"] == pipeline.dropped
+    assert pipeline.stats() == dict(queued=0, dropped=pipeline.dropped, failed=0)
+
+
+def test_log_uses_the_pipeline():
+    logger.LEVEL_LOG = "INFO"
+    with patch.object(logger.pipeline, "emit") as mock_emit:
+        logger.Log.info("Test %s", "pipeline")
+    assert mock_emit.call_args.args[0]["message"] == "Test pipeline"
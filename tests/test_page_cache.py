@@ -0,0 +1,55 @@
+import threading
+
+from src.page_cache import PageCache, RenderedPage
+
+
+def test_rendered_page_etag_depends_on_content():
+    page = RenderedPage.build("<p>Rain</p>", 1700000000.7)
+    assert page.body == b"<p>Rain</p>"
+    assert page.etag == RenderedPage.build("<p>Rain</p>", 0).etag
+    assert page.etag != RenderedPage.build("<p>Sun</p>", 0).etag
+    assert page.last_modified.timestamp() == 1700000000
+
+
+def test_page_cache_renders_once_per_key():
+    cache = PageCache(max_entries=2)
+    renders = []
+
+    def render(text):
+        renders.append(text)
+        return text
+
+    assert cache.get(1, lambda: render("v1"), 0).body == b"v1"
+    assert cache.get(1, lambda: render("other"), 0).body == b"v1"
+    cache.get(2, lambda: render("v2"), 0)
+    cache.get(3, lambda: render("v3"), 0)
+    # Only the newest max_entries pages are kept
+    cache.get(1, lambda: render("v1 again"), 0)
+    assert renders == ["v1", "v2", "v3", "v1 again"]
+    assert cache.stats() == dict(pages=2, hits=1, renders=4, shared=0)
+
+
+def test_concurrent_requests_share_one_render():
+    cache = PageCache()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def render():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "page"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get("v", render, 0))) for _ in range(4)]
+    threads[0].start()
+    started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert len(results) == 4 and all(page.body == b"page" for page in results)
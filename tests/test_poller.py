@@ -0,0 +1,84 @@
+import threading
+from types import MappingProxyType
+from unittest.mock import MagicMock
+
+import pytest
+
+from src.poller import Poller, Snapshot
+
+
+def test_snapshot_starts_empty():
+    poller = Poller()
+    assert poller.snapshot.version == 0
+    assert poller.snapshot.has() is True
+    assert poller.snapshot.has("weather_data") is False
+
+
+def test_refresh_publishes_new_immutable_snapshot():
+    poller = Poller()
+    poller.add_source("weather_data", lambda: {"data": {"ok": 1}}, 60)
+    first = poller.snapshot
+
+    assert poller.refresh("weather_data") is True
+
+    second = poller.snapshot
+    assert second is not first
+    assert second.version == 1
+    assert second.data["weather_data"] == {"data": {"ok": 1}}
+    assert "weather_data" in second.updated
+    assert isinstance(second.data, MappingProxyType)
+    with pytest.raises(TypeError):
+        second.data["weather_data"] = {}
+    # Previous snapshot is never modified
+    assert first.has("weather_data") is False
+
+
+def test_refresh_keeps_previous_value_on_empty_result():
+    poller = Poller()
+    results = iter([{"v": 1}, {}])
+    poller.add_source("weather_data", lambda: next(results), 60)
+
+    assert poller.refresh("weather_data") is True
+    assert poller.refresh("weather_data") is False
+    assert poller.snapshot.data["weather_data"] == {"v": 1}
+    assert poller.snapshot.version == 1
+
+
+def test_refresh_handles_exception():
+    poller = Poller()
+    poller.add_source("summary", MagicMock(side_effect=RuntimeError("boom")), 60)
+
+    assert poller.refresh("summary") is False
+    assert poller.snapshot.version == 0
+
+
+def test_publish_keeps_other_sources():
+    poller = Poller()
+    poller.publish("a", 1)
+    poller.publish("b", 2)
+    assert dict(poller.snapshot.data) == {"a": 1, "b": 2}
+    assert poller.snapshot.has("a", "b")
+
+
+def test_start_polls_each_source_until_stopped():
+    poller = Poller()
+    polled = {"a": threading.Event(), "b": threading.Event()}
+    poller.add_source("a", lambda: polled["a"].set() or "A", 3600)
+    poller.add_source("b", lambda: polled["b"].set() or "B", 3600)
+
+    poller.start()
+    try:
+        assert polled["a"].wait(5) and polled["b"].wait(5)
+        assert poller.running is True
+        assert poller.sources == ("a", "b")
+    finally:
+        poller.stop(timeout=5)
+
+    assert poller.running is False
+    assert poller.snapshot.has("a", "b")
+
+
+def test_snapshot_is_frozen():
+    snapshot = Snapshot()
+    with pytest.raises(Exception):
+        snapshot.version = 5
@@ -0,0 +1,197 @@
+import multiprocessing
+import threading
+import time
+import tracemalloc
+
+import pytest
+
+from src import logger
+from src.rate_limit import RateLimitBackend, RateLimiter, SQLiteRateLimiter, create_rate_limiter
+
+
+def test_limit_within_window():
+    limiter = RateLimiter()
+    assert [limiter.hit("a", 3, 60, 10.0) for _ in range(4)] == [True, True, True, False]
+    # Other keys have their own counters
+    assert limiter.hit("b", 3, 60, 10.0)
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request, tmp_path):
+    return create_rate_limiter(request.param, path=str(tmp_path / "limits.sqlite3"))
+
+
+def test_previous_window_is_weighted(backend):
+    limiter = backend
+    for _ in range(10):
+        assert limiter.hit("a", 10, 60, 30.0)
+    # 15 s into the next window 75% of the previous one still counts: 7.5 + 2 requests
+    assert limiter.hit("a", 10, 60, 75.0)
+    assert limiter.hit("a", 10, 60, 75.0)
+    assert not limiter.hit("a", 10, 60, 75.0)
+    # Half way the previous window only weights 5 requests: 5 + 2 + 3 more
+    assert [limiter.hit("a", 10, 60, 90.0) for _ in range(4)] == [True, True, True, False]
+
+
+def test_late_request_does_not_reset_counters(backend):
+    """A request whose time was read before a newer one is counted in the newest window."""
+    limiter = backend
+    assert [limiter.hit("a", 3, 60, 59.0) for _ in range(3)] == [True, True, True]
+    assert not limiter.hit("a", 3, 60, 60.001)
+    assert not limiter.hit("a", 3, 60, 59.999)
+    assert not limiter.hit("a", 3, 60, 60.002)
+
+
+def test_old_windows_are_forgotten():
+    limiter = RateLimiter()
+    assert limiter.hit("a", 1, 60, 100.0)
+    assert not limiter.hit("a", 1, 60, 110.0)
+    # Two windows later nothing is left of the first one
+    assert limiter.hit("a", 1, 60, 200.0)
+
+
+def test_lru_cap_evicts_least_recently_used():
+    limiter = RateLimiter(max_keys=2, shards=1)
+    limiter.hit("a", 5, 60, 0.0)
+    limiter.hit("b", 5, 60, 0.0)
+    limiter.hit("a", 5, 60, 1.0)
+    limiter.hit("c", 5, 60, 2.0)
+    assert len(limiter) == 2
+    assert "a" in limiter and "c" in limiter and "b" not in limiter
+
+
+@pytest.mark.performance
+@pytest.mark.parametrize("keys", [10_000, 100_000])
+def test_rate_limiter_benchmark(keys):
+    """Memory per key and time per request do not depend on the limits."""
+    results = {}
+    for limit in (60, 6000):
+        limiter = RateLimiter(max_keys=keys)
+        started = time.perf_counter()
+        for request in range(3):
+            for key in range(keys):
+                limiter.hit(("10.0.0.1", key), limit, 60, 1000.0 + request)
+        per_request = (time.perf_counter() - started) / (3 * keys) * 1e6
+
+        limiter = RateLimiter(max_keys=keys)
+        tracemalloc.start()
+        for key in range(keys):
+            limiter.hit(("10.0.0.1", key), limit, 60, 1000.0)
+        memory, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results[limit] = memory / keys
+        logger.Log.debug(f"*** {keys} keys, limit {limit}: {memory / keys:.0f} bytes/key "
+                         f"(key tuple included), {per_request:.2f} us/request")
+
+    # Each shard caps its own share of the keys, so a few may have been evicted
+    assert 0.9 * keys < len(limiter) <= keys
+    # A deque of timestamps per key would grow with the limit, counters do not
+    assert results[6000] < results[60] * 1.2
+    assert results[6000] < 400
+
+
+def test_keys_are_spread_over_shards():
+    limiter = RateLimiter(max_keys=1000, shards=8)
+    for key in range(800):
+        limiter.hit(("10.0.0.1", key), 5, 60, 0.0)
+    sizes = [len(shard.windows) for shard in limiter._shards]
+    assert sum(sizes) == 800 and min(sizes) > 0
+
+
+def test_sweep_drops_expired_keys():
+    limiter = RateLimiter(shards=4)
+    limiter.hit("old", 5, 60, 0.0)
+    limiter.hit("recent", 5, 60, 100.0)
+    # "old" is in window 0, it stops counting at 120; "recent" is in window 1
+    assert limiter.sweep(119.0) == 0
+    assert limiter.sweep(120.0) == 1
+    assert "old" not in limiter and "recent" in limiter
+
+
+def test_background_sweeper():
+    limiter = RateLimiter(shards=2)
+    limiter.hit("old", 5, 1, 0.0)
+    limiter.start_sweeper(interval=0.01)
+    try:
+        for _ in range(500):
+            if "old" not in limiter:
+                break
+            time.sleep(0.01)
+    finally:
+        limiter.stop_sweeper()
+    assert "old" not in limiter
+
+
+def test_concurrent_hits_are_counted_once():
+    limiter = RateLimiter(shards=8)
+    allowed = []
+
+    def worker():
+        allowed.append(sum(limiter.hit(("ip", key % 10), 100, 60, 10.0) for key in range(500)))
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    # 10 keys with a limit of 100 each, whatever the interleaving
+    assert sum(allowed) == 1000
+
+
+def _hit_many(path, count, results):
+    limiter = SQLiteRateLimiter(path)
+    results.put(sum(limiter.hit(("1.2.3.4", "/"), 50, 60, 10.0) for _ in range(count)))
+
+
+def test_sqlite_backend_is_shared_between_processes(tmp_path):
+    path = str(tmp_path / "limits.sqlite3")
+    SQLiteRateLimiter(path)
+    results = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=_hit_many, args=(path, 30, results)) for _ in range(3)]
+    for worker in workers:
+        worker.start()
+    allowed = [results.get(timeout=30) for _ in workers]
+    for worker in workers:
+        worker.join(10)
+
+    # 90 requests from three processes, only the limit of the shared key passes
+    assert sum(allowed) == 50
+    assert ("1.2.3.4", "/") in SQLiteRateLimiter(path)
+
+
+def test_sqlite_backend_sweep_and_cap(tmp_path):
+    limiter = SQLiteRateLimiter(str(tmp_path / "limits.sqlite3"), max_keys=2)
+    limiter.hit("old", 5, 60, 10.0)
+    for second, key in enumerate(("a", "b", "c")):
+        limiter.hit(key, 5, 60, 130.0 + second)
+    assert len(limiter) == 4
+
+    # "old" expired at 120 s and "a" is the least recently used over max_keys
+    assert limiter.sweep(140.0) == 2
+    assert "b" in limiter and "c" in limiter and "a" not in limiter
+
+    limiter.clear()
+    assert len(limiter) == 0
+
+
+def test_sqlite_backend_fails_open(tmp_path):
+    limiter = SQLiteRateLimiter(str(tmp_path / "limits.sqlite3"))
+    limiter._connection().execute("DROP TABLE rate_limits")
+    assert all(limiter.hit("a", 1, 60, 10.0) for _ in range(3))
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        create_rate_limiter("redis")
+
+
+def test_incomplete_backend_can_not_be_created():
+    class NoSweep(RateLimitBackend):
+        def hit(self, key, limit, window, now):
+            return True
+
+        def clear(self):
+            pass
+
+    with pytest.raises(TypeError):
+        NoSweep()
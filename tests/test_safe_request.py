@@ -1,11 +1,24 @@
+import io
+
 import pytest
 from unittest.mock import patch, MagicMock
+from urllib3.response import HTTPResponse
+
 from src import safe_request
 
 
 ALLOWED_HOSTS = {"api.ecowitt.net", "api.weather.com"}
 
 
+@pytest.fixture(autouse=True)
+def clear_dns_cache():
+    safe_request.clear_dns_cache()
+    safe_request.reset_breakers()
+    yield
+    safe_request.clear_dns_cache()
+    safe_request.reset_breakers()
+
+
 def test_validate_safe_url_rejects_non_https():
     with pytest.raises(ValueError, match="Only HTTPS"):
         safe_request.validate_safe_url("http://api.ecowitt.net/path", ALLOWED_HOSTS)
@@ -48,13 +61,13 @@ def test_validate_safe_url_accepts_public_ip(mock_getaddrinfo):
     safe_request.validate_safe_url("https://api.ecowitt.net/path", ALLOWED_HOSTS)
 
 
-@patch("src.safe_request.requests.get")
+@patch("src.safe_request.requests.Session.get")
 @patch("src.safe_request.socket.getaddrinfo")
 def test_safe_get_returns_response(mock_getaddrinfo, mock_requests_get):
     mock_getaddrinfo.return_value = [
         (2, 1, 6, "", ("8.8.8.8", 443)),
     ]
-    mock_response = MagicMock()
+    mock_response = MagicMock(status_code=200)
     mock_response.text = '{"ok": true}'
     mock_requests_get.return_value = mock_response
 
@@ -65,9 +78,52 @@ def test_safe_get_returns_response(mock_getaddrinfo, mock_requests_get):
         "https://api.ecowitt.net/path",
         timeout=10,
         allow_redirects=False,
+        stream=False,
     )
 
 
+@patch("src.safe_request.requests.Session.get")
+@patch("src.safe_request.socket.getaddrinfo")
+def test_safe_get_reuses_session_per_host(mock_getaddrinfo, mock_session_get):
+    mock_getaddrinfo.return_value = [
+        (2, 1, 6, "", ("8.8.8.8", 443)),
+    ]
+    mock_session_get.return_value.status_code = 200
+    safe_request.close_sessions()
+
+    safe_request.safe_get("https://api.ecowitt.net/a", ALLOWED_HOSTS)
+    safe_request.safe_get("https://api.ecowitt.net/b", ALLOWED_HOSTS)
+    safe_request.safe_get("https://api.weather.com/c", ALLOWED_HOSTS)
+
+    assert mock_session_get.call_count == 3
+    assert set(safe_request._sessions) == {"api.ecowitt.net", "api.weather.com"}
+    assert safe_request.get_session("api.ecowitt.net") is safe_request._sessions["api.ecowitt.net"][0]
+    safe_request.close_sessions()
+
+
+@patch("src.safe_request.monotonic")
+def test_get_session_evicts_idle_sessions(mock_monotonic):
+    safe_request.close_sessions()
+    mock_monotonic.return_value = 1000.0
+    first = safe_request.get_session("api.ecowitt.net")
+    other = safe_request.get_session("api.weather.com")
+
+    mock_monotonic.return_value = 1000.0 + safe_request.POOL_IDLE_SECONDS + 1
+    again = safe_request.get_session("api.ecowitt.net")
+
+    assert again is not first
+    assert "api.weather.com" not in safe_request._sessions
+    assert other is not safe_request.get_session("api.weather.com")
+    safe_request.close_sessions()
+
+
+def test_pooled_session_does_not_keep_cookies():
+    session = safe_request._new_session()
+    # An empty domain allowlist makes the jar reject every Set-Cookie header
+    assert session.cookies.get_policy().allowed_domains() == ()
+    session.close()
+
+
 @patch("src.safe_request.socket.getaddrinfo")
 def test_safe_get_raises_on_private_ip(mock_getaddrinfo):
     mock_getaddrinfo.return_value = [
@@ -77,6 +133,118 @@ def test_safe_get_raises_on_private_ip(mock_getaddrinfo):
         safe_request.safe_get("https://api.ecowitt.net/path", ALLOWED_HOSTS)
 
 
+@patch("src.safe_request.socket.getaddrinfo")
+def test_resolve_public_ips_uses_cache(mock_getaddrinfo):
+    mock_getaddrinfo.return_value = [
+        (2, 1, 6, "", ("8.8.8.8", 443)),
+    ]
+    safe_request.validate_safe_url("https://api.ecowitt.net/a", ALLOWED_HOSTS)
+    assert safe_request.resolve_public_ips("api.ecowitt.net") == ("8.8.8.8",)
+    mock_getaddrinfo.assert_called_once()
+
+
+@patch("src.safe_request.monotonic")
+@patch("src.safe_request.socket.getaddrinfo")
+def test_resolve_public_ips_expires_after_ttl(mock_getaddrinfo, mock_monotonic):
+    mock_getaddrinfo.return_value = [
+        (2, 1, 6, "", ("8.8.8.8", 443)),
+    ]
+    mock_monotonic.return_value = 100.0
+    safe_request.resolve_public_ips("api.ecowitt.net")
+
+    mock_getaddrinfo.return_value = [
+        (2, 1, 6, "", ("10.0.0.1", 443)),
+    ]
+    mock_monotonic.return_value = 100.0 + safe_request.DNS_CACHE_TTL + 1
+    with pytest.raises(ValueError, match="non-public IP"):
+        safe_request.resolve_public_ips("api.ecowitt.net")
+    assert mock_getaddrinfo.call_count == 2
+    assert "api.ecowitt.net" not in safe_request._dns_cache
+
+
+@patch("src.safe_request.socket.getaddrinfo")
+def test_resolve_public_ips_bounded(mock_getaddrinfo):
+    mock_getaddrinfo.return_value = [
+        (2, 1, 6, "", ("8.8.8.8", 443)),
+    ]
+    with patch("src.safe_request.DNS_CACHE_MAX_HOSTS", 2):
+        for host in ("a.example.com", "b.example.com", "c.example.com"):
+            safe_request.resolve_public_ips(host)
+    assert list(safe_request._dns_cache) == ["b.example.com", "c.example.com"]
+
+
+@patch("src.safe_request.socket.getaddrinfo")
+def test_pinned_adapter_connects_to_validated_ip(mock_getaddrinfo):
+    mock_getaddrinfo.return_value = [
+        (2, 1, 6, "", ("52.10.0.1", 443)),
+    ]
+    adapter = safe_request.PinnedIPAdapter()
+    pool = adapter.get_connection("https://api.ecowitt.net/path?x=1")
+
+    assert pool.host == "52.10.0.1"
+    assert pool.port == 443
+    assert pool.assert_hostname == "api.ecowitt.net"
+    assert pool.conn_kw["server_hostname"] == "api.ecowitt.net"
+
+    request = MagicMock()
+    request.url = "https://api.ecowitt.net/path?x=1"
+    request.headers = {}
+    adapter.add_headers(request)
+    assert request.headers["Host"] == "api.ecowitt.net"
+    adapter.close()
+
+
+@patch("src.safe_request.socket.getaddrinfo")
+def test_session_request_goes_to_validated_ip(mock_getaddrinfo):
+    """The whole session.get path (whatever connection method requests calls) uses the pinned pool."""
+    mock_getaddrinfo.return_value = [
+        (2, 1, 6, "", ("52.10.0.1", 443)),
+    ]
+    pools = []
+
+    def fake_urlopen(pool, method, url, **kwargs):
+        pools.append(pool)
+        return HTTPResponse(body=io.BytesIO(b"{}"), status=200, preload_content=False)
+
+    session = safe_request._new_session()
+    with patch("urllib3.connectionpool.HTTPConnectionPool.urlopen", autospec=True, side_effect=fake_urlopen):
+        response = session.get("https://api.ecowitt.net/path?x=1", timeout=1)
+
+    assert response.status_code == 200
+    assert [(pool.host, pool.conn_kw["server_hostname"]) for pool in pools] == [("52.10.0.1", "api.ecowitt.net")]
+    session.close()
+
+
+@patch("src.safe_request.socket.getaddrinfo")
+def test_pinned_adapter_falls_back_to_other_ips(mock_getaddrinfo):
+    mock_getaddrinfo.return_value = [
+        (10, 1, 6, "", ("2600::1", 443, 0, 0)),
+        (2, 1, 6, "", ("52.10.0.1", 443)),
+    ]
+    adapter = safe_request.PinnedIPAdapter()
+    hosts = []
+
+    def send(self, request, **kwargs):
+        pool = self.get_connection(request.url, kwargs.get("proxies"))
+        hosts.append(pool.host)
+        if pool.host == "2600::1":
+            raise safe_request.requests.ConnectionError("Network is unreachable")
+        return "response"
+
+    request = MagicMock(url="https://api.ecowitt.net/path")
+    with patch("src.safe_request.HTTPAdapter.send", send):
+        assert adapter.send(request) == "response"
+        # The IP that failed is now tried last
+        assert adapter.send(request) == "response"
+        assert hosts == ["2600::1", "52.10.0.1", "52.10.0.1"]
+
+        mock_getaddrinfo.return_value = [(10, 1, 6, "", ("2600::1", 443, 0, 0))]
+        safe_request.clear_dns_cache()
+        with pytest.raises(safe_request.requests.ConnectionError):
+            adapter.send(request)
+    adapter.close()
+
+
 def test_is_public_ip_true():
     assert safe_request.is_public_ip("8.8.8.8") is True
     assert safe_request.is_public_ip("52.10.0.1") is True
@@ -87,3 +255,80 @@ def test_is_public_ip_false():
     assert safe_request.is_public_ip("192.168.1.1") is False
     assert safe_request.is_public_ip("10.0.0.1") is False
     assert safe_request.is_public_ip("169.254.1.1") is False
+
+
+def test_circuit_breaker_opens_and_probes():
+    breaker = safe_request.CircuitBreaker("host", window=4, min_calls=4, failure_rate=0.5, reset_seconds=30)
+    with patch("src.safe_request.monotonic", return_value=100.0):
+        breaker.record_success()
+        breaker.record_success()
+        breaker.record_failure()
+        assert breaker.state == "closed"
+        breaker.record_failure()
+        # 2 failures of the last 4 calls
+        assert breaker.state == "open"
+        assert not breaker.allow()
+        assert breaker.stats()["retry_in"] == 30
+
+    with patch("src.safe_request.monotonic", return_value=130.0):
+        assert breaker.state == "half_open"
+        # Only one probe at a time
+        assert breaker.allow()
+        assert not breaker.allow()
+        breaker.record_failure()
+        assert breaker.state == "open"
+
+    with patch("src.safe_request.monotonic", return_value=160.0):
+        assert breaker.allow()
+        breaker.record_success()
+        assert breaker.stats() == dict(state="closed", calls=1, failures=0, rejected=2, retry_in=0.0)
+
+
+@patch("src.safe_request.requests.Session.get")
+@patch("src.safe_request.socket.getaddrinfo")
+def test_safe_get_fails_fast_when_circuit_open(mock_getaddrinfo, mock_session_get):
+    mock_getaddrinfo.return_value = [(2, 1, 6, "", ("8.8.8.8", 443))]
+    mock_session_get.side_effect = safe_request.requests.ConnectTimeout("timeout")
+
+    for _ in range(safe_request.BREAKER_MIN_CALLS):
+        with pytest.raises(safe_request.requests.ConnectTimeout):
+            safe_request.safe_get("https://api.ecowitt.net/path", ALLOWED_HOSTS)
+
+    with pytest.raises(safe_request.CircuitOpenError):
+        safe_request.safe_get("https://api.ecowitt.net/path", ALLOWED_HOSTS)
+    assert mock_session_get.call_count == safe_request.BREAKER_MIN_CALLS
+    assert safe_request.breaker_states()["api.ecowitt.net"]["state"] == "open"
+
+    # Other hosts are not affected
+    mock_session_get.side_effect = None
+    mock_session_get.return_value.status_code = 200
+    safe_request.safe_get("https://api.weather.com/path", ALLOWED_HOSTS)
+    assert safe_request.breaker_states()["api.weather.com"]["state"] == "closed"
+
+
+def test_safe_get_validation_errors_do_not_open_circuit():
+    for _ in range(safe_request.BREAKER_MIN_CALLS + 1):
+        with pytest.raises(ValueError):
+            safe_request.safe_get("https://evil.example.org/path", ALLOWED_HOSTS)
+    assert safe_request.breaker_states()["evil.example.org"]["state"] == "closed"
+
+
+@patch("src.safe_request.requests.Session.get")
+@patch("src.safe_request.socket.getaddrinfo")
+def test_safe_get_unexpected_error_gives_back_probe(mock_getaddrinfo, mock_session_get):
+    mock_getaddrinfo.return_value = [(2, 1, 6, "", ("8.8.8.8", 443))]
+    breaker = safe_request.get_breaker("api.ecowitt.net")
+    with patch("src.safe_request.monotonic", return_value=100.0):
+        for _ in range(breaker.min_calls):
+            breaker.record_failure()
+        assert breaker.state == "open"
+
+    with patch("src.safe_request.monotonic", return_value=100.0 + breaker.reset_seconds):
+        mock_session_get.side_effect = RuntimeError("unexpected")
+        with pytest.raises(RuntimeError):
+            safe_request.safe_get("https://api.ecowitt.net/path", ALLOWED_HOSTS)
+        # The probe is free again, the host is not rejected forever
+        mock_session_get.side_effect = None
+        mock_session_get.return_value.status_code = 200
+        safe_request.safe_get("https://api.ecowitt.net/path", ALLOWED_HOSTS)
+        assert breaker.state == "closed"
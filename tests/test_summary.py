@@ -0,0 +1,52 @@
+from array import array
+
+import pytest
+
+from src.summary import MetricSpec, SUMMARY_SPECS, apply_spec, percentile, series_stats, summarize
+from src.timeseries import TimeSeries
+
+HISTORY = {
+    "data": {
+        "outdoor": {"temperature": {"list": TimeSeries([1, 2, 3, 4], [4.0, 1.0, 3.0, 2.0])}},
+        "rainfall": {"yearly": {"list": {"1": "100.5", "2": "112"}}},
+    }
+}
+
+
+def test_series_stats_computes_every_statistic():
+    stats = series_stats(array('d', [4.0, 1.0, 3.0, 2.0]), percentiles=(50, 90))
+    assert stats == dict(min=1.0, max=4.0, mean=2.5, sum=10.0, count=4, first=4.0, last=2.0,
+                         p50=2.5, p90=pytest.approx(3.7))
+
+
+def test_series_stats_empty():
+    assert series_stats(array('d')) == {}
+
+
+def test_percentile_bounds():
+    values = [1.0, 2.0, 3.0]
+    assert percentile(values, 0) == 1.0
+    assert percentile(values, 100) == 3.0
+    assert percentile([7.0], 50) == 7.0
+
+
+def test_apply_spec():
+    stats = series_stats([1.0, 3.0], percentiles=(50,))
+    assert apply_spec(MetricSpec(("a",)), stats) == {"min": 1.0, "max": 3.0, "mean": 2.0}
+    assert apply_spec(MetricSpec(("a",), stats=("last",), percentiles=(50,)), stats) == {"last": 3.0, "p50": 2.0}
+    assert apply_spec(MetricSpec(("a",), reduce=lambda s: s["count"]), stats) == 2
+    assert apply_spec(MetricSpec(("a",)), {}) == "-"
+
+
+def test_summarize_uses_specs_per_metric():
+    summary = summarize(HISTORY)
+    assert set(summary) == set(SUMMARY_SPECS)
+    assert summary["temperature"] == {"min": 1.0, "max": 4.0, "mean": 2.5}
+    assert summary["rainfall"] == 11.5
+    assert summary["wind"] == "-"
+
+
+def test_summarize_custom_specs():
+    specs = {"temp_p50": MetricSpec(("outdoor", "temperature"), stats=(), percentiles=(50,))}
+    assert summarize(HISTORY, specs) == {"temp_p50": {"p50": 2.5}}
+    assert summarize({"data": []}, specs) == {"temp_p50": "-"}
@@ -0,0 +1,78 @@
+from datetime import date, timedelta
+
+import pytest
+from dateutil import tz
+
+from src import sun
+
+LONDON = (51.5074, -0.1278, tz.gettz("Europe/London"))
+MADRID = (40.4168, -3.7038, tz.gettz("Europe/Madrid"))
+# Station defaults (STATION_LATITUDE, STATION_LONGITUDE), the place of the page
+STATION = (40.727, -4.074, tz.gettz("Europe/Madrid"))
+
+# Published sunrise/sunset times (local clock, HH:MM or HH:MM:SS) used as reference.
+# The engine must agree within a minute.
+REFERENCE_TIMES = [
+    (LONDON, date(2021, 6, 21), "04:43", "21:21"),
+    (LONDON, date(2021, 12, 21), "08:04", "15:53"),
+    (MADRID, date(2024, 6, 21), "06:44", "21:48"),
+    # Station, computed with astral 3.2 (an independent implementation of the NOAA calculator)
+    (STATION, date(2024, 6, 21), "06:45:34", "21:50:51"),
+    (STATION, date(2024, 12, 21), "08:37:19", "17:51:55"),
+    (STATION, date(2024, 3, 20), "07:19:18", "19:28:32"),
+]
+
+
+def _minutes(clock: str) -> float:
+    hours, minutes, seconds = (clock.split(":") + ["0"])[:3]
+    return int(hours) * 60 + int(minutes) + int(seconds) / 60
+
+
+@pytest.mark.parametrize("place, day, sunrise, sunset", REFERENCE_TIMES)
+def test_sun_times_match_reference(place, day, sunrise, sunset):
+    latitude, longitude, tzinfo = place
+    times = sun.sun_times(day, latitude, longitude, tzinfo)
+
+    got_sunrise = times.sunrise.hour * 60 + times.sunrise.minute + times.sunrise.second / 60
+    got_sunset = times.sunset.hour * 60 + times.sunset.minute + times.sunset.second / 60
+    assert abs(got_sunrise - _minutes(sunrise)) <= 1
+    assert abs(got_sunset - _minutes(sunset)) <= 1
+
+
+def test_station_defaults_are_used():
+    """sun_times() without a place is the station, as the page shows it"""
+    assert sun.sun_times(date(2024, 6, 21)) == sun.sun_times(date(2024, 6, 21), *STATION)
+
+
+def test_twilight_order_and_day_length():
+    times = sun.sun_times(date(2024, 3, 20))
+    assert times.astronomical_twilight_begin < times.nautical_twilight_begin < times.civil_twilight_begin \
+        < times.sunrise < times.solar_noon < times.sunset < times.civil_twilight_end
+    assert times.day_length == times.sunset - times.sunrise
+    # Around the equinox the day is a bit longer than 12 hours
+    assert timedelta(hours=12) < times.day_length < timedelta(hours=12, minutes=15)
+
+
+def test_polar_day_has_no_sunrise():
+    times = sun.sun_times(date(2024, 6, 21), 78.22, 15.65, tz.UTC)
+    assert times.sunrise is None and times.sunset is None and times.day_length is None
+    assert sun.format_sun_times(times)["sunrise"] == "-"
+    assert times.solar_noon is not None
+
+
+def test_year_table():
+    table = sun.year_table(2024)
+    assert len(table) == 366
+    assert sun.get_sun_times("20240229") is table["20240229"]
+
+
+def test_year_table_pads_small_years():
+    assert sun.get_sun_times("00010101").day == date(1, 1, 1)
+    assert len(sun.year_table(9999)) == 365
+
+
+def test_format_sun_times():
+    result = sun.format_sun_times(sun.sun_times(date(2021, 6, 21), *LONDON))
+    assert result["sunrise"] == "04:43:07"
+    assert result["day_length"] == "16:38:28"
+    assert result["date"] == "2021-06-21"
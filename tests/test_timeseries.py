@@ -0,0 +1,53 @@
+from dateutil import tz
+
+from src.timeseries import TimeSeries, as_time_series
+
+MADRID = tz.gettz("Europe/Madrid")
+
+
+def test_from_dict_sorts_and_skips_invalid_values():
+    series = TimeSeries.from_dict({"30": "3.5", "10": "1", "20": "-", "x": "2"})
+    assert list(series.timestamps) == [10, 30]
+    assert list(series.values) == [1.0, 3.5]
+    assert series.timestamps.typecode == "q"
+    assert series.values.typecode == "d"
+    assert len(series) == 2
+    assert repr(series) == "TimeSeries(2 points)"
+
+
+def test_min_max_and_slice():
+    series = TimeSeries([1, 2, 3], [5.0, -1.0, 9.5])
+    assert series.min() == -1.0
+    assert series.max() == 9.5
+    assert series.slice(1, 3) == TimeSeries([2, 3], [-1.0, 9.5])
+    assert series != {"1": "5"}
+
+
+def test_as_time_series():
+    series = TimeSeries([1], [1.0])
+    assert as_time_series(series) is series
+    assert as_time_series({"1": "1"}) == series
+
+
+def test_split_days_uses_local_midnight():
+    # 2023-03-25 22:30 UTC is 23:30 in Madrid, 23:30 UTC is already the 26th.
+    # 2023-03-26 is the DST change, the day is 23 hours long.
+    series = TimeSeries([1679783400, 1679787000, 1679864400, 1679869800], [1, 2, 3, 4])
+    days = list(series.split_days(MADRID))
+    assert days == [("20230325", 0, 1), ("20230326", 1, 3), ("20230327", 3, 4)]
+
+
+def test_append_and_sort():
+    series = TimeSeries()
+    series.append(3, 3.0)
+    series.append(1, 1.0)
+    series.sort()
+    assert series == TimeSeries([1, 3], [1.0, 3.0])
+    sorted_series = TimeSeries([1, 2], [1.0, 2.0])
+    values = sorted_series.values
+    sorted_series.sort()
+    assert sorted_series.values is values
+
+
+def test_split_days_empty():
+    assert list(TimeSeries().split_days(MADRID)) == []
@@ -47,28 +47,47 @@ class TestUtils(unittest.TestCase):
         self.assertIsNotNone(result)
         self.assertIn("", captured_output.getvalue())  # Check output was captured
 
+    def test_convert_date_12_hour_clock(self):
+        """AM/PM hours are converted like strptime does"""
+        self.assertEqual("2022-01-01 01:05:00+01:00", str(utils.convert_date("20220101 12:05:00 AM")))
+        self.assertEqual("2022-07-01 14:05:00+02:00", str(utils.convert_date("20220701 12:05:00 PM")))
+        with self.assertRaises(ValueError):
+            utils.convert_date("20220101 13:05:00 PM")
+
+    @patch("src.utils.Log.info")
+    def test_convert_date_does_not_log(self, mock_info):
+        utils.convert_date("20220101 11:59:00 PM")
+        mock_info.assert_not_called()
+
+    def test_local_days_across_dst_changes(self):
+        """local_days gives the same days as converting every timestamp"""
+        # One minute steps around the March and October 2023 changes in Madrid
+        timestamps = list(range(1679792400 - 7200, 1679792400 + 7200, 60)) + \
+            list(range(1698541200 - 7200, 1698541200 + 7200, 60))
+        zone = utils.get_zone("Europe/Madrid")
+        expected = [datetime.fromtimestamp(timestamp, zone).strftime("%Y%m%d") for timestamp in timestamps]
+        self.assertEqual(expected, utils.local_days(timestamps))
+        # Local midnight of 2023-07-01 is 22:00 UTC
+        self.assertEqual(["20230630", "20230701"], utils.local_days([1688162399, 1688162400]))
+
     def test_check_cache(self):
         """Test that check_cache returns without errors"""
         captured_output = redirect_stdout()
-        ret = utils.check_cache(minutes=1)
+        ret = utils.check_cache()
         redirect_reset()
         output = captured_output.getvalue()
         print(output)
         # Verify that check_cache executed and returned None (expected behavior)
         self.assertIsNone(ret)
 
-    @patch("src.utils.get_summary_data")
-    def test_check_cache_expiration(self, mock_get_summary_data):
-        """Test cache expiration logic"""
-        # Mock the cache info and simulate expiration
-        mock_get_summary_data.cache_info.return_value = "Cache Info Mocked"
-        mock_get_summary_data.cache_clear.return_value = None
-        utils.previous_cache = datetime.now() - timedelta(minutes=62)
-        captured_output = redirect_stdout()
-        utils.check_cache(minutes=1)
-        redirect_reset()
-        # Ensure expiration branch cleared the cache
-        self.assertTrue(mock_get_summary_data.cache_clear.called)
+    @patch("src.utils.Log.info")
+    def test_check_cache_logs_stats(self, mock_info):
+        """check_cache logs the counters of the API and summary caches"""
+        utils.check_cache()
+        messages = " ".join(str(call.args[0]) for call in mock_info.call_args_list)
+        self.assertIn("API CACHE", messages)
+        self.assertIn("SUMMARY CACHE", messages)
+        self.assertIn("hits", messages)
 
     def test_timed_lru_cache_basic_functionality(self):
         """Test that timed_lru_cache decorator works for basic caching"""
@@ -2,9 +2,22 @@ import pytest
 from unittest.mock import patch, MagicMock
 from src import weather, web
 from src import logger
+from src import safe_request
+from src.daily_store import DailyStore, day_range
+from src.timeseries import TimeSeries
 
-from src.config import (URL_SUNRISE_SUNSET, URL_WEATHER_ECOWITT_CURRENT,
-                        URL_WEATHER_WUNDERGROUND_CURRENT, URL_WEATHER_WUNDERGROUND_DAY, URL_WEATHER_ECOWITT_HISTOY)
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    safe_request.clear_dns_cache()
+    safe_request.reset_breakers()
+    weather.api_cache.clear()
+    weather.summary_cache.clear()
+    yield
+    safe_request.clear_dns_cache()
+    safe_request.reset_breakers()
+    weather.api_cache.clear()
+    weather.summary_cache.clear()
 
 
 @pytest.mark.performance
@@ -18,24 +31,24 @@ def test_get_summary_data():
     # Test the time for getting data from url using timeit.repeat
     from timeit import repeat
 
-    setup_code = "from src import weather, web"
-    stmt = "weather.get_summary_data(web.URL_WEATHER_ECOWITT_HISTOY)"
+    setup_code = "from src import weather, clients"
+    stmt = "weather.get_summary_data(clients.ecowitt)"
     times = repeat(setup=setup_code, stmt=stmt, repeat=4, number=2)
 
     logger.Log.debug(f"*** Execution params: -Repeat: 4, - Times: 2")
     logger.Log.debug(f"*** Execution times: {times}")
     logger.Log.debug(f"*** Minimum execution time: {min(times)}")
     
-    logger.Log.debug(f"*** Current Cache info: {weather.get_summary_data.cache_info()}")
+    logger.Log.debug(f"*** Current Cache info: {weather.summary_cache.stats()}")
     # cleaning cache
-    weather.get_summary_data.cache_clear()
-    logger.Log.debug(f"*** Cleaning Cache info: {weather.get_summary_data.cache_info()}")
+    weather.summary_cache.clear()
+    logger.Log.debug(f"*** Cleaning Cache info: {weather.summary_cache.stats()}")
 
 
-@patch("src.weather.get_api_data")
+@patch("src.weather.get_daily_store")
 @patch("src.weather.get_month_dates")
 @patch("src.weather.get_year_dates")
-def test_get_summary_data_logic(mock_get_year_dates, mock_get_month_dates, mock_get_api_data):
+def test_get_summary_data_logic(mock_get_year_dates, mock_get_month_dates, mock_get_daily_store):
     """Test get_summary_data logic with mocked dependencies.
     
     Mock data structure simulates EcoWitt API response with:
@@ -49,22 +62,22 @@ def test_get_summary_data_logic(mock_get_year_dates, mock_get_month_dates, mock_
     # Mocking the dependencies
     mock_get_month_dates.return_value = ("20230101", "20230131")
     mock_get_year_dates.return_value = ("20230101", "20231231")
-    # Mock API response structure matching EcoWitt format
-    mock_get_api_data.return_value = {
+    mock_get_daily_store.return_value = DailyStore(":memory:")
+    # Mock API response structure matching EcoWitt format (2023-01-10 12:00 and 13:00 UTC)
+    client = MagicMock()
+    client.history.return_value = {
         "data": {
-            "outdoor": {"temperature": {"list": {"1": "10", "2": "20"}}, 
-                        "humidity": {"list": {"1": "30", "2": "50"}}},
-            "wind": {"wind_speed": {"list": {"1": "5", "2": "15"}}},
-            "pressure": {"relative": {"list": {"1": "1000", "2": "1020"}}},
-            "solar_and_uvi": {"uvi": {"list": {"1": "1", "2": "3"}}},
-            "rainfall": {"yearly": {"list": {"1": "100", "2": "200"}}},
+            "outdoor": {"temperature": {"list": {"1673352000": "10", "1673355600": "20"}},
+                        "humidity": {"list": {"1673352000": "30", "1673355600": "50"}}},
+            "wind": {"wind_speed": {"list": {"1673352000": "5", "1673355600": "15"}}},
+            "pressure": {"relative": {"list": {"1673352000": "1000", "1673355600": "1020"}}},
+            "solar_and_uvi": {"uvi": {"list": {"1673352000": "1", "1673355600": "3"}}},
+            "rainfall": {"yearly": {"list": {"1673352000": "100", "1673355600": "200"}}},
         }
     }
 
     # Call the function
-    url = URL_WEATHER_ECOWITT_HISTOY + "&start_date=20230101&end_date=20230131"
-    logger.Log.debug(f"*** Calling get_summary_data with URL: \n{url}")
-    result = weather.get_summary_data(url)
+    result = weather.get_summary_data(client)
     logger.Log.debug(f"*** Result: \n{result}")
 
     # Assertions
@@ -73,15 +86,171 @@ def test_get_summary_data_logic(mock_get_year_dates, mock_get_month_dates, mock_
     assert result[0]["temperature"]["max"] == 20.0
     assert "rainfall" in result[0]
     assert result[0]["rainfall"] == 100.0
-
-
-def test_get_min_max():
-    # Test the get_min_max function
-    data = {"1": "10", "2": "20", "3": "15"}
-    result = weather.get_min_max(data)
-
-    assert result["min"] == 10.0
-    assert result["max"] == 20.0
+    assert result[1]["pressure"] == {"min": 1000.0, "max": 1020.0, "mean": 1010.0}
+
+
+@patch("src.weather.local_today", return_value="20230310")
+@patch("src.weather.get_daily_store")
+def test_range_summary_only_downloads_missing_days(mock_get_daily_store, _mock_today):
+    """Complete days in the store are not downloaded again, today always is."""
+    store = DailyStore(":memory:")
+    store.mark_complete(day_range("20230101", "20230309"))
+    mock_get_daily_store.return_value = store
+    client = MagicMock()
+    client.history.return_value = {"data": {"outdoor": {"temperature": {"list": {"1678449600": "7"}}}}}
+
+    month_summary = weather.get_range_summary(client, "20230301", "20230310", cycle_type="4hour")
+    year_summary = weather.get_range_summary(client, "20230101", "20230310")
+
+    client.history.assert_called_with("20230310", "20230310", cycle_type="4hour", use_cache=True)
+    assert month_summary["temperature"] == {"min": 7.0, "max": 7.0, "mean": 7.0}
+    assert year_summary["wind"] == "-"
+    # Today is never marked as complete
+    assert store.missing_days("20230301", "20230310") == ["20230310"]
+
+
+@patch("src.weather.local_today", return_value="20230310")
+@patch("src.weather.get_daily_store")
+def test_range_summary_marks_only_received_days(mock_get_daily_store, _mock_today):
+    """Days missing from the response and yesterday are downloaded again."""
+    store = DailyStore(":memory:")
+    mock_get_daily_store.return_value = store
+    client = MagicMock()
+    # 2023-03-05 and 2023-03-09 at 12:00 UTC
+    client.history.return_value = {"data": {"outdoor": {"temperature": {
+        "list": {"1678017600": "5", "1678363200": "9"}}}}}
+
+    weather.get_range_summary(client, "20230301", "20230310", cycle_type="4hour")
+
+    assert store.missing_days("20230301", "20230310") == [
+        "20230301", "20230302", "20230303", "20230304", "20230306", "20230307", "20230308",
+        "20230309", "20230310"]
+
+
+@patch("src.weather.local_today", return_value="20230303")
+@patch("src.weather.get_daily_store")
+def test_range_summary_fills_past_months(mock_get_daily_store, _mock_today):
+    """An empty store downloads the past months with 1day and this month with 4hour."""
+    store = DailyStore(":memory:")
+    mock_get_daily_store.return_value = store
+    client = MagicMock()
+    client.history.return_value = {}
+
+    weather.get_range_summary(client, "20230101", "20230303", cycle_type="1day")
+
+    client.history.assert_any_call("20230101", "20230228", cycle_type="1day", use_cache=True)
+    client.history.assert_any_call("20230301", "20230303", cycle_type="4hour", use_cache=True)
+    # Failed downloads do not mark anything as complete
+    assert len(store.missing_days("20230101", "20230303")) == 62
+
+
+@patch("src.weather.local_today", return_value="20230310")
+@patch("src.weather.get_daily_store")
+def test_range_summary_failed_download_is_not_cached(mock_get_daily_store, _mock_today):
+    """A failed history download gives {} and the next call downloads it again."""
+    mock_get_daily_store.return_value = DailyStore(":memory:")
+    client = MagicMock(station="mac")
+    client.history.return_value = {}
+
+    assert weather.get_range_summary(client, "20230301", "20230310", cycle_type="4hour") == {}
+
+    client.history.return_value = {"data": {"outdoor": {"temperature": {"list": {"1678449600": "7"}}}}}
+    summary = weather.get_range_summary(client, "20230301", "20230310", cycle_type="4hour")
+    assert summary["temperature"] == {"min": 7.0, "max": 7.0, "mean": 7.0}
+    assert client.history.call_count == 2
+
+
+@patch("src.weather.local_today", return_value="20230310")
+@patch("src.weather.get_daily_store")
+def test_range_summary_without_cache_replaces_cached_summary(mock_get_daily_store, _mock_today):
+    """use_cache=False (the poller) downloads again and updates the cached summary."""
+    mock_get_daily_store.return_value = DailyStore(":memory:")
+    client = MagicMock(station="mac")
+    client.history.return_value = {"data": {"outdoor": {"temperature": {"list": {"1678449600": "7"}}}}}
+    weather.get_range_summary(client, "20230301", "20230310", cycle_type="4hour")
+
+    client.history.return_value = {"data": {"outdoor": {"temperature": {"list": {"1678453200": "9"}}}}}
+    polled = weather.get_range_summary(client, "20230301", "20230310", cycle_type="4hour", use_cache=False)
+
+    client.history.assert_called_with("20230301", "20230310", cycle_type="4hour", use_cache=False)
+    assert polled["temperature"]["max"] == 9.0
+    assert weather.get_range_summary(client, "20230301", "20230310", cycle_type="4hour") is polled
+
+
+@patch("src.weather.get_range_summary", side_effect=[{"rainfall": 1.0}, {}])
+def test_get_summary_data_failed_range(_mock_range):
+    assert weather.get_summary_data(MagicMock(station="mac")) == {}
+
+
+@patch("src.weather.local_today")
+@patch("src.weather._load_range_summary")
+def test_range_summary_cache_expiry(mock_load, mock_today):
+    """Current ranges refresh with SUMMARY_REFRESH_SECONDS, past ranges never change."""
+    mock_load.side_effect = lambda url, date_from, date_to, cycle: {"to": date_to, "n": mock_load.call_count}
+    mock_today.return_value = "20230310"
+    client = MagicMock(station="mac")
+
+    with patch("src.cache.monotonic", return_value=0):
+        current = weather.get_range_summary(client, "20230301", "20230310")
+        past = weather.get_range_summary(client, "20230201", "20230228")
+    with patch("src.cache.monotonic", return_value=weather.SUMMARY_REFRESH_SECONDS - 1):
+        assert weather.get_range_summary(client, "20230301", "20230310") is current
+    with patch("src.cache.monotonic", return_value=weather.SUMMARY_REFRESH_SECONDS + 1):
+        assert weather.get_range_summary(client, "20230301", "20230310") is not current
+    with patch("src.cache.monotonic", return_value=10 ** 9):
+        assert weather.get_range_summary(client, "20230201", "20230228") is past
+        # Once the day is over, the range computed while it was open is recomputed once
+        mock_today.return_value = "20230311"
+        closed = weather.get_range_summary(client, "20230301", "20230310")
+        assert closed["n"] == mock_load.call_count
+        assert weather.get_range_summary(client, "20230301", "20230310") is closed
+
+
+@patch("src.weather.get_range_summary")
+@patch("src.weather.get_month_dates", return_value=("20230301", "20230310"))
+@patch("src.weather.get_year_dates", return_value=("20230101", "20230310"))
+def test_get_summary_data_ranges(_mock_year, _mock_month, mock_range):
+    mock_range.side_effect = lambda url, date_from, date_to, cycle_type, use_cache: (date_from, cycle_type)
+
+    assert weather.get_summary_data(MagicMock(station="mac")) == (("20230301", "4hour"), ("20230101", "1day"))
+
+
+@patch("src.weather.get_range_summary", side_effect=RuntimeError("boom"))
+def test_get_summary_data_error(_mock_range):
+    assert weather.get_summary_data(MagicMock(station="mac")) == {}
+
+
+@patch("src.weather._load_range_summary")
+def test_get_summary_data_single_flight(mock_load):
+    """Concurrent cache misses must trigger one summary download per range."""
+    import threading
+    release = threading.Event()
+    mock_load.side_effect = lambda url, date_from, date_to, cycle: release.wait(5) and {"from": date_from}
+    results = []
+    client = MagicMock(station="mac-sf")
+
+    threads = [threading.Thread(target=lambda: results.append(weather.get_summary_data(client)))
+               for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for _ in range(500):
+        if weather.summary_cache.stats()["shared"] == 2:
+            break
+        release.wait(0.01)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert mock_load.call_count == 2
+    assert len(results) == 3 and all(result == results[0] for result in results)
+
+
+def test_local_dates_use_station_time_zone():
+    month_from, today = weather.get_month_dates()
+    year_from, year_today = weather.get_year_dates()
+    assert today == year_today == weather.local_today()
+    assert month_from == today[:6] + "01"
+    assert year_from == today[:4] + "0101"
 
 
 def test_get_summary_empty_data():
@@ -97,18 +266,8 @@ def test_get_summary_empty_data():
     assert result["rainfall"] == "-"
 
 
-@patch("src.weather.get_min_max")
-def test_get_summary(mock_get_min_max):
+def test_get_summary():
     # Test get_summary with valid data
-    mock_get_min_max.side_effect = [
-        {"min": 10, "max": 20},
-        {"min": 5, "max": 15},
-        {"min": 30, "max": 50},
-        {"min": 1000, "max": 1020},
-        {"min": 1, "max": 3},
-        {"min": 100, "max": 200},
-    ]
-
     data = {
         "data": {
             "outdoor": {"temperature": {"list": {"1": "10", "2": "20"}}, 
@@ -124,16 +283,22 @@ def test_get_summary(mock_get_min_max):
 
     assert result["temperature"]["min"] == 10
     assert result["temperature"]["max"] == 20
+    assert result["temperature"]["mean"] == 15
+    assert result["wind"] == {"min": 5, "max": 15, "mean": 10}
     assert result["rainfall"] == 100
 
 
-@patch("src.safe_request.requests.get")
+def test_get_summary_error():
+    assert weather.get_summary({}) == {}
+
+
+@patch("src.safe_request.requests.Session.get")
 @patch("src.safe_request.socket.getaddrinfo")
 def test_get_api_data_allows_public_dns(mock_getaddrinfo, mock_requests_get):
     mock_getaddrinfo.return_value = [
         (2, 1, 6, "", ("8.8.8.8", 443)),
     ]
-    mock_response = MagicMock()
+    mock_response = MagicMock(status_code=200)
     mock_response.text = '{"ok": true}'
     mock_requests_get.return_value = mock_response
 
@@ -144,6 +309,7 @@ def test_get_api_data_allows_public_dns(mock_getaddrinfo, mock_requests_get):
         "https://api.ecowitt.net/api/v3/device/real_time?x=1",
         timeout=10,
         allow_redirects=False,
+        stream=False,
     )
 
 
@@ -167,6 +333,52 @@ def test_get_api_data_rejects_non_allowlisted_host():
     assert result == {}
 
 
+@patch("src.weather._fetch_api_data")
+def test_get_api_data_uses_cache(mock_fetch):
+    mock_fetch.return_value = {"ok": True}
+    url = "https://api.ecowitt.net/api/v3/device/real_time?b=2&a=1"
+
+    assert weather.get_api_data(url) == {"ok": True}
+    # Same params in another order share the cache entry
+    assert weather.get_api_data("https://api.ecowitt.net/api/v3/device/real_time?a=1&b=2") == {"ok": True}
+    mock_fetch.assert_called_once_with(url, weather.DEFAULT_TIMEOUT, None)
+    assert weather.api_cache.stats()["hits"] == 1
+
+    weather.get_api_data(url, use_cache=False)
+    assert mock_fetch.call_count == 2
+
+
+@patch("src.weather._fetch_api_data")
+def test_get_api_data_does_not_cache_errors(mock_fetch):
+    mock_fetch.return_value = {}
+    url = "https://api.ecowitt.net/api/v3/device/real_time?x=1"
+
+    assert weather.get_api_data(url) == {}
+    assert weather.get_api_data(url) == {}
+    assert mock_fetch.call_count == 2
+
+
+@patch("src.weather.safe_get")
+def test_fetch_api_data_parses_history_series(mock_safe_get):
+    response = mock_safe_get.return_value.__enter__.return_value
+    response.encoding = None
+    response.iter_content.return_value = [
+        b'{"data": {"outdoor": {"temperature": {"li', b'st": {"1": "10", "2": "2', b'0"}}}}}']
+
+    result = weather._fetch_api_data("https://api.ecowitt.net/api/v3/device/history?x=1")
+
+    mock_safe_get.assert_called_once_with(
+        "https://api.ecowitt.net/api/v3/device/history?x=1", weather.ALLOWED_API_HOSTS, timeout=10, stream=True)
+
+    series = result["data"]["outdoor"]["temperature"]["list"]
+    assert isinstance(series, TimeSeries)
+    assert weather.get_summary(result)["temperature"] == {"min": 10.0, "max": 20.0, "mean": 15.0}
+
+
+def test_normalize_url():
+    assert weather._normalize_url("HTTPS://API.ecowitt.net/p?b=2&a=1#frag") == "https://api.ecowitt.net/p?a=1&b=2"
+
+
 def test_mask_url_secrets():
     """Test that sensitive query params are masked in URLs"""
     url = "https://api.ecowitt.net/api?application_key=SECRET1&api_key=SECRET2&mac=PUBLIC"
@@ -185,3 +397,8 @@ def test_mask_url_secrets_wunderground():
     assert "MYSECRET" not in masked
     assert "apiKey=***" in masked
     assert "stationId=ICERCE9" in masked
+
+
+@patch("src.weather.safe_get", side_effect=safe_request.CircuitOpenError("Circuit open for host: api.ecowitt.net"))
+def test_fetch_api_data_circuit_open(_mock_safe_get):
+    assert weather._fetch_api_data("https://api.ecowitt.net/api/v3/device/real_time?x=1") == {}
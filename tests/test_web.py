@@ -1,28 +1,51 @@
+import gzip
 import unittest
 from unittest.mock import patch
 import logging
-from collections import deque
+import threading
+import time
 
 logging.basicConfig(level=logging.DEBUG)
 
 from src import web
+from src.compression import compress
+
+
+def _snapshot_data():
+    """Every source of the home page, as published by the poller"""
+    return {
+        "weather_current": {'observations': [{'metric': {'temp': 10}}]},
+        "weather_day": {'observations': [{'metric': {'tempLow': 5, 'tempHigh': 15}}]},
+        "weather_data": {'data': {
+            'outdoor': {'temperature': {'value': '10'}, 'humidity': {'value': '50'}},
+            'rainfall': {'1_hour': {'value': '0.0'}, 'daily': {'value': '0.0'},
+                         'monthly': {'value': '0.0'}, 'yearly': {'value': '0.0', 'unit': 'mm'}},
+            'wind': {'wind_speed': {'value': '0.0'}},
+            'pressure': {'relative': {'value': '1013.0'}},
+            'solar_and_uvi': {'uvi': {'value': '0'}},
+        }},
+        "summary": ({'temperature': {'min': 5, 'max': 15}, 'wind': '-', 'humidity': '-',
+                     'pressure': '-', 'uvi': '-', 'rainfall': 0.0},
+                    {'temperature': {'min': 0, 'max': 20}, 'wind': '-', 'humidity': '-',
+                     'pressure': '-', 'uvi': '-', 'rainfall': 1.0}),
+    }
 
 
 class TestWeb(unittest.TestCase):
 
     def setUp(self):
         self.app = web.app.test_client()
-        web._request_history.clear()
+        web.rate_limiter.clear()
+        web.page_cache.clear()
+        web.reset_failed_sources()
 
     @patch("src.web.get_summary_data")
-    @patch("src.web.get_api_data")
+    @patch("src.clients.get_api_data")
     def test_home(self, mock_get_api_data, mock_get_summary_data):
         """Test that home page loads successfully"""
         # Mock API responses with complete structure matching EcoWitt API
-        def side_effect_get_api_data(url):
-            if 'sunrise-sunset' in url:
-                return {'results': {'sunrise': '7:00:00 AM', 'sunset': '6:00:00 PM'}}
-            elif 'ecowitt' in url:
+        def side_effect_get_api_data(url, **kwargs):
+            if 'ecowitt' in url:
                 return {
                     'data': {
                         'outdoor': {
@@ -62,33 +85,33 @@ class TestWeb(unittest.TestCase):
         self.assertTrue(len(response.data) > 0)
         self.assertIn(b'html', response.data.lower())
 
-    @patch("src.web.get_api_data")
-    def test_home_key_error(self, mock_get_api_data):
+    @patch("src.web.get_page_data")
+    def test_home_key_error(self, mock_get_page_data):
         """Test that KeyError is handled gracefully with appropriate error message"""
-        # Simulate a KeyError in get_api_data
-        mock_get_api_data.side_effect = KeyError("Test KeyError")
+        # Simulate a KeyError while getting the page data
+        mock_get_page_data.side_effect = KeyError("Test KeyError")
         response = self.app.get("/")
         self.assertEqual(500, response.status_code)
         self.assertIn(b"Data processing error occurred", response.data)
         # Verify error template is rendered
         self.assertIn(b"error", response.data.lower())
 
-    @patch("src.web.get_api_data")
-    def test_home_value_error(self, mock_get_api_data):
+    @patch("src.web.get_page_data")
+    def test_home_value_error(self, mock_get_page_data):
         """Test that ValueError is handled gracefully with maintenance message"""
-        # Simulate a ValueError in get_api_data
-        mock_get_api_data.side_effect = ValueError("Test ValueError")
+        # Simulate a ValueError while getting the page data
+        mock_get_page_data.side_effect = ValueError("Test ValueError")
         response = self.app.get("/")
         self.assertEqual(500, response.status_code)
         self.assertIn(b"Website under maintenance", response.data)
         # Verify error template is used
         self.assertIn(b"error", response.data.lower())
 
-    @patch("src.web.get_api_data")
-    def test_home_generic_exception(self, mock_get_api_data):
+    @patch("src.web.get_page_data")
+    def test_home_generic_exception(self, mock_get_page_data):
         """Test that generic exceptions are handled with maintenance message"""
-        # Simulate a generic Exception in get_api_data
-        mock_get_api_data.side_effect = Exception("Test Generic Exception")
+        # Simulate a generic Exception while getting the page data
+        mock_get_page_data.side_effect = Exception("Test Generic Exception")
         response = self.app.get("/")
         self.assertEqual(500, response.status_code)
         self.assertIn(b"Website under maintenance", response.data)
@@ -96,14 +119,12 @@ class TestWeb(unittest.TestCase):
         self.assertTrue(len(response.data) > 0)
 
     @patch("src.web.get_summary_data")
-    @patch("src.web.get_api_data")
+    @patch("src.clients.get_api_data")
     def test_home_route_alias(self, mock_get_api_data, mock_get_summary_data):
         """Test that /home route works as alias for root"""
         # Mock API responses with complete structure
-        def side_effect_get_api_data(url):
-            if 'sunrise-sunset' in url:
-                return {'results': {'sunrise': '7:00:00 AM', 'sunset': '6:00:00 PM'}}
-            elif 'ecowitt' in url:
+        def side_effect_get_api_data(url, **kwargs):
+            if 'ecowitt' in url:
                 return {
                     'data': {
                         'outdoor': {
@@ -143,12 +164,10 @@ class TestWeb(unittest.TestCase):
         self.assertEqual(root_response.status_code, response.status_code)
 
     @patch("src.web.get_summary_data")
-    @patch("src.web.get_api_data")
+    @patch("src.clients.get_api_data")
     def test_security_headers_present(self, mock_get_api_data, mock_get_summary_data):
-        def side_effect_get_api_data(url):
-            if 'sunrise-sunset' in url:
-                return {'results': {'sunrise': '7:00:00 AM', 'sunset': '6:00:00 PM'}}
-            elif 'ecowitt' in url:
+        def side_effect_get_api_data(url, **kwargs):
+            if 'ecowitt' in url:
                 return {
                     'data': {
                         'outdoor': {'temperature': {'value': '10'}, 'humidity': {'value': '50'}},
@@ -178,13 +197,11 @@ class TestWeb(unittest.TestCase):
         self.assertIsNotNone(response.headers.get('Content-Security-Policy'))
 
     @patch("src.web.get_summary_data")
-    @patch("src.web.get_api_data")
+    @patch("src.clients.get_api_data")
     def test_security_headers_hsts_in_production(self, mock_get_api_data, mock_get_summary_data):
         """HSTS header should be present when production mode flag is enabled."""
-        def side_effect_get_api_data(url):
-            if 'sunrise-sunset' in url:
-                return {'results': {'sunrise': '7:00:00 AM', 'sunset': '6:00:00 PM'}}
-            elif 'ecowitt' in url:
+        def side_effect_get_api_data(url, **kwargs):
+            if 'ecowitt' in url:
                 return {
                     'data': {
                         'outdoor': {'temperature': {'value': '10'}, 'humidity': {'value': '50'}},
@@ -228,13 +245,11 @@ class TestWeb(unittest.TestCase):
         self.assertEqual(200, response.status_code)
 
     @patch("src.web.get_summary_data")
-    @patch("src.web.get_api_data")
+    @patch("src.clients.get_api_data")
     def test_rate_limit_returns_429(self, mock_get_api_data, mock_get_summary_data):
         """Second request should be rejected when limit is set to 1 request per window."""
-        def side_effect_get_api_data(url):
-            if 'sunrise-sunset' in url:
-                return {'results': {'sunrise': '7:00:00 AM', 'sunset': '6:00:00 PM'}}
-            elif 'ecowitt' in url:
+        def side_effect_get_api_data(url, **kwargs):
+            if 'ecowitt' in url:
                 return {
                     'data': {
                         'outdoor': {'temperature': {'value': '10'}, 'humidity': {'value': '50'}},
@@ -269,15 +284,21 @@ class TestWeb(unittest.TestCase):
         self.assertEqual(429, second.status_code)
         self.assertEqual({"error": "Too many requests"}, second.get_json())
 
+    def test_api_data_endpoints_have_api_rate_limit(self):
+        """The data API gets the stricter limit of /api/rain-today, not the generic one."""
+        limit, _window = web._RATE_LIMITS["/api/sun"]
+        statuses = [self.app.get("/api/sun").status_code for _ in range(limit + 1)]
+        self.assertEqual([200] * limit + [429], statuses)
+        for path in ("/api/current", "/api/summary/month", "/api/summary/year"):
+            self.assertEqual(web._RATE_LIMITS["/api/rain-today"], web._RATE_LIMITS[path])
+
     @patch("src.web.get_summary_data")
-    @patch("src.web.get_api_data")
-    @patch("src.web.time", return_value=200.0)
-    def test_rate_limit_discards_expired_timestamps(self, _mock_time, mock_get_api_data, mock_get_summary_data):
-        """Expired timestamps in request history must be removed before evaluating limits."""
-        def side_effect_get_api_data(url):
-            if 'sunrise-sunset' in url:
-                return {'results': {'sunrise': '7:00:00 AM', 'sunset': '6:00:00 PM'}}
-            elif 'ecowitt' in url:
+    @patch("src.clients.get_api_data")
+    @patch("src.web.time")
+    def test_rate_limit_discards_expired_timestamps(self, mock_time, mock_get_api_data, mock_get_summary_data):
+        """Requests of expired windows must not count against the limit."""
+        def side_effect_get_api_data(url, **kwargs):
+            if 'ecowitt' in url:
                 return {
                     'data': {
                         'outdoor': {'temperature': {'value': '10'}, 'humidity': {'value': '50'}},
@@ -304,22 +325,247 @@ class TestWeb(unittest.TestCase):
         key = ("127.0.0.1", "/")
         try:
             web._RATE_LIMITS["/"] = (1, 60)
-            web._request_history[key] = deque([100.0])
+            mock_time.return_value = 100.0
+            first = self.app.get("/")
+            mock_time.return_value = 200.0
             response = self.app.get("/")
         finally:
             web._RATE_LIMITS["/"] = original_limit
 
+        self.assertEqual(200, first.status_code)
+        self.assertEqual(200, response.status_code)
+        self.assertIn(key, web.rate_limiter)
+
+    @patch("src.web.get_summary_data")
+    @patch("src.clients.get_api_data")
+    def test_home_fetches_sources_concurrently(self, mock_get_api_data, mock_get_summary_data):
+        """All three upstream calls must be in flight at the same time."""
+        barrier = threading.Barrier(3, timeout=5)
+
+        def side_effect_get_api_data(url, **kwargs):
+            # Blocks until the other two fetches arrive; a sequential home()
+            # would break the barrier and render the error page.
+            barrier.wait()
+            if 'ecowitt' in url:
+                return {
+                    'data': {
+                        'outdoor': {'temperature': {'value': '10'}, 'humidity': {'value': '50'}},
+                        'rainfall': {
+                            '1_hour': {'value': '0.0', 'unit': 'mm'},
+                            'daily': {'value': '0.0', 'unit': 'mm'},
+                            'monthly': {'value': '0.0', 'unit': 'mm'},
+                            'yearly': {'value': '0.0', 'unit': 'mm'}
+                        },
+                        'wind': {'wind_speed': {'value': '0.0'}},
+                        'pressure': {'relative': {'value': '1013.0'}},
+                        'solar_and_uvi': {'uvi': {'value': '0'}},
+                    }
+                }
+            return {'observations': [{'metric': {'temp': 10, 'tempLow': 5, 'tempHigh': 15}}]}
+
+        mock_get_api_data.side_effect = side_effect_get_api_data
+        mock_get_summary_data.return_value = (
+            {'temperature': {'min': 5, 'max': 15}, 'wind': '-', 'humidity': '-', 'pressure': '-', 'uvi': '-', 'rainfall': 0.0},
+            {'temperature': {'min': 0, 'max': 20}, 'wind': '-', 'humidity': '-', 'pressure': '-', 'uvi': '-', 'rainfall': 0.0}
+        )
+
+        response = self.app.get("/")
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(3, mock_get_api_data.call_count)
+        mock_get_summary_data.assert_called_once()
+
+    @patch("src.web.get_summary_data")
+    @patch("src.clients.get_api_data")
+    def test_home_uses_poller_snapshot(self, mock_get_api_data, mock_get_summary_data):
+        """When the snapshot has every source, home() must not call upstream APIs."""
+        year_summary = {'temperature': {'min': 0, 'max': 20}, 'wind': '-', 'humidity': '-',
+                        'pressure': '-', 'uvi': '-', 'rainfall': 12.345}
+        data = {
+            "weather_current": {'observations': [{'metric': {'temp': 10}}]},
+            "weather_day": {'observations': [{'metric': {'tempLow': 5, 'tempHigh': 15}}]},
+            "weather_data": {'data': {
+                'outdoor': {'temperature': {'value': '10'}, 'humidity': {'value': '50'}},
+                'rainfall': {'1_hour': {'value': '0.0'}, 'daily': {'value': '0.0'},
+                             'monthly': {'value': '0.0'}, 'yearly': {'value': '0.0', 'unit': 'mm'}},
+                'wind': {'wind_speed': {'value': '0.0'}},
+                'pressure': {'relative': {'value': '1013.0'}},
+                'solar_and_uvi': {'uvi': {'value': '0'}},
+            }},
+            "summary": ({'temperature': {'min': 5, 'max': 15}, 'wind': '-', 'humidity': '-',
+                         'pressure': '-', 'uvi': '-', 'rainfall': 0.0}, year_summary),
+        }
+        snapshot = web.poller.snapshot
+        try:
+            for name, value in data.items():
+                web.poller.publish(name, value)
+            response = self.app.get("/")
+        finally:
+            web.poller.snapshot = snapshot
+
         self.assertEqual(200, response.status_code)
-        self.assertEqual(1, len(web._request_history[key]))
-        self.assertEqual(200.0, web._request_history[key][0])
+        self.assertIn(b"12.35", response.data)
+        mock_get_api_data.assert_not_called()
+        mock_get_summary_data.assert_not_called()
+        # Formatting happens on a copy, shared snapshot data stays untouched
+        self.assertEqual(12.345, year_summary['rainfall'])
+
+    def test_home_page_is_rendered_once_per_snapshot_version(self):
+        """Cached page per snapshot version, revalidated with ETag / Last-Modified."""
+        data = _snapshot_data()
+        snapshot = web.poller.snapshot
+        try:
+            for name, value in data.items():
+                web.poller.publish(name, value)
+            with patch("src.web._render_home", wraps=web._render_home) as mock_render:
+                first = self.app.get("/")
+                second = self.app.get("/home")
+                not_modified = self.app.get("/", headers={"If-None-Match": first.headers["ETag"]})
+                not_modified_since = self.app.get("/", headers={"If-Modified-Since": first.headers["Last-Modified"]})
+                self.assertEqual(1, mock_render.call_count)
+
+                web.poller.publish("summary", (data["summary"][0], dict(data["summary"][1], rainfall=2.0)))
+                changed = self.app.get("/", headers={"If-None-Match": first.headers["ETag"]})
+                self.assertEqual(2, mock_render.call_count)
+        finally:
+            web.poller.snapshot = snapshot
+
+        self.assertEqual(200, first.status_code)
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(first.headers["ETag"], second.headers["ETag"])
+        self.assertIn("no-cache", first.headers["Cache-Control"])
+        self.assertEqual(304, not_modified.status_code)
+        self.assertEqual(b"", not_modified.data)
+        self.assertEqual(304, not_modified_since.status_code)
+        self.assertEqual(200, changed.status_code)
+        self.assertNotEqual(first.headers["ETag"], changed.headers["ETag"])
+        self.assertIn(b"2.00", changed.data)
+
+    def test_home_page_is_compressed_once_per_version(self):
+        """gzip is negotiated with Accept-Encoding and kept with the cached page."""
+        data = _snapshot_data()
+        snapshot = web.poller.snapshot
+        try:
+            for name, value in data.items():
+                web.poller.publish(name, value)
+            plain = self.app.get("/")
+            with patch("src.page_cache.compress", wraps=compress) as mock_compress:
+                first = self.app.get("/", headers={"Accept-Encoding": "gzip"})
+                second = self.app.get("/", headers={"Accept-Encoding": "gzip"})
+                revalidated = self.app.get("/", headers={"Accept-Encoding": "gzip",
+                                                         "If-None-Match": first.headers["ETag"]})
+        finally:
+            web.poller.snapshot = snapshot
+
+        mock_compress.assert_called_once()
+        self.assertEqual("gzip", first.headers["Content-Encoding"])
+        self.assertIn("Accept-Encoding", first.headers["Vary"])
+        self.assertEqual(plain.data, gzip.decompress(first.data))
+        self.assertEqual(first.data, second.data)
+        self.assertNotEqual(plain.headers["ETag"], first.headers["ETag"])
+        self.assertEqual(304, revalidated.status_code)
+
+    @patch("src.web.get_summary_data")
+    @patch("src.clients.get_api_data")
+    def test_home_renders_placeholders_for_failed_sources(self, mock_get_api_data, mock_get_summary_data):
+        """Sources that fail are shown as '-' and the rest of the page still renders."""
+        def side_effect_get_api_data(url, **kwargs):
+            if 'ecowitt' in url:
+                raise KeyError("data")
+            if 'observations/current' in url:
+                return {'observations': [{'metric': {'elev': 1200}}]}
+            return {}
+
+        mock_get_api_data.side_effect = side_effect_get_api_data
+        mock_get_summary_data.return_value = {}
+
+        response = self.app.get("/")
+        self.assertEqual(200, response.status_code)
+        self.assertIn(b'title="Current Temp.">- -</td>', response.data)
+        self.assertIn(b'title="High UV">- UVI</td>', response.data)
+        self.assertIn(b'(1200m)', response.data)
+
+    @patch("src.web.get_summary_data")
+    @patch("src.clients.get_api_data")
+    def test_home_all_sources_missing(self, mock_get_api_data, mock_get_summary_data):
+        mock_get_api_data.return_value = {}
+        mock_get_summary_data.return_value = {}
+
+        response = self.app.get("/")
+        self.assertEqual(500, response.status_code)
+        self.assertIn(b"Website under maintenance", response.data)
+
+    @patch("src.web.get_summary_data")
+    @patch("src.clients.get_api_data")
+    def test_get_page_data_respects_budget(self, mock_get_api_data, mock_get_summary_data):
+        """A slow source is left out when the budget runs out and is not queued twice."""
+        release = threading.Event()
+
+        def side_effect_get_api_data(url, **kwargs):
+            if 'ecowitt' in url:
+                release.wait(5)
+            return {'observations': [{}]}
+
+        mock_get_api_data.side_effect = side_effect_get_api_data
+        mock_get_summary_data.return_value = ({}, {})
+        try:
+            started = time.monotonic()
+            first = web.get_page_data(budget=0.2)
+            second = web.get_page_data(budget=0.05)
+            elapsed = time.monotonic() - started
+        finally:
+            release.set()
+
+        self.assertLess(elapsed, 2)
+        self.assertEqual({"weather_current", "weather_day", "summary"}, set(first))
+        self.assertNotIn("weather_data", second)
+        ecowitt_calls = [call for call in mock_get_api_data.call_args_list if 'ecowitt' in call.args[0]]
+        self.assertEqual(1, len(ecowitt_calls))
+
+    @patch("src.web.get_summary_data")
+    @patch("src.clients.get_api_data")
+    def test_get_page_data_skips_failed_sources(self, mock_get_api_data, mock_get_summary_data):
+        """A source that failed is not fetched again until SOURCE_RETRY_SECONDS pass."""
+        def side_effect_get_api_data(url, **kwargs):
+            if 'ecowitt' in url:
+                raise KeyError("data")
+            return {'observations': [{}]}
+
+        mock_get_api_data.side_effect = side_effect_get_api_data
+        mock_get_summary_data.return_value = ({}, {})
+
+        first = web.get_page_data(budget=1)
+        second = web.get_page_data(budget=1)
+        with patch("src.web.monotonic", return_value=time.monotonic() + web.SOURCE_RETRY_SECONDS + 1):
+            web.get_page_data(budget=1)
+
+        self.assertNotIn("weather_data", first)
+        self.assertEqual({"weather_current", "weather_day", "summary"}, set(second))
+        ecowitt_calls = [call for call in mock_get_api_data.call_args_list if 'ecowitt' in call.args[0]]
+        self.assertEqual(2, len(ecowitt_calls))
+
+    def test_section_placeholder(self):
+        data = {"weather_current": {"observations": []}}
+        placeholder = web._section(data, "weather_current", "observations", 0)
+        self.assertIs(web.PLACEHOLDER, placeholder)
+        self.assertEqual("-", str(placeholder.metric["temp"]))
+        self.assertFalse(placeholder)
+        self.assertEqual({"observations": []}, web._section(data, "weather_current"))
+
+    def test_page_sources_registered_in_poller(self):
+        self.assertEqual(tuple(web._PAGE_SOURCES), web.poller.sources)
+        self.assertEqual(tuple(web._PAGE_SOURCES), tuple(web._POLL_SOURCES))
 
-    def test_transform_sun_time_missing_results_raises_key_error(self):
-        with self.assertRaises(KeyError):
-            web.transform_sun_time({}, "20260101")
+    @patch("src.clients.get_api_data", return_value={"observations": [{}]})
+    def test_poll_sources_bypass_api_cache(self, mock_get_api_data):
+        """A poll always calls the API, a cached answer would be one interval old."""
+        for name in ("weather_current", "weather_day", "weather_data"):
+            web._POLL_SOURCES[name]()
+        self.assertEqual([False] * 3, [call.kwargs["use_cache"] for call in mock_get_api_data.call_args_list])
 
-    def test_transform_sun_time_missing_sunrise_or_sunset_raises_key_error(self):
-        with self.assertRaises(KeyError):
-            web.transform_sun_time({"results": {"sunrise": "7:00:00 AM"}}, "20260101")
+    def test_get_sun_data(self):
+        data = web.get_sun_data("20240621")
+        self.assertEqual("06:45", data["results"]["sunrise"][:5])
+        self.assertEqual("21:51", data["results"]["sunset"][:5])
 
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file